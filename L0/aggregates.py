@@ -0,0 +1,194 @@
+import logging
+from typing import Iterable, Optional, Set, Tuple
+from datetime import date
+from config import Config
+from db import json_agg_objects, using_duckdb
+from L0 import duckdb_storage
+
+logger = logging.getLogger(__name__)
+
+Bucket = Tuple[str, date]
+
+# One rain episode in the rain_episodes JSON lists
+EPISODE_FIELDS = "'start', episode_start, 'end', episode_end, 'total_rain', ROUND(episode_rain::numeric, 2)"
+
+def create_aggregates_table(cur):
+    """Create daily_weather_aggregates, backfilling it from existing forecasts"""
+    if using_duckdb():
+        duckdb_storage.create_aggregates_table(cur)
+    else:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS daily_weather_aggregates (
+                city VARCHAR(50) NOT NULL,
+                forecast_date DATE NOT NULL,
+                avg_temp FLOAT NOT NULL,
+                min_temp FLOAT NOT NULL,
+                max_temp FLOAT NOT NULL,
+                total_precip FLOAT NOT NULL,
+                max_precip FLOAT NOT NULL,
+                avg_wind FLOAT NOT NULL,
+                hour_count INTEGER NOT NULL,
+                rain_start TIMESTAMP,
+                rain_end TIMESTAMP,
+                rain_avg_temp FLOAT,
+                rain_avg_wind FLOAT,
+                rain_episodes JSONB,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (city, forecast_date)
+            );
+        """)
+    cur.execute("""
+        SELECT NOT EXISTS (SELECT 1 FROM daily_weather_aggregates)
+        AND EXISTS (SELECT 1 FROM weather_forecasts);
+    """)
+    if cur.fetchone()[0]:
+        logger.info("Backfilling daily_weather_aggregates")
+        refresh_aggregates(cur)
+
+def refresh_aggregates(cur, buckets: Optional[Iterable[Bucket]] = None) -> int:
+    """
+    Recompute the given (city, date) buckets from weather_forecasts.
+
+    Passing None rebuilds every bucket. Buckets whose hourly rows are all
+    gone are deleted. Returns the number of buckets written.
+    """
+    if buckets is None:
+        source = "weather_forecasts"
+        params = ()
+    else:
+        buckets = set(buckets)
+        if not buckets:
+            return 0
+        if using_duckdb():
+            # Binding long arrays is slow in DuckDB; scan staged columns instead
+            duckdb_storage.stage_buckets(cur, buckets)
+            targets, params = "aggregate_buckets", ()
+        else:
+            cities, dates = zip(*buckets)
+            targets = "unnest(%s::text[], %s::date[])"
+            params = (list(cities), list(dates))
+        source = f"""(
+            SELECT f.*
+            FROM {targets} AS t(city, forecast_date)
+            JOIN weather_forecasts f
+                ON f.city = t.city
+                AND f.timestamp >= t.forecast_date
+                AND f.timestamp < t.forecast_date + 1
+        )"""
+        cur.execute(f"""
+            DELETE FROM daily_weather_aggregates a
+            USING {targets} AS t(city, forecast_date)
+            WHERE a.city = t.city
+            AND a.forecast_date = t.forecast_date
+            AND NOT EXISTS (
+                SELECT 1 FROM weather_forecasts f
+                WHERE f.city = t.city
+                AND f.timestamp >= t.forecast_date
+                AND f.timestamp < t.forecast_date + 1
+            );
+        """, params)
+
+    cur.execute(f"""
+        WITH hours AS (
+            SELECT
+                city,
+                DATE(timestamp) AS forecast_date,
+                timestamp,
+                temperature,
+                precipitation,
+                windspeed
+            FROM {source} h
+        ),
+        episodes AS (
+            SELECT
+                city,
+                forecast_date,
+                {json_agg_objects(EPISODE_FIELDS, "episode_start")} AS rain_episodes
+            FROM (
+                SELECT
+                    city,
+                    forecast_date,
+                    MIN(timestamp) AS episode_start,
+                    MAX(timestamp) AS episode_end,
+                    SUM(precipitation) AS episode_rain
+                FROM (
+                    SELECT
+                        *,
+                        timestamp - ROW_NUMBER() OVER (
+                            PARTITION BY city, forecast_date ORDER BY timestamp
+                        ) * INTERVAL '1 hour' AS episode
+                    FROM hours
+                    WHERE precipitation > 0
+                ) rainy
+                GROUP BY city, forecast_date, episode
+            ) e
+            GROUP BY city, forecast_date
+        ),
+        daily AS (
+            SELECT
+                city,
+                forecast_date,
+                AVG(temperature) AS avg_temp,
+                MIN(temperature) AS min_temp,
+                MAX(temperature) AS max_temp,
+                SUM(precipitation) AS total_precip,
+                MAX(precipitation) AS max_precip,
+                AVG(windspeed) AS avg_wind,
+                COUNT(*) AS hour_count,
+                MIN(timestamp) FILTER (WHERE precipitation > 0) AS rain_start,
+                MAX(timestamp) FILTER (WHERE precipitation > 0) AS rain_end,
+                AVG(temperature) FILTER (WHERE precipitation > 0) AS rain_avg_temp,
+                AVG(windspeed) FILTER (WHERE precipitation > 0) AS rain_avg_wind
+            FROM hours
+            GROUP BY city, forecast_date
+        )
+        INSERT INTO daily_weather_aggregates (
+            city, forecast_date, avg_temp, min_temp, max_temp, total_precip,
+            max_precip, avg_wind, hour_count, rain_start, rain_end,
+            rain_avg_temp, rain_avg_wind, rain_episodes
+        )
+        SELECT d.*, e.rain_episodes
+        FROM daily d
+        LEFT JOIN episodes e USING (city, forecast_date)
+        ON CONFLICT (city, forecast_date) DO UPDATE SET
+            avg_temp = EXCLUDED.avg_temp,
+            min_temp = EXCLUDED.min_temp,
+            max_temp = EXCLUDED.max_temp,
+            total_precip = EXCLUDED.total_precip,
+            max_precip = EXCLUDED.max_precip,
+            avg_wind = EXCLUDED.avg_wind,
+            hour_count = EXCLUDED.hour_count,
+            rain_start = EXCLUDED.rain_start,
+            rain_end = EXCLUDED.rain_end,
+            rain_avg_temp = EXCLUDED.rain_avg_temp,
+            rain_avg_wind = EXCLUDED.rain_avg_wind,
+            rain_episodes = EXCLUDED.rain_episodes,
+            updated_at = now();
+    """, params)
+    return cur.rowcount
+
+def buckets_of(rows: Iterable[Tuple]) -> Set[Bucket]:
+    """(city, date) buckets touched by (city, timestamp, ...) rows"""
+    return {(row[0], row[1].date()) for row in rows}
+
+def remove_expired_aggregates(cur, retention_days: int = Config.RETENTION_DAYS) -> int:
+    """
+    Delete aggregates of days before the retention window.
+
+    Retention cuts the boundary day at the current time of day, so once
+    its earliest hours are deleted that day's aggregates are recomputed
+    from the hours left. Returns the number of aggregates deleted.
+    """
+    cur.execute(
+        "SELECT (LOCALTIMESTAMP - %s * INTERVAL '1 day')::date", (retention_days,)
+    )
+    boundary = cur.fetchone()[0]
+    cur.execute(
+        "DELETE FROM daily_weather_aggregates WHERE forecast_date < %s", (boundary,)
+    )
+    removed = cur.rowcount
+    cur.execute(
+        "SELECT city FROM daily_weather_aggregates WHERE forecast_date = %s", (boundary,)
+    )
+    refresh_aggregates(cur, {(city, boundary) for (city,) in cur.fetchall()})
+    return removed
@@ -0,0 +1,202 @@
+import logging
+import os
+from datetime import date, datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pyarrow import fs
+from config import Config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# One zstd-compressed file per forecast day and city:
+# <root>/date=2026-09-01/city=Munich/forecasts.parquet
+FILE_NAME = "forecasts.parquet"
+
+SCHEMA = pa.schema([
+    ("timestamp", pa.timestamp("us")),
+    ("temperature", pa.float64()),
+    ("precipitation", pa.float64()),
+    ("windspeed", pa.float64()),
+    ("created_at", pa.timestamp("us"))
+])
+
+PARTITIONING = ds.partitioning(
+    pa.schema([("date", pa.date32()), ("city", pa.string())]),
+    flavor="hive"
+)
+
+Group = Tuple[date, str]
+
+def group_path(root: str, day: date, city: str) -> str:
+    # Hive partitioning URL-decodes directory names, so any city name round-trips
+    return os.path.join(root, f"date={day.isoformat()}", f"city={quote(city, safe='')}", FILE_NAME)
+
+def write_group(root: str, day: date, city: str, rows: List[Tuple]) -> int:
+    """
+    Write one day of one city's (timestamp, temperature, precipitation,
+    windspeed, created_at) rows, merging with any file already there.
+
+    Rows already archived for the same timestamp are replaced, so
+    exporting the same rows twice, for example after a rolled back
+    cleaning run, leaves a single copy.
+    """
+    table = pa.Table.from_pylist(
+        [dict(zip(SCHEMA.names, row)) for row in rows], schema=SCHEMA
+    )
+    path = group_path(root, day, city)
+    if os.path.exists(path):
+        existing = pq.read_table(path, schema=SCHEMA)
+        kept = existing.filter(pc.invert(pc.is_in(existing["timestamp"], table["timestamp"])))
+        table = pa.concat_tables([kept, table])
+    table = table.sort_by("timestamp")
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Dot-prefixed names are skipped by dataset discovery
+    tmp_path = os.path.join(os.path.dirname(path), f".{FILE_NAME}.{os.getpid()}.tmp")
+    pq.write_table(
+        table, tmp_path,
+        compression=Config.ARCHIVE_COMPRESSION,
+        row_group_size=Config.ARCHIVE_ROW_GROUP_SIZE
+    )
+    os.replace(tmp_path, path)
+    return len(rows)
+
+def archive_expired(cur, root: Optional[str] = None, retention_days: int = Config.RETENTION_DAYS) -> int:
+    """
+    Export forecasts older than the retention window before they are deleted.
+
+    Runs inside the cleaning transaction, so it sees exactly the rows the
+    following delete removes; LOCALTIMESTAMP is fixed for the whole
+    transaction. Rows are streamed through a server-side cursor ordered
+    by day and city and written one group at a time.
+    """
+    root = root or Config.ARCHIVE_PATH
+    archived = files = 0
+    with metrics.span("archive_export"), cur.connection.cursor(name="archive_expired") as source:
+        source.itersize = Config.ARCHIVE_FETCH_ROWS
+        source.execute("""
+            SELECT DATE(timestamp), city, timestamp, temperature, precipitation, windspeed, created_at
+            FROM weather_forecasts
+            WHERE timestamp < LOCALTIMESTAMP - make_interval(days => %s)
+            ORDER BY DATE(timestamp), city, timestamp;
+        """, (retention_days,))
+
+        group: Optional[Group] = None
+        rows: List[Tuple] = []
+        for row in source:
+            if (row[0], row[1]) != group:
+                if rows:
+                    archived += write_group(root, *group, rows)
+                    files += 1
+                group, rows = (row[0], row[1]), []
+            rows.append(row[2:])
+        if rows:
+            archived += write_group(root, *group, rows)
+            files += 1
+
+    metrics.increment("forecast_rows_archived", archived)
+    if archived:
+        logger.info(f"Archived {archived} expired forecast rows to {files} files under {root}")
+    return archived
+
+class ForecastArchive:
+    """
+    Read side of the archive.
+
+    Files are memory-mapped, so repeated long-range scans are served from
+    the page cache instead of Postgres. Filters on city and time range
+    prune partition directories and Parquet row groups before decoding.
+    """
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = root or Config.ARCHIVE_PATH
+        if not self.root:
+            raise ValueError("No archive path configured; set ARCHIVE_PATH")
+
+    def dataset(self) -> ds.Dataset:
+        # Discovered per call so newly archived days are picked up
+        return ds.dataset(
+            self.root,
+            format="parquet",
+            partitioning=PARTITIONING,
+            filesystem=fs.LocalFileSystem(use_mmap=True)
+        )
+
+    @staticmethod
+    def filter(
+        cities: Optional[Iterable[str]] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None
+    ) -> Optional[ds.Expression]:
+        """Pushdown expression for cities and the [start, end) time range"""
+        conditions = []
+        if cities is not None:
+            conditions.append(ds.field("city").isin(list(cities)))
+        if start is not None:
+            # The date condition prunes directories, the timestamp one row groups
+            conditions.append(ds.field("date") >= start.date())
+            conditions.append(ds.field("timestamp") >= pa.scalar(start, pa.timestamp("us")))
+        if end is not None:
+            conditions.append(ds.field("date") <= end.date())
+            conditions.append(ds.field("timestamp") < pa.scalar(end, pa.timestamp("us")))
+        expression = None
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+        return expression
+
+    def read(
+        self,
+        cities: Optional[Iterable[str]] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        columns: Optional[List[str]] = None
+    ) -> pa.Table:
+        """Archived rows matching the filters as an Arrow table"""
+        with metrics.span("archive_read"):
+            return self.dataset().to_table(
+                columns=columns, filter=self.filter(cities, start, end)
+            )
+
+    def batches(
+        self,
+        cities: Optional[Iterable[str]] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        columns: Optional[List[str]] = None
+    ) -> Iterator[pa.RecordBatch]:
+        """Stream matching rows batch by batch for scans larger than memory"""
+        yield from self.dataset().to_batches(
+            columns=columns, filter=self.filter(cities, start, end)
+        )
+
+    def daily_stats(
+        self,
+        cities: Optional[Iterable[str]] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None
+    ) -> Dict[Group, dict]:
+        """Per (day, city) count, temperature range and precipitation total"""
+        table = self.read(
+            cities, start, end,
+            columns=["date", "city", "temperature", "precipitation"]
+        )
+        grouped = table.group_by(["date", "city"]).aggregate([
+            ("temperature", "count"),
+            ("temperature", "min"),
+            ("temperature", "max"),
+            ("precipitation", "sum")
+        ])
+        return {
+            (row["date"], row["city"]): {
+                "hours": row["temperature_count"],
+                "min_temperature": row["temperature_min"],
+                "max_temperature": row["temperature_max"],
+                "total_precipitation": row["precipitation_sum"]
+            }
+            for row in grouped.to_pylist()
+        }
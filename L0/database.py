@@ -1,67 +1,463 @@
-import psycopg2
+import csv
+import hashlib
+import io
+from dataclasses import dataclass
 from psycopg2.extras import execute_values
-from typing import List
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from datetime import date
 import logging
-from L0.models import WeatherForecast
+import time
+from L0 import aggregates, duckdb_storage, history, partitions
+from L0.models import ForecastBatch, ForecastStore, WeatherForecast
 from config import Config
+from db import acquire, release, using_duckdb
+import metrics
 
 logger = logging.getLogger(__name__)
 
+FORECAST_COLUMNS = "city, timestamp, temperature, precipitation, windspeed"
+
+class CsvRowStream(io.TextIOBase):
+    """File-like object that encodes rows as CSV on demand for COPY FROM STDIN"""
+
+    def __init__(self, rows: Iterable[Tuple]):
+        self._rows = iter(rows)
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, lineterminator="\n")
+        self._pending = ""
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self._pending) < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            self._writer.writerow(row)
+            self._pending += self._buffer.getvalue()
+            self._buffer.seek(0)
+            self._buffer.truncate()
+
+        if size < 0:
+            size = len(self._pending)
+        data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+
+def upsert_conflict_clause(change_aware: Optional[bool] = None) -> str:
+    """ON CONFLICT clause for weather_forecasts upserts"""
+    if change_aware is None:
+        change_aware = Config.CHANGE_AWARE_UPSERT
+    clause = """
+                ON CONFLICT (city, timestamp) DO UPDATE SET
+                    temperature = EXCLUDED.temperature,
+                    precipitation = EXCLUDED.precipitation,
+                    windspeed = EXCLUDED.windspeed,
+                    created_at = now()"""
+    if change_aware:
+        # Leave identical rows alone: no new tuple version, WAL or index churn
+        clause += """
+                WHERE (
+                    weather_forecasts.temperature,
+                    weather_forecasts.precipitation,
+                    weather_forecasts.windspeed
+                ) IS DISTINCT FROM (
+                    EXCLUDED.temperature,
+                    EXCLUDED.precipitation,
+                    EXCLUDED.windspeed
+                )"""
+    return clause
+
+def merge_counts(results: List[Tuple]) -> Tuple[int, int]:
+    """(inserted, updated) from (input rows, pre-existing rows, rows written) results"""
+    inserted = updated = 0
+    for total, existing, written in results:
+        inserted += total - existing
+        updated += written - (total - existing)
+    return inserted, updated
+
+def city_hashes(rows: Iterable[Tuple]) -> Dict[str, str]:
+    """Stable digest of each city's forecast rows, in one pass over `rows`"""
+    digests = {}
+    for city, timestamp, temperature, precipitation, windspeed in rows:
+        digest = digests.get(city)
+        if digest is None:
+            digest = digests[city] = hashlib.sha256()
+        digest.update(
+            f"{timestamp.isoformat()},{temperature!r},{precipitation!r},{windspeed!r}\n".encode()
+        )
+    return {city: digest.hexdigest() for city, digest in digests.items()}
+
+def create_hashes_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS forecast_content_hashes (
+            city VARCHAR(50) PRIMARY KEY,
+            content_hash CHAR(64) NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+
+def forget_hashes(cur, cities: Iterable[str]) -> int:
+    """
+    Drop the stored content hashes of cities that lost rows.
+
+    Otherwise an unchanged payload would be skipped by
+    SKIP_UNCHANGED_CITIES and the removed rows never written back.
+    """
+    cities = list(cities)
+    if not cities:
+        return 0
+    create_hashes_table(cur)
+    cur.execute("DELETE FROM forecast_content_hashes WHERE city = ANY(%s);", (cities,))
+    return cur.rowcount
+
+@dataclass
+class UpsertStats:
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+
 class Database:
-    def __init__(self):
-        self.conn = psycopg2.connect(Config.DATABASE_URL)
+    def __init__(self, run_key: Optional[str] = None):
+        self.conn = acquire()
+        self.stats = UpsertStats()
+        self._partition_days: Set[date] = set()
+        # forecast_runs id for this Database's writes, created (or, for a
+        # sharded run's `run_key`, joined) with the first upsert
+        self.run_key = run_key
+        self.run_id: Optional[int] = None
         self._create_tables()
 
     def _create_tables(self):
         with self.conn.cursor() as cur:
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS weather_forecasts (
-                    id SERIAL PRIMARY KEY,
-                    city VARCHAR(50) NOT NULL,
-                    timestamp TIMESTAMP NOT NULL,
-                    temperature FLOAT NOT NULL,
-                    precipitation FLOAT NOT NULL,
-                    windspeed FLOAT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(city, timestamp)
-                )
-            """)
+            create_hashes_table(cur)
+
+            if using_duckdb():
+                duckdb_storage.create_forecasts_table(cur)
+            elif Config.PARTITIONED_STORAGE:
+                if not partitions.table_exists(cur):
+                    partitions.create_partitioned_table(cur)
+                elif not partitions.is_partitioned(cur):
+                    partitions.migrate_to_partitioned(cur)
+                partitions.ensure_upcoming_partitions(cur)
+            else:
+                self._create_forecasts_table(cur)
+
+            if Config.DAILY_AGGREGATES:
+                aggregates.create_aggregates_table(cur)
+            if Config.FORECAST_HISTORY:
+                history.create_history_tables(cur)
             self.conn.commit()
 
+    def _create_forecasts_table(self, cur):
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS weather_forecasts (
+                id SERIAL PRIMARY KEY,
+                city VARCHAR(50) NOT NULL,
+                timestamp TIMESTAMP NOT NULL,
+                temperature FLOAT NOT NULL,
+                precipitation FLOAT NOT NULL,
+                windspeed FLOAT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(city, timestamp)
+            );
+            CREATE INDEX IF NOT EXISTS idx_weather_forecasts_created_at
+                ON weather_forecasts (created_at);
+            CREATE INDEX IF NOT EXISTS idx_weather_forecasts_timestamp
+                ON weather_forecasts (timestamp);
+        """)
+
     def upsert_forecasts(self, forecasts: List[WeatherForecast]) -> int:
-        if not forecasts:
+        # Convert forecasts to tuples for batch insert
+        values = [(
+            f.city,
+            f.timestamp,
+            f.temperature,
+            f.precipitation,
+            f.windspeed
+        ) for f in forecasts]
+        return self.upsert_rows(values)
+
+    def upsert_batches(self, batches: List[ForecastBatch]) -> int:
+        """Upsert columnar batches without building WeatherForecast objects"""
+        values = []
+        for batch in batches:
+            values.extend(batch.to_rows())
+        return self.upsert_rows(values)
+
+    def upsert_store(self, store: ForecastStore, chunk_size: int = Config.STORE_WRITE_CHUNK_ROWS) -> int:
+        """
+        Upsert a ForecastStore, building row tuples one chunk at a time.
+
+        Each chunk is committed on its own, so peak memory stays near the
+        compact store plus one chunk of tuples. With SKIP_UNCHANGED_CITIES
+        every city is hashed over the whole store before chunking, since a
+        city's rows may span chunks; the new hashes are stored once all
+        chunks are written.
+        """
+        chunks = range(0, len(store), chunk_size)
+        if not Config.SKIP_UNCHANGED_CITIES:
+            written = 0
+            for start in chunks:
+                written += self.upsert_rows(store.to_rows(start, start + chunk_size))
+            return written
+
+        hashes = city_hashes(
+            row for start in chunks for row in store.to_rows(start, start + chunk_size)
+        )
+        with self.conn.cursor() as cur:
+            changed = set(self._changed_cities(cur, hashes))
+        self.conn.commit()
+
+        written = skipped = 0
+        for start in chunks:
+            rows = store.to_rows(start, start + chunk_size)
+            pending = [row for row in rows if row[0] in changed]
+            if pending:
+                self.upsert_rows(pending, skip_unchanged=False)
+            written += len(rows)
+            skipped += len(rows) - len(pending)
+        self.stats.unchanged += skipped
+        metrics.increment("forecast_rows_written", skipped, result="unchanged")
+
+        if changed:
+            with self.conn.cursor() as cur:
+                self._save_hashes(cur, {city: hashes[city] for city in changed})
+            self.conn.commit()
+        return written
+
+    def upsert_rows(
+        self,
+        values: List[Tuple],
+        bulk: Optional[bool] = None,
+        skip_unchanged: Optional[bool] = None
+    ) -> int:
+        """
+        Upsert (city, timestamp, temperature, precipitation, windspeed) tuples.
+
+        Batches of at least Config.COPY_MIN_ROWS rows (or bulk=True) go
+        through the COPY staging path, smaller ones through execute_values;
+        on DuckDB every batch is staged as NumPy columns. Inserted, updated
+        and unchanged counts accumulate in self.stats. `skip_unchanged`
+        (default: Config.SKIP_UNCHANGED_CITIES) drops cities whose rows
+        hash as last time; `values` must then hold whole cities.
+        """
+        if skip_unchanged is None:
+            skip_unchanged = Config.SKIP_UNCHANGED_CITIES
+        if not values:
             return 0
 
+        if Config.FORECAST_HISTORY and self.run_id is None:
+            # Committed on its own so failed chunks cannot roll the run back
+            with self.conn.cursor() as cur:
+                self.run_id = history.start_run(cur, self.run_key)
+            self.conn.commit()
+
+        start = time.perf_counter()
         with self.conn.cursor() as cur:
             try:
-                # Convert forecasts to tuples for batch insert
-                values = [(
-                    f.city,
-                    f.timestamp,
-                    f.temperature,
-                    f.precipitation,
-                    f.windspeed
-                ) for f in forecasts]
-
-                # Efficient batch upsert
-                execute_values(cur, """
-                    INSERT INTO weather_forecasts 
-                        (city, timestamp, temperature, precipitation, windspeed)
-                    VALUES %s
-                    ON CONFLICT (city, timestamp) DO UPDATE SET
-                        temperature = EXCLUDED.temperature,
-                        precipitation = EXCLUDED.precipitation,
-                        windspeed = EXCLUDED.windspeed,
-                        created_at = CURRENT_TIMESTAMP
-                    """, values, page_size=Config.BATCH_SIZE)
-                
+                pending = values
+                if skip_unchanged:
+                    pending = self._skip_unchanged_cities(cur, values)
+                self._ensure_partitions_for(cur, pending)
+
+                if not pending:
+                    inserted = updated = 0
+                elif using_duckdb():
+                    inserted, updated = self._duckdb_merge(cur, pending)
+                elif bulk or (bulk is None and len(pending) >= Config.COPY_MIN_ROWS):
+                    inserted, updated = self._bulk_merge(cur, pending)
+                    elapsed = time.perf_counter() - start
+                    logger.info(
+                        f"Bulk loaded {len(pending)} rows in {elapsed:.2f}s "
+                        f"({len(pending) / max(elapsed, 1e-9):.0f} rows/sec)"
+                    )
+                else:
+                    inserted, updated = self._merge_values(cur, pending)
+
+                if Config.DAILY_AGGREGATES and (inserted or updated):
+                    aggregates.refresh_aggregates(cur, aggregates.buckets_of(pending))
+
+                if Config.FORECAST_HISTORY:
+                    history.record_deltas(cur, self.run_id, pending)
+
                 self.conn.commit()
-                return len(forecasts)
 
             except Exception as e:
                 self.conn.rollback()
+                self._partition_days.clear()
                 logger.error(f"Database error: {e}")
                 raise
 
+        unchanged = len(values) - inserted - updated
+        self.stats.inserted += inserted
+        self.stats.updated += updated
+        self.stats.unchanged += unchanged
+        metrics.observe("db_upsert", time.perf_counter() - start)
+        metrics.increment("forecast_rows_written", inserted, result="inserted")
+        metrics.increment("forecast_rows_written", updated, result="updated")
+        metrics.increment("forecast_rows_written", unchanged, result="unchanged")
+        return len(values)
+
+    def bulk_load_rows(self, values: List[Tuple]) -> int:
+        """Upsert rows through the COPY staging path regardless of batch size"""
+        return self.upsert_rows(values, bulk=True)
+
+    def _merge_values(self, cur, values: List[Tuple]) -> Tuple[int, int]:
+        # Efficient batch upsert; each page reports its inserted/updated counts.
+        # All CTEs share one snapshot, so `existing` sees the rows before the merge.
+        pages = execute_values(cur, f"""
+            WITH input ({FORECAST_COLUMNS}) AS (
+                VALUES %s
+            ),
+            existing AS (
+                SELECT COUNT(*) AS n
+                FROM input i
+                JOIN weather_forecasts w
+                    ON w.city = i.city AND w.timestamp = i.timestamp
+            ),
+            merged AS (
+                INSERT INTO weather_forecasts 
+                    ({FORECAST_COLUMNS})
+                SELECT {FORECAST_COLUMNS} FROM input
+                {upsert_conflict_clause()}
+                RETURNING 1
+            )
+            SELECT (SELECT COUNT(*) FROM input), (SELECT n FROM existing), (SELECT COUNT(*) FROM merged)
+            """, values, page_size=Config.BATCH_SIZE, fetch=True)
+        return merge_counts(pages)
+
+    def _bulk_merge(self, cur, values: List[Tuple]) -> Tuple[int, int]:
+        """
+        Merge rows through COPY into a temporary staging table.
+
+        Rows are streamed as CSV into a session-local staging table, then
+        merged into weather_forecasts with a single INSERT ... SELECT ...
+        ON CONFLICT. Temporary tables skip WAL and the staging rows are
+        discarded on commit.
+        """
+        cur.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS weather_forecasts_staging (
+                city VARCHAR(50) NOT NULL,
+                timestamp TIMESTAMP NOT NULL,
+                temperature FLOAT NOT NULL,
+                precipitation FLOAT NOT NULL,
+                windspeed FLOAT NOT NULL
+            ) ON COMMIT DELETE ROWS
+        """)
+        cur.copy_expert(
+            f"COPY weather_forecasts_staging ({FORECAST_COLUMNS}) "
+            "FROM STDIN WITH (FORMAT csv)",
+            CsvRowStream(values)
+        )
+
+        # ON CONFLICT cannot touch the same row twice in one statement,
+        # so keep only the last staged value per (city, timestamp)
+        cur.execute(f"""
+            WITH input AS (
+                SELECT DISTINCT ON (city, timestamp) {FORECAST_COLUMNS}
+                FROM weather_forecasts_staging
+                ORDER BY city, timestamp, ctid DESC
+            ),
+            existing AS (
+                SELECT COUNT(*) AS n
+                FROM input i
+                JOIN weather_forecasts w
+                    ON w.city = i.city AND w.timestamp = i.timestamp
+            ),
+            merged AS (
+                INSERT INTO weather_forecasts ({FORECAST_COLUMNS})
+                SELECT {FORECAST_COLUMNS} FROM input
+                {upsert_conflict_clause()}
+                RETURNING 1
+            )
+            SELECT (SELECT COUNT(*) FROM input), (SELECT n FROM existing), (SELECT COUNT(*) FROM merged)
+        """)
+        return merge_counts(cur.fetchall())
+
+    def _duckdb_merge(self, cur, values: List[Tuple]) -> Tuple[int, int]:
+        """
+        Merge rows into the embedded DuckDB table.
+
+        Rows are loaded column-wise into a temporary staging table, then
+        merged with one INSERT ... SELECT ... ON CONFLICT keeping the last
+        staged value per (city, timestamp). DuckDB reports only the rows
+        the merge actually wrote.
+        """
+        duckdb_storage.stage_forecasts(cur, values)
+        cur.execute("""
+            SELECT COUNT(*), COUNT(w.city)
+            FROM (SELECT DISTINCT city, timestamp FROM weather_forecasts_staging) i
+            LEFT JOIN weather_forecasts w
+                ON w.city = i.city AND w.timestamp = i.timestamp
+        """)
+        total, existing = cur.fetchone()
+        cur.execute(f"""
+            INSERT INTO weather_forecasts ({FORECAST_COLUMNS})
+            SELECT {FORECAST_COLUMNS} FROM weather_forecasts_staging
+            QUALIFY ROW_NUMBER() OVER (PARTITION BY city, timestamp ORDER BY seq DESC) = 1
+            {upsert_conflict_clause()}
+        """)
+        return merge_counts([(total, existing, cur.rowcount)])
+
+    def _skip_unchanged_cities(self, cur, values: List[Tuple]) -> List[Tuple]:
+        """
+        Drop cities whose payload hash matches the one stored last time.
+
+        The stored hashes are updated in the caller's transaction, so they
+        only advance when the rows they describe are committed.
+        """
+        hashes = city_hashes(values)
+        changed = set(self._changed_cities(cur, hashes))
+        self._save_hashes(cur, {city: hashes[city] for city in changed})
+        return [row for row in values if row[0] in changed]
+
+    @staticmethod
+    def _changed_cities(cur, hashes: Dict[str, str]) -> List[str]:
+        """Cities whose hash differs from the stored one"""
+        cur.execute("""
+            SELECT city, content_hash FROM forecast_content_hashes
+            WHERE city = ANY(%s);
+        """, (list(hashes),))
+        stored = dict(cur.fetchall())
+
+        changed = [city for city, digest in hashes.items() if stored.get(city) != digest]
+        if len(changed) < len(hashes):
+            logger.info(f"Skipping {len(hashes) - len(changed)} cities with unchanged forecasts")
+        return changed
+
+    @staticmethod
+    def _save_hashes(cur, hashes: Dict[str, str]):
+        if hashes:
+            execute_values(cur, """
+                INSERT INTO forecast_content_hashes (city, content_hash)
+                VALUES %s
+                ON CONFLICT (city) DO UPDATE SET
+                    content_hash = EXCLUDED.content_hash,
+                    updated_at = CURRENT_TIMESTAMP
+            """, list(hashes.items()))
+
+    def _ensure_partitions_for(self, cur, values: List[Tuple]):
+        """Create daily partitions for the rows' days before writing them"""
+        if not Config.PARTITIONED_STORAGE:
+            return
+        days = {row[1].date() for row in values} - self._partition_days
+        if days:
+            partitions.ensure_partitions(cur, days)
+            self._partition_days |= days
+
     def close(self):
-        self.conn.close() 
+        # A sharded run is shared by many Databases; its last worker finishes it
+        if self.conn is not None and self.run_id is not None and self.run_key is None:
+            try:
+                with self.conn.cursor() as cur:
+                    history.finish_run(cur, self.run_id)
+                self.conn.commit()
+            except Exception as e:
+                self.conn.rollback()
+                logger.error(f"Could not mark forecast run {self.run_id} finished: {e}")
+            self.run_id = None
+        if self.conn is not None:
+            release(self.conn)
+            self.conn = None
+
@@ -0,0 +1,144 @@
+import logging
+from typing import Dict, Iterable, Sequence
+
+logger = logging.getLogger(__name__)
+
+# DuckDB versions of the Postgres tables. FLOAT and DECIMAL are single
+# precision and DECIMAL(18,3) in DuckDB, so measurements are DOUBLE; ids come
+# from sequences instead of SERIAL and JSON replaces JSONB. Only unique keys
+# are indexed: per-block min/max zone maps already prune scans on timestamp
+# and created_at, and an index on created_at would turn every upsert into a
+# delete and insert. Shared ON CONFLICT ... DO UPDATE clauses set timestamps
+# with now(): DuckDB binds a bare CURRENT_TIMESTAMP there as a column name.
+
+def create_forecasts_table(cur):
+    cur.execute("""
+        CREATE SEQUENCE IF NOT EXISTS weather_forecasts_id_seq;
+        CREATE TABLE IF NOT EXISTS weather_forecasts (
+            id BIGINT DEFAULT nextval('weather_forecasts_id_seq'),
+            city VARCHAR(50) NOT NULL,
+            timestamp TIMESTAMP NOT NULL,
+            temperature DOUBLE NOT NULL,
+            precipitation DOUBLE NOT NULL,
+            windspeed DOUBLE NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(city, timestamp)
+        );
+    """)
+
+def create_aggregates_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS daily_weather_aggregates (
+            city VARCHAR(50) NOT NULL,
+            forecast_date DATE NOT NULL,
+            avg_temp DOUBLE NOT NULL,
+            min_temp DOUBLE NOT NULL,
+            max_temp DOUBLE NOT NULL,
+            total_precip DOUBLE NOT NULL,
+            max_precip DOUBLE NOT NULL,
+            avg_wind DOUBLE NOT NULL,
+            hour_count INTEGER NOT NULL,
+            rain_start TIMESTAMP,
+            rain_end TIMESTAMP,
+            rain_avg_temp DOUBLE,
+            rain_avg_wind DOUBLE,
+            rain_episodes JSON,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (city, forecast_date)
+        );
+    """)
+
+def create_rain_forecasts_table(cur):
+    cur.execute("""
+        CREATE SEQUENCE IF NOT EXISTS daily_rain_forecasts_id_seq;
+        CREATE TABLE IF NOT EXISTS daily_rain_forecasts (
+            id INTEGER DEFAULT nextval('daily_rain_forecasts_id_seq'),
+            city VARCHAR(100) NOT NULL,
+            forecast_date DATE NOT NULL,
+            rain_start TIMESTAMP NOT NULL,
+            rain_end TIMESTAMP NOT NULL,
+            total_rain DOUBLE NOT NULL,
+            max_rain_intensity DOUBLE NOT NULL,
+            avg_temperature DOUBLE NOT NULL,
+            avg_wind DOUBLE NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            rain_episodes JSON,
+            UNIQUE(city, forecast_date)
+        );
+    """)
+
+def create_summary_table(cur):
+    cur.execute("""
+        CREATE SEQUENCE IF NOT EXISTS weather_summaries_id_seq;
+        CREATE TABLE IF NOT EXISTS weather_summaries (
+            id INTEGER DEFAULT nextval('weather_summaries_id_seq'),
+            city VARCHAR(50) NOT NULL,
+            summary_date DATE NOT NULL,
+            summary_text TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(city, summary_date)
+        );
+    """)
+
+def stage_columns(cur, table: str, columns: Dict[str, Sequence]):
+    """
+    Replace the rows of temporary table `table` with NumPy columns.
+
+    DuckDB scans the registered arrays in place, which is orders of
+    magnitude faster than binding rows or lists as parameters. Strings
+    should be fixed-width unicode arrays: object arrays are converted
+    value by value.
+    """
+    duck = cur.connection.duck
+    duck.register("staged_columns", columns)
+    try:
+        cur.execute(f"DELETE FROM {table}")
+        cur.execute(f"INSERT INTO {table} BY NAME SELECT * FROM staged_columns")
+    finally:
+        duck.unregister("staged_columns")
+
+def stage_forecasts(cur, rows) -> int:
+    """
+    Load (city, timestamp, temperature, precipitation, windspeed) tuples
+    into weather_forecasts_staging, numbered in input order.
+    """
+    # Imported here so Postgres runs of cleaning and summaries never load NumPy
+    import numpy as np
+
+    cities, timestamps, temperatures, precipitations, windspeeds = zip(*rows)
+    cur.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS weather_forecasts_staging (
+            seq BIGINT NOT NULL,
+            city VARCHAR(50) NOT NULL,
+            timestamp TIMESTAMP NOT NULL,
+            temperature DOUBLE NOT NULL,
+            precipitation DOUBLE NOT NULL,
+            windspeed DOUBLE NOT NULL
+        );
+    """)
+    stage_columns(cur, "weather_forecasts_staging", {
+        "seq": np.arange(len(cities)),
+        "city": np.array(cities),
+        "timestamp": np.array(timestamps, dtype="datetime64[us]"),
+        "temperature": np.array(temperatures, dtype=np.float64),
+        "precipitation": np.array(precipitations, dtype=np.float64),
+        "windspeed": np.array(windspeeds, dtype=np.float64)
+    })
+    return len(cities)
+
+def stage_buckets(cur, buckets: Iterable):
+    """Load (city, date) buckets into aggregate_buckets"""
+    import numpy as np
+
+    cities, dates = zip(*buckets)
+    cur.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS aggregate_buckets (
+            city VARCHAR(50) NOT NULL,
+            forecast_date DATE NOT NULL
+        );
+    """)
+    stage_columns(cur, "aggregate_buckets", {
+        "city": np.array(cities),
+        # DuckDB scans datetime64[us], not [D]; the insert casts back to DATE
+        "forecast_date": np.array(dates, dtype="datetime64[D]").astype("datetime64[us]")
+    })
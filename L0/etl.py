@@ -1,38 +1,165 @@
 import asyncio
 import logging
-from config import CITIES
+from typing import List, Optional, Tuple
+from config import CITIES, City, Config
 from L0.weather_client import WeatherClient
 from L0.database import Database
+from L0.models import ForecastBatch
 
 logger = logging.getLogger(__name__)
 
 class WeatherETL:
-    def __init__(self):
+    def __init__(self, cities: Optional[List[City]] = None, run_key: Optional[str] = None):
+        self.cities = cities if cities is not None else CITIES
         self.client = WeatherClient()
-        self.db = Database()
+        # Sharded runs pass their key so every shard records one history run
+        self.db = Database(run_key)
 
     async def run(self):
         try:
             logger.info("Starting ETL process")
             
             # Fetch weather data
-            forecasts = await self.client.fetch_forecasts(CITIES)
+            if Config.COMPACT_FORECASTS:
+                forecasts = await self.client.fetch_forecast_store(self.cities)
+            elif Config.COLUMNAR_DECODE:
+                forecasts = await self.client.fetch_forecast_batches(self.cities)
+            else:
+                forecasts = await self.client.fetch_forecasts(self.cities)
             
-            if not forecasts:
+            if not len(forecasts):
                 logger.warning("No forecasts retrieved")
                 return
             
             # Save to database
-            records_updated = self.db.upsert_forecasts(forecasts)
+            if Config.COMPACT_FORECASTS:
+                records_updated = self.db.upsert_store(forecasts)
+            elif Config.COLUMNAR_DECODE:
+                records_updated = self.db.upsert_batches(forecasts)
+            else:
+                records_updated = self.db.upsert_forecasts(forecasts)
             logger.info(f"Successfully updated {records_updated} forecast records")
+            self._log_upsert_stats()
 
         except Exception as e:
             logger.error(f"ETL process failed: {e}")
             raise
 
         finally:
+            self.client.close()
             self.db.close()
 
+    async def run_streaming(self):
+        """
+        Fetch and write concurrently through a bounded queue.
+
+        Fetched cities are decoded and queued as they arrive; a writer
+        drains the queue and upserts in chunks of Config.BATCH_SIZE rows,
+        committing each chunk. A full queue blocks the fetch side, which
+        bounds memory to the queue plus the in-flight requests.
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=Config.STREAM_QUEUE_SIZE)
+        writer = asyncio.create_task(self._write_chunks(queue))
+        fetched = []
+
+        try:
+            logger.info("Starting streaming ETL process")
+
+            try:
+                async for payloads in self.client.stream_hourly(self.cities):
+                    for city, hourly in payloads:
+                        try:
+                            rows = self._decode(city, hourly)
+                        except Exception as e:
+                            logger.error(f"Failed to parse forecast for {city.name}: {e}")
+                            continue
+                        fetched.append(city.name)
+                        # Blocks while the writer is behind
+                        await queue.put((city.name, rows))
+            finally:
+                await queue.put(None)
+                written, failed = await writer
+
+            missing = len(self.cities) - len(fetched)
+            if missing:
+                logger.warning(f"{missing} cities could not be fetched or parsed")
+            if failed:
+                logger.error(f"Failed to write forecasts for: {', '.join(failed)}")
+            logger.info(
+                f"Successfully updated {written} forecast records "
+                f"for {len(fetched) - len(failed)} cities"
+            )
+            self._log_upsert_stats()
+
+        except Exception as e:
+            logger.error(f"ETL process failed: {e}")
+            raise
+
+        finally:
+            self.client.close()
+            self.db.close()
+
+    async def _write_chunks(self, queue: asyncio.Queue) -> Tuple[int, List[str]]:
+        """Drain the queue into the database, one commit per chunk"""
+        written = 0
+        failed: List[str] = []
+        chunk: List[Tuple] = []
+        chunk_cities: List[str] = []
+
+        async def flush():
+            nonlocal written, chunk, chunk_cities
+            try:
+                written += await asyncio.to_thread(self.db.upsert_rows, chunk)
+            except Exception as e:
+                logger.error(f"Failed to write chunk of {len(chunk)} rows: {e}")
+                failed.extend(chunk_cities)
+            chunk, chunk_cities = [], []
+
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            city, rows = item
+            chunk.extend(rows)
+            chunk_cities.append(city)
+            if len(chunk) >= Config.BATCH_SIZE:
+                await flush()
+
+        if chunk:
+            await flush()
+        return written, failed
+
+    def _log_upsert_stats(self):
+        stats = self.db.stats
+        logger.info(
+            f"Forecast rows: {stats.inserted} inserted, {stats.updated} updated, "
+            f"{stats.unchanged} unchanged"
+        )
+
+    @staticmethod
+    def _decode(city: City, hourly: dict) -> List[Tuple]:
+        if Config.COLUMNAR_DECODE:
+            batch = ForecastBatch.from_hourly(city.name, hourly)
+            if batch.errors:
+                logger.warning(
+                    f"Dropped {len(batch.errors)} invalid rows for {city.name}: "
+                    f"{sorted(batch.errors.items())[:10]}"
+                )
+            return batch.to_rows()
+        return [
+            (f.city, f.timestamp, f.temperature, f.precipitation, f.windspeed)
+            for f in WeatherClient._parse_hourly(city, hourly)
+        ]
+
 def run_etl():
+    if Config.SHARDED_ETL:
+        # Imported here: sharding builds on WeatherETL
+        from L0 import sharding
+        sharding.run_sharded_etl()
+        return
+
     etl = WeatherETL()
-    asyncio.run(etl.run()) 
+    if Config.STREAMING_ETL:
+        asyncio.run(etl.run_streaming())
+    else:
+        asyncio.run(etl.run())
@@ -0,0 +1,224 @@
+import asyncio
+import importlib.util
+import logging
+import random
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from datetime import timezone
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, FrozenSet, Optional
+import httpx
+from config import Config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class FetchSettings:
+    """Concurrency, connection, timeout and retry settings for HTTP fetches"""
+    initial_concurrency: int = 16
+    min_concurrency: int = 1
+    max_concurrency: int = 64
+    max_connections: int = 64
+    max_keepalive_connections: int = 32
+    keepalive_expiry: float = 30.0
+    http2: bool = False
+    connect_timeout: float = 5.0
+    read_timeout: float = 30.0
+    pool_timeout: float = 30.0
+    max_attempts: int = 4
+    backoff_base: float = 0.5
+    backoff_max: float = 30.0
+    retry_statuses: FrozenSet[int] = field(default_factory=lambda: frozenset({429, 500, 502, 503, 504}))
+    # Responses that mean the server wants less traffic
+    throttle_statuses: FrozenSet[int] = field(default_factory=lambda: frozenset({429, 503}))
+
+    def __post_init__(self):
+        if self.max_attempts < 1:
+            raise ValueError(f"max_attempts (FETCH_MAX_ATTEMPTS) must be at least 1, got {self.max_attempts}")
+
+    @classmethod
+    def from_config(cls) -> "FetchSettings":
+        return cls(
+            initial_concurrency=Config.FETCH_CONCURRENCY,
+            min_concurrency=Config.FETCH_MIN_CONCURRENCY,
+            max_concurrency=Config.FETCH_MAX_CONCURRENCY,
+            max_connections=Config.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=Config.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=Config.HTTP_KEEPALIVE_EXPIRY,
+            http2=Config.HTTP2,
+            connect_timeout=Config.FETCH_CONNECT_TIMEOUT,
+            read_timeout=Config.FETCH_READ_TIMEOUT,
+            pool_timeout=Config.FETCH_POOL_TIMEOUT,
+            max_attempts=Config.FETCH_MAX_ATTEMPTS,
+            backoff_base=Config.FETCH_BACKOFF_BASE,
+            backoff_max=Config.FETCH_BACKOFF_MAX
+        )
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit adjusted by additive increase, multiplicative decrease.
+
+    Each success raises the limit by 1/limit (about one slot per round
+    of requests); a throttling signal halves it, at most once per
+    `cooldown` seconds so a burst of 429s from one overload counts once.
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int, cooldown: float = 1.0):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._last_decrease = float("-inf")
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self):
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self):
+        self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def on_throttle(self):
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        previous = int(self.limit)
+        self.limit = max(self.minimum, self.limit / 2)
+        metrics.increment("fetch_concurrency_decreases")
+        logger.warning(f"Upstream throttling; fetch concurrency {previous} -> {int(self.limit)}")
+
+class RetryableStatus(Exception):
+    def __init__(self, response: httpx.Response):
+        super().__init__(f"HTTP {response.status_code} from {response.request.url.host}")
+        self.response = response
+
+def retry_after(response: httpx.Response) -> Optional[float]:
+    """Seconds until the Retry-After header's delay or HTTP-date, if any"""
+    value = response.headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        # "-0000" dates parse as naive but are still UTC
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, when.timestamp() - time.time())
+
+class FetchSession:
+    """An open connection pool plus the limiter and retry policy for one fetch run"""
+
+    def __init__(self, client: httpx.AsyncClient, settings: FetchSettings):
+        self.client = client
+        self.settings = settings
+        self.limiter = AdaptiveLimiter(
+            settings.initial_concurrency,
+            settings.min_concurrency,
+            settings.max_concurrency
+        )
+
+    async def get(self, url: str, params: dict, headers: Optional[dict] = None) -> httpx.Response:
+        """
+        GET with bounded concurrency and retries.
+
+        Transport errors and retryable statuses are retried with jittered
+        exponential backoff, or after the server's Retry-After. Other
+        responses, including errors, are returned to the caller. Raises
+        the last error once attempts run out.
+        """
+        settings = self.settings
+        for attempt in range(settings.max_attempts):
+            delay = None
+            await self.limiter.acquire()
+            try:
+                response = await self.client.get(url, params=params, headers=headers)
+                if response.status_code not in settings.retry_statuses:
+                    self.limiter.on_success()
+                    return response
+                if response.status_code in settings.throttle_statuses:
+                    self.limiter.on_throttle()
+                error: Exception = RetryableStatus(response)
+                delay = retry_after(response)
+            except httpx.TimeoutException as e:
+                # Slow responses are a sign of overload as well
+                self.limiter.on_throttle()
+                error = e
+            except httpx.TransportError as e:
+                error = e
+            finally:
+                await self.limiter.release()
+
+            if attempt == settings.max_attempts - 1:
+                break
+            if delay is None:
+                delay = settings.backoff_base * (2 ** attempt) * random.uniform(0.5, 1.5)
+            delay = min(delay, settings.backoff_max)
+            metrics.increment("http_retries", reason=type(error).__name__)
+            logger.info(
+                f"Retrying request in {delay:.1f}s after {error!r} "
+                f"(attempt {attempt + 2}/{settings.max_attempts})"
+            )
+            await asyncio.sleep(delay)
+
+        if isinstance(error, RetryableStatus):
+            return error.response
+        raise error
+
+class FetchEngine:
+    """
+    Builds tuned httpx clients for WeatherClient.
+
+    Connection pool, keep-alive and timeouts come from FetchSettings.
+    HTTP/2 is used when requested and the `h2` package is installed.
+    """
+
+    def __init__(
+        self,
+        settings: Optional[FetchSettings] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        self.settings = settings or FetchSettings.from_config()
+        self.transport = transport
+
+    def _http2(self) -> bool:
+        if not self.settings.http2:
+            return False
+        if importlib.util.find_spec("h2") is None:
+            logger.warning("HTTP2 requested but the h2 package is not installed; using HTTP/1.1")
+            return False
+        return True
+
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[FetchSession]:
+        settings = self.settings
+        client = httpx.AsyncClient(
+            http2=self._http2(),
+            limits=httpx.Limits(
+                max_connections=settings.max_connections,
+                max_keepalive_connections=settings.max_keepalive_connections,
+                keepalive_expiry=settings.keepalive_expiry
+            ),
+            timeout=httpx.Timeout(
+                settings.read_timeout,
+                connect=settings.connect_timeout,
+                pool=settings.pool_timeout
+            ),
+            transport=self.transport
+        )
+        async with client:
+            yield FetchSession(client, settings)
@@ -0,0 +1,199 @@
+import logging
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple
+from psycopg2.extras import execute_values
+from config import Config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+HISTORY_COLUMNS = "city, timestamp, temperature, precipitation, windspeed"
+
+def create_history_tables(cur):
+    """
+    Create forecast_runs and the delta table weather_forecast_history.
+
+    History rows are keyed by (city, timestamp, run_id) and only written
+    when an hour's values differ from its latest stored version. The
+    descending covering index lets "latest version per hour" be answered
+    by an index-only scan that reads one entry per hour. Runs split across
+    workers share one forecast_runs row through its run_key.
+    """
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS forecast_runs (
+            run_id BIGSERIAL PRIMARY KEY,
+            started_at TIMESTAMP NOT NULL DEFAULT LOCALTIMESTAMP,
+            finished_at TIMESTAMP,
+            rows_seen BIGINT NOT NULL DEFAULT 0,
+            rows_changed BIGINT NOT NULL DEFAULT 0
+        );
+        ALTER TABLE forecast_runs ADD COLUMN IF NOT EXISTS run_key VARCHAR(64);
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_forecast_runs_run_key
+            ON forecast_runs (run_key);
+        CREATE TABLE IF NOT EXISTS weather_forecast_history (
+            city VARCHAR(50) NOT NULL,
+            timestamp TIMESTAMP NOT NULL,
+            run_id BIGINT NOT NULL REFERENCES forecast_runs (run_id),
+            temperature FLOAT NOT NULL,
+            precipitation FLOAT NOT NULL,
+            windspeed FLOAT NOT NULL,
+            PRIMARY KEY (city, timestamp, run_id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_weather_forecast_history_latest
+            ON weather_forecast_history (city, timestamp, run_id DESC)
+            INCLUDE (temperature, precipitation, windspeed);
+        CREATE INDEX IF NOT EXISTS idx_weather_forecast_history_run
+            ON weather_forecast_history (run_id);
+    """)
+
+def start_run(cur, run_key: Optional[str] = None) -> int:
+    """
+    Open a forecast run, or join the run already opened for `run_key`.
+
+    Shards of one sharded ETL run pass the same key, so they record their
+    deltas under a single run_id and forecasts_as_of sees the whole run.
+    """
+    if run_key is None:
+        cur.execute("INSERT INTO forecast_runs DEFAULT VALUES RETURNING run_id;")
+    else:
+        cur.execute("""
+            INSERT INTO forecast_runs (run_key) VALUES (%s)
+            ON CONFLICT (run_key) DO UPDATE SET run_key = EXCLUDED.run_key
+            RETURNING run_id;
+        """, (run_key,))
+    run_id = cur.fetchone()[0]
+    logger.info(f"Recording forecast history as run {run_id}")
+    return run_id
+
+def finish_run(cur, run_id: int):
+    cur.execute("""
+        UPDATE forecast_runs SET finished_at = LOCALTIMESTAMP
+        WHERE run_id = %s
+        RETURNING rows_seen, rows_changed;
+    """, (run_id,))
+    row = cur.fetchone()
+    if row is not None:
+        logger.info(f"Forecast run {run_id}: {row[1]} of {row[0]} hours changed")
+
+def finish_keyed_run(cur, run_key: str):
+    """Mark a sharded run finished once its last shard is done; later calls keep the first time"""
+    cur.execute("""
+        SELECT run_id FROM forecast_runs
+        WHERE run_key = %s AND finished_at IS NULL;
+    """, (run_key,))
+    row = cur.fetchone()
+    if row is not None:
+        finish_run(cur, row[0])
+
+def record_deltas(cur, run_id: int, values: List[Tuple]) -> int:
+    """
+    Store the (city, timestamp, temperature, precipitation, windspeed)
+    rows whose values differ from the latest version in the history.
+
+    Hours seen again later in the same run overwrite that run's version.
+    Returns the number of history rows written.
+    """
+    if not values:
+        return 0
+    # ON CONFLICT may touch each key once per statement; keep the last row per hour
+    values = list({(row[0], row[1]): row for row in values}.values())
+    # run_id comes from forecast_runs' sequence, not from input
+    pages = execute_values(cur, f"""
+        WITH input ({HISTORY_COLUMNS}) AS (
+            VALUES %s
+        ),
+        changed AS (
+            INSERT INTO weather_forecast_history (run_id, {HISTORY_COLUMNS})
+            SELECT {int(run_id)}, i.city, i.timestamp, i.temperature, i.precipitation, i.windspeed
+            FROM input i
+            LEFT JOIN LATERAL (
+                SELECT h.temperature, h.precipitation, h.windspeed
+                FROM weather_forecast_history h
+                WHERE h.city = i.city AND h.timestamp = i.timestamp
+                ORDER BY h.run_id DESC
+                LIMIT 1
+            ) latest ON TRUE
+            WHERE (latest.temperature, latest.precipitation, latest.windspeed)
+                IS DISTINCT FROM (i.temperature, i.precipitation, i.windspeed)
+            ON CONFLICT (city, timestamp, run_id) DO UPDATE SET
+                temperature = EXCLUDED.temperature,
+                precipitation = EXCLUDED.precipitation,
+                windspeed = EXCLUDED.windspeed
+            RETURNING 1
+        )
+        SELECT (SELECT COUNT(*) FROM input), (SELECT COUNT(*) FROM changed)
+        """, values, page_size=Config.BATCH_SIZE, fetch=True)
+    seen = sum(page[0] for page in pages)
+    changed = sum(page[1] for page in pages)
+    cur.execute("""
+        UPDATE forecast_runs SET
+            rows_seen = rows_seen + %s,
+            rows_changed = rows_changed + %s
+        WHERE run_id = %s;
+    """, (seen, changed, run_id))
+    metrics.increment("forecast_history_rows", changed)
+    return changed
+
+def _scope(
+    cities: Optional[Iterable[str]],
+    start: Optional[datetime],
+    end: Optional[datetime]
+) -> Tuple[str, list]:
+    conditions, params = [], []
+    if cities is not None:
+        conditions.append("city = ANY(%s)")
+        params.append(list(cities))
+    if start is not None:
+        conditions.append("timestamp >= %s")
+        params.append(start)
+    if end is not None:
+        conditions.append("timestamp < %s")
+        params.append(end)
+    return "".join(f" AND {condition}" for condition in conditions), params
+
+def forecasts_as_of(
+    cur,
+    run_id: Optional[int] = None,
+    cities: Optional[Iterable[str]] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+) -> List[Tuple]:
+    """
+    Forecasts as they stood after run `run_id` (default: the latest
+    finished run, so a run still writing is never half visible).
+
+    Returns (city, timestamp, temperature, precipitation, windspeed,
+    run_id) rows, where run_id is the run that last changed the hour.
+    DISTINCT ON walks idx_weather_forecast_history_latest in order, so
+    only the versions at or before the run are read.
+    """
+    scope, params = _scope(cities, start, end)
+    cur.execute(f"""
+        SELECT DISTINCT ON (city, timestamp)
+            {HISTORY_COLUMNS}, run_id
+        FROM weather_forecast_history
+        WHERE run_id <= COALESCE(
+            %s, (SELECT MAX(run_id) FROM forecast_runs WHERE finished_at IS NOT NULL)
+        ){scope}
+        ORDER BY city, timestamp, run_id DESC;
+    """, [run_id, *params])
+    return cur.fetchall()
+
+def forecast_versions(cur, city: str, timestamp: datetime) -> List[Tuple]:
+    """Every stored version of one hour as (run_id, started_at, temperature, precipitation, windspeed)"""
+    cur.execute("""
+        SELECT h.run_id, r.started_at, h.temperature, h.precipitation, h.windspeed
+        FROM weather_forecast_history h
+        JOIN forecast_runs r USING (run_id)
+        WHERE h.city = %s AND h.timestamp = %s
+        ORDER BY h.run_id;
+    """, (city, timestamp))
+    return cur.fetchall()
+
+def remove_expired_history(cur, retention_days: int = Config.HISTORY_RETENTION_DAYS) -> int:
+    """Drop versions of hours older than the history retention window"""
+    cur.execute("""
+        DELETE FROM weather_forecast_history
+        WHERE timestamp < LOCALTIMESTAMP - make_interval(days => %s);
+    """, (retention_days,))
+    return cur.rowcount
@@ -1,6 +1,49 @@
-from dataclasses import dataclass
-from datetime import datetime
-from typing import Optional
+from array import array
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+import metrics
+
+EPOCH = datetime(1970, 1, 1)
+
+# Why a row was rejected; also the reason label of forecast_rows_rejected,
+# so the set must stay fixed
+MISSING_VALUE = "Missing value"
+NEGATIVE_VALUE = "Precipitation and windspeed cannot be negative"
+OUT_OF_RANGE = "Temperature out of reasonable range"
+INVALID_TIMESTAMP = "Invalid timestamp"
+
+def checked_values(
+    temperature: float,
+    precipitation: float,
+    windspeed: float
+) -> Tuple[float, float, float]:
+    """Round measurements to two decimals and apply the range checks"""
+    temperature = round(temperature, 2)
+    precipitation = round(precipitation, 2)
+    windspeed = round(windspeed, 2)
+
+    if precipitation < 0 or windspeed < 0:
+        raise ValueError(NEGATIVE_VALUE)
+    if not -100 <= temperature <= 100:
+        raise ValueError(OUT_OF_RANGE)
+    return temperature, precipitation, windspeed
+
+def parse_times(values: List) -> np.ndarray:
+    """ISO timestamps as datetime64[m], with NaT for values that do not parse"""
+    try:
+        return np.array(values, dtype="datetime64[m]")
+    except (ValueError, TypeError):
+        pass
+    # Only when the vectorized parse fails: one bad value must not reject the rest
+    times = np.empty(len(values), dtype="datetime64[m]")
+    for i, value in enumerate(values):
+        try:
+            times[i] = np.datetime64(value, "m")
+        except (ValueError, TypeError):
+            times[i] = np.datetime64("NaT")
+    return times
 
 @dataclass
 class WeatherForecast:
@@ -13,11 +56,260 @@ class WeatherForecast:
     created_at: Optional[datetime] = None
 
     def __post_init__(self):
-        self.temperature = round(self.temperature, 2)
-        self.precipitation = round(self.precipitation, 2)
-        self.windspeed = round(self.windspeed, 2)
-        
-        if self.precipitation < 0 or self.windspeed < 0:
-            raise ValueError("Precipitation and windspeed cannot be negative")
-        if not -100 <= self.temperature <= 100:
-            raise ValueError("Temperature out of reasonable range") 
\ No newline at end of file
+        self.temperature, self.precipitation, self.windspeed = checked_values(
+            self.temperature, self.precipitation, self.windspeed
+        )
+
+class ForecastRecord:
+    """
+    One hourly forecast without a per-instance __dict__.
+
+    Rows read back from a ForecastStore come out as these; fields match
+    WeatherForecast minus the database-assigned id and created_at.
+    """
+    __slots__ = ("city", "timestamp", "temperature", "precipitation", "windspeed")
+
+    def __init__(
+        self,
+        city: str,
+        timestamp: datetime,
+        temperature: float,
+        precipitation: float,
+        windspeed: float
+    ):
+        self.city = city
+        self.timestamp = timestamp
+        self.temperature = temperature
+        self.precipitation = precipitation
+        self.windspeed = windspeed
+
+    def astuple(self) -> Tuple[str, datetime, float, float, float]:
+        return (self.city, self.timestamp, self.temperature, self.precipitation, self.windspeed)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, ForecastRecord):
+            return NotImplemented
+        return self.astuple() == other.astuple()
+
+    def __repr__(self) -> str:
+        return (
+            f"ForecastRecord(city={self.city!r}, timestamp={self.timestamp!r}, "
+            f"temperature={self.temperature!r}, precipitation={self.precipitation!r}, "
+            f"windspeed={self.windspeed!r})"
+        )
+
+@dataclass
+class ForecastBatch:
+    """
+    Columnar hourly forecasts for one city.
+
+    Holds the Open-Meteo hourly arrays as NumPy columns and applies the
+    WeatherForecast rounding and range checks as vectorized operations.
+    Rows failing validation are dropped and recorded in `errors`, keyed
+    by their index in the original payload.
+    """
+    city: str
+    time: np.ndarray
+    temperature: np.ndarray
+    precipitation: np.ndarray
+    windspeed: np.ndarray
+    errors: Dict[int, str] = field(default_factory=dict)
+
+    @classmethod
+    def from_hourly(cls, city: str, hourly: dict) -> "ForecastBatch":
+        """Decode an Open-Meteo `hourly` block; missing values become NaN, bad timestamps NaT"""
+        batch = cls(
+            city=city,
+            time=parse_times(hourly["time"]),
+            temperature=np.array(hourly["temperature_2m"], dtype=np.float64),
+            precipitation=np.array(hourly["precipitation"], dtype=np.float64),
+            windspeed=np.array(hourly["windspeed_10m"], dtype=np.float64)
+        )
+        batch.validate()
+        return batch
+
+    def validate(self) -> Dict[int, str]:
+        """Round values and drop invalid rows, returning errors by row index"""
+        n = len(self.time)
+        for name in ("temperature", "precipitation", "windspeed"):
+            if len(getattr(self, name)) != n:
+                raise ValueError(f"Column {name} has {len(getattr(self, name))} values, expected {n}")
+
+        self.temperature = np.round(self.temperature, 2)
+        self.precipitation = np.round(self.precipitation, 2)
+        self.windspeed = np.round(self.windspeed, 2)
+
+        invalid_time = np.isnat(self.time)
+        missing = ~invalid_time & (
+            np.isnan(self.temperature)
+            | np.isnan(self.precipitation)
+            | np.isnan(self.windspeed)
+        )
+        negative = ~invalid_time & ~missing & ((self.precipitation < 0) | (self.windspeed < 0))
+        out_of_range = ~invalid_time & ~missing & ~negative & (
+            (self.temperature < -100) | (self.temperature > 100)
+        )
+
+        errors = {}
+        for mask, message in (
+            (invalid_time, INVALID_TIMESTAMP),
+            (missing, MISSING_VALUE),
+            (negative, NEGATIVE_VALUE),
+            (out_of_range, OUT_OF_RANGE),
+        ):
+            rejected = np.flatnonzero(mask)
+            if len(rejected):
+                metrics.increment("forecast_rows_rejected", len(rejected), reason=message)
+            errors.update((int(i), message) for i in rejected)
+
+        if errors:
+            valid = ~(invalid_time | missing | negative | out_of_range)
+            self.time = self.time[valid]
+            self.temperature = self.temperature[valid]
+            self.precipitation = self.precipitation[valid]
+            self.windspeed = self.windspeed[valid]
+        self.errors.update(errors)
+        metrics.increment("forecast_rows_validated", n - len(errors))
+        return errors
+
+    def __len__(self) -> int:
+        return len(self.time)
+
+    def to_rows(self) -> List[Tuple[str, datetime, float, float, float]]:
+        """Row tuples in weather_forecasts column order"""
+        timestamps = self.time.astype("datetime64[us]").tolist()
+        return list(zip(
+            [self.city] * len(timestamps),
+            timestamps,
+            self.temperature.tolist(),
+            self.precipitation.tolist(),
+            self.windspeed.tolist()
+        ))
+
+    def to_forecasts(self) -> List[WeatherForecast]:
+        return [WeatherForecast(*row) for row in self.to_rows()]
+
+class ForecastStore:
+    """
+    Array-backed hourly forecasts for many cities.
+
+    Each row costs 24 bytes: a uint32 index into the interned city
+    names, int64 epoch seconds (naive timestamps, as stored in
+    weather_forecasts) and three float32 measurements. Measurements
+    are kept at two decimals, so they are rounded again on the way out
+    to undo float32 representation error.
+    """
+
+    def __init__(self):
+        self.cities: List[str] = []
+        self._city_ids: Dict[str, int] = {}
+        self._city = array("I")
+        self._time = array("q")
+        self._temperature = array("f")
+        self._precipitation = array("f")
+        self._windspeed = array("f")
+
+    @classmethod
+    def from_forecasts(cls, forecasts: Iterable[WeatherForecast]) -> "ForecastStore":
+        store = cls()
+        for f in forecasts:
+            store.append(f.city, f.timestamp, f.temperature, f.precipitation, f.windspeed)
+        return store
+
+    def city_id(self, city: str) -> int:
+        city_id = self._city_ids.get(city)
+        if city_id is None:
+            city_id = self._city_ids[city] = len(self.cities)
+            self.cities.append(city)
+        return city_id
+
+    def append(
+        self,
+        city: str,
+        timestamp: datetime,
+        temperature: float,
+        precipitation: float,
+        windspeed: float
+    ):
+        """Add one row, applying the WeatherForecast rounding and range checks"""
+        temperature, precipitation, windspeed = checked_values(
+            temperature, precipitation, windspeed
+        )
+        self._city.append(self.city_id(city))
+        self._time.append((timestamp - EPOCH) // timedelta(seconds=1))
+        self._temperature.append(temperature)
+        self._precipitation.append(precipitation)
+        self._windspeed.append(windspeed)
+
+    def extend_batch(self, batch: ForecastBatch):
+        """Add an already validated ForecastBatch without per-row Python objects"""
+        n = len(batch)
+        self._city.frombytes(np.full(n, self.city_id(batch.city), dtype=np.uint32).tobytes())
+        self._time.frombytes(batch.time.astype("datetime64[s]").astype(np.int64).tobytes())
+        self._temperature.frombytes(batch.temperature.astype(np.float32).tobytes())
+        self._precipitation.frombytes(batch.precipitation.astype(np.float32).tobytes())
+        self._windspeed.frombytes(batch.windspeed.astype(np.float32).tobytes())
+
+    def __len__(self) -> int:
+        return len(self._time)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the row arrays, excluding the interned city names"""
+        return sum(
+            column.itemsize * len(column)
+            for column in (
+                self._city, self._time, self._temperature,
+                self._precipitation, self._windspeed
+            )
+        )
+
+    def columns(self, start: int = 0, stop: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """
+        Zero-copy NumPy views of rows [start, stop) of the row arrays.
+
+        The store cannot grow while one is alive.
+        """
+        rows = slice(start, stop)
+        return {
+            "city": np.frombuffer(self._city, dtype=np.uint32)[rows],
+            "time": np.frombuffer(self._time, dtype=np.int64)[rows].view("datetime64[s]"),
+            "temperature": np.frombuffer(self._temperature, dtype=np.float32)[rows],
+            "precipitation": np.frombuffer(self._precipitation, dtype=np.float32)[rows],
+            "windspeed": np.frombuffer(self._windspeed, dtype=np.float32)[rows]
+        }
+
+    def to_rows(
+        self,
+        start: int = 0,
+        stop: Optional[int] = None
+    ) -> List[Tuple[str, datetime, float, float, float]]:
+        """Row tuples in weather_forecasts column order for rows [start, stop)"""
+        stop = len(self) if stop is None else min(stop, len(self))
+        if start >= stop:
+            return []
+        columns = self.columns(start, stop)
+        cities = self.cities
+        return list(zip(
+            [cities[i] for i in columns["city"].tolist()],
+            columns["time"].astype("datetime64[us]").tolist(),
+            np.round(columns["temperature"].astype(np.float64), 2).tolist(),
+            np.round(columns["precipitation"].astype(np.float64), 2).tolist(),
+            np.round(columns["windspeed"].astype(np.float64), 2).tolist()
+        ))
+
+    def iter_rows(self, chunk_size: int = 10000) -> Iterator[Tuple[str, datetime, float, float, float]]:
+        """Row tuples, materialized `chunk_size` at a time"""
+        for start in range(0, len(self), chunk_size):
+            yield from self.to_rows(start, start + chunk_size)
+
+    def __iter__(self) -> Iterator[ForecastRecord]:
+        for row in self.iter_rows():
+            yield ForecastRecord(*row)
+
+    def __getitem__(self, index: int) -> ForecastRecord:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("ForecastStore index out of range")
+        return ForecastRecord(*self.to_rows(index, index + 1)[0])
@@ -0,0 +1,163 @@
+import logging
+from datetime import date, timedelta
+from typing import Iterable, List, Set, Tuple
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+PARTITION_PREFIX = "weather_forecasts_p"
+
+def is_partitioned(cur) -> bool:
+    cur.execute("""
+        SELECT EXISTS (
+            SELECT 1 FROM pg_partitioned_table
+            WHERE partrelid = to_regclass('weather_forecasts')
+        );
+    """)
+    return cur.fetchone()[0]
+
+def table_exists(cur) -> bool:
+    cur.execute("SELECT to_regclass('weather_forecasts') IS NOT NULL;")
+    return cur.fetchone()[0]
+
+def partition_name(day: date) -> str:
+    return f"{PARTITION_PREFIX}{day:%Y%m%d}"
+
+def create_partitioned_table(cur):
+    """Create weather_forecasts range-partitioned by day on timestamp"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS weather_forecasts (
+            id BIGSERIAL,
+            city VARCHAR(50) NOT NULL,
+            timestamp TIMESTAMP NOT NULL,
+            temperature FLOAT NOT NULL,
+            precipitation FLOAT NOT NULL,
+            windspeed FLOAT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (id, timestamp),
+            UNIQUE(city, timestamp)
+        ) PARTITION BY RANGE (timestamp);
+        CREATE INDEX IF NOT EXISTS idx_weather_forecasts_created_at
+            ON weather_forecasts (created_at);
+    """)
+
+def ensure_partitions(cur, days: Iterable[date]) -> List[str]:
+    """Create any missing daily partitions, returning the names created"""
+    created = []
+    for day in sorted(set(days)):
+        name = partition_name(day)
+        cur.execute("SELECT to_regclass(%s) IS NULL;", (name,))
+        if not cur.fetchone()[0]:
+            continue
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {name}
+            PARTITION OF weather_forecasts
+            FOR VALUES FROM (%s) TO (%s);
+        """, (day, day + timedelta(days=1)))
+        created.append(name)
+    if created:
+        logger.info(f"Created {len(created)} weather_forecasts partitions")
+    return created
+
+def ensure_upcoming_partitions(cur, days_ahead: int = Config.PARTITION_DAYS_AHEAD) -> List[str]:
+    today = date.today()
+    return ensure_partitions(cur, (today + timedelta(days=n) for n in range(-1, days_ahead + 1)))
+
+def list_partitions(cur) -> List[str]:
+    cur.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'weather_forecasts'::regclass
+        ORDER BY c.relname;
+    """)
+    return [row[0] for row in cur.fetchall()]
+
+def partition_day(name: str) -> date:
+    suffix = name[len(PARTITION_PREFIX):]
+    return date(int(suffix[:4]), int(suffix[4:6]), int(suffix[6:8]))
+
+def expired_partitions(cur, retention_days: int = Config.RETENTION_DAYS) -> List[str]:
+    """Partitions whose whole day lies before the retention cutoff"""
+    cur.execute("SELECT (LOCALTIMESTAMP - make_interval(days => %s))::date;", (retention_days,))
+    cutoff = cur.fetchone()[0]
+    return [
+        name for name in list_partitions(cur)
+        if name.startswith(PARTITION_PREFIX) and partition_day(name) < cutoff
+    ]
+
+def drop_expired_partitions(cur, retention_days: int = Config.RETENTION_DAYS) -> Tuple[int, Set[str]]:
+    """
+    Detach and drop partitions older than the retention window.
+
+    Returns the number of rows dropped and the cities they belonged to.
+    Rows of the partially expired boundary day are left for a row-level
+    delete.
+    """
+    dropped_rows = 0
+    cities = set()
+    for name in expired_partitions(cur, retention_days):
+        cur.execute(f"SELECT city, COUNT(*) FROM {name} GROUP BY city;")
+        for city, count in cur.fetchall():
+            cities.add(city)
+            dropped_rows += count
+        cur.execute(f"ALTER TABLE weather_forecasts DETACH PARTITION {name};")
+        cur.execute(f"DROP TABLE {name};")
+        logger.info(f"Dropped expired partition {name}")
+    return dropped_rows, cities
+
+def migrate_to_partitioned(cur) -> int:
+    """
+    Convert an existing plain weather_forecasts table in place.
+
+    The old table is renamed, its rows are copied into a new partitioned
+    table with partitions covering their days, and it is dropped. Runs
+    inside the caller's transaction, so a failure leaves the original
+    table untouched. Returns the number of rows migrated.
+    """
+    logger.info("Migrating weather_forecasts to a partitioned table")
+    cur.execute("""
+        ALTER TABLE weather_forecasts RENAME TO weather_forecasts_legacy;
+        ALTER TABLE weather_forecasts_legacy
+            RENAME CONSTRAINT weather_forecasts_pkey TO weather_forecasts_legacy_pkey;
+        ALTER TABLE weather_forecasts_legacy
+            RENAME CONSTRAINT weather_forecasts_city_timestamp_key
+            TO weather_forecasts_legacy_city_timestamp_key;
+        DROP INDEX IF EXISTS idx_weather_forecasts_created_at;
+        DROP INDEX IF EXISTS idx_weather_forecasts_timestamp;
+    """)
+    create_partitioned_table(cur)
+
+    cur.execute("SELECT DISTINCT DATE(timestamp) FROM weather_forecasts_legacy;")
+    ensure_partitions(cur, [row[0] for row in cur.fetchall()])
+    ensure_upcoming_partitions(cur)
+
+    cur.execute("""
+        INSERT INTO weather_forecasts
+            (id, city, timestamp, temperature, precipitation, windspeed, created_at)
+        SELECT id, city, timestamp, temperature, precipitation, windspeed, created_at
+        FROM weather_forecasts_legacy;
+    """)
+    migrated = cur.rowcount
+    cur.execute("""
+        SELECT setval(
+            pg_get_serial_sequence('weather_forecasts', 'id'),
+            COALESCE((SELECT MAX(id) FROM weather_forecasts), 0) + 1,
+            false
+        );
+        DROP TABLE weather_forecasts_legacy;
+    """)
+    logger.info(f"Migrated {migrated} rows into partitioned weather_forecasts")
+    return migrated
+
+if __name__ == "__main__":
+    import metrics
+    from db import session
+
+    metrics.configure_logging()
+    with session("partition_migration") as conn, conn.cursor() as cur:
+        if not table_exists(cur):
+            create_partitioned_table(cur)
+        elif not is_partitioned(cur):
+            migrate_to_partitioned(cur)
+        ensure_upcoming_partitions(cur)
@@ -0,0 +1,205 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlencode
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fetched_at: float
+    fresh: bool
+
+class ResponseCache:
+    """
+    On-disk cache of Open-Meteo responses in a single SQLite file.
+
+    Bodies are zlib-compressed. Entries younger than `ttl` seconds are
+    served without touching the network; older ones keep their
+    validators so the client can revalidate them with a conditional
+    request. When the stored bodies exceed `max_bytes`, the least
+    recently used entries are evicted.
+
+    New responses, refreshes and access times are buffered in memory and
+    written in one transaction by flush(), which runs once
+    `flush_bytes` of new bodies are pending and on close(). Short write
+    transactions keep the file usable by concurrent ETL workers, and
+    the stored size is tracked as a running total rather than summed.
+    """
+
+    def __init__(self, path: str, ttl: float, max_bytes: int, flush_bytes: int = 8 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.flush_bytes = flush_bytes
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                body BLOB NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                size INTEGER NOT NULL
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses (last_access)"
+        )
+        self._conn.commit()
+        self._total = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+        # key -> (compressed body, etag, last_modified, fetched_at) not yet written
+        self._pending: Dict[str, Tuple[bytes, Optional[str], Optional[str], float]] = {}
+        self._pending_bytes = 0
+        self._refreshed: Dict[str, float] = {}
+        self._accessed: Dict[str, float] = {}
+
+    @classmethod
+    def from_config(cls) -> Optional["ResponseCache"]:
+        """Cache configured by RESPONSE_CACHE_PATH, or None when caching is off"""
+        if not Config.RESPONSE_CACHE_PATH:
+            return None
+        return cls(
+            Config.RESPONSE_CACHE_PATH,
+            Config.RESPONSE_CACHE_TTL,
+            Config.RESPONSE_CACHE_MAX_BYTES
+        )
+
+    @staticmethod
+    def key(url: str, params: dict) -> str:
+        """Cache key from the endpoint and its sorted query parameters"""
+        query = urlencode(sorted((k, str(v)) for k, v in params.items()))
+        return hashlib.sha256(f"{url}?{query}".encode()).hexdigest()
+
+    @property
+    def total_bytes(self) -> int:
+        """Compressed size of the stored bodies, including unflushed ones"""
+        with self._lock:
+            return self._total + self._pending_bytes
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        now = time.time()
+        with self._lock:
+            row = self._pending.get(key)
+            if row is None:
+                row = self._conn.execute(
+                    "SELECT body, etag, last_modified, fetched_at FROM responses WHERE key = ?",
+                    (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+            self._accessed[key] = now
+            body, etag, last_modified, fetched_at = row
+            fetched_at = self._refreshed.get(key, fetched_at)
+
+        return CachedResponse(
+            body=zlib.decompress(body),
+            etag=etag,
+            last_modified=last_modified,
+            fetched_at=fetched_at,
+            fresh=now - fetched_at < self.ttl
+        )
+
+    def put(
+        self,
+        key: str,
+        body: bytes,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None
+    ):
+        compressed = zlib.compress(body)
+        now = time.time()
+        with self._lock:
+            replaced = self._pending.get(key)
+            if replaced is not None:
+                self._pending_bytes -= len(replaced[0])
+            self._pending[key] = (compressed, etag, last_modified, now)
+            self._pending_bytes += len(compressed)
+            self._refreshed.pop(key, None)
+            self._accessed[key] = now
+            if self._pending_bytes >= self.flush_bytes:
+                self._flush()
+
+    def refresh(self, key: str):
+        """Restart an entry's freshness window after a 304 Not Modified"""
+        now = time.time()
+        with self._lock:
+            pending = self._pending.get(key)
+            if pending is not None:
+                self._pending[key] = pending[:3] + (now,)
+            else:
+                self._refreshed[key] = now
+            self._accessed[key] = now
+
+    def flush(self):
+        """Write buffered responses and access times, evicting if over max_bytes"""
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not (self._pending or self._refreshed or self._accessed):
+            return
+        with self._conn:
+            for key, (body, _, _, _) in self._pending.items():
+                old = self._conn.execute(
+                    "SELECT size FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                self._total += len(body) - (old[0] if old else 0)
+            self._conn.executemany("""
+                INSERT OR REPLACE INTO responses
+                    (key, body, etag, last_modified, fetched_at, last_access, size)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, [
+                (key, body, etag, last_modified, fetched_at,
+                 self._accessed.get(key, fetched_at), len(body))
+                for key, (body, etag, last_modified, fetched_at) in self._pending.items()
+            ])
+            self._conn.executemany(
+                "UPDATE responses SET fetched_at = ? WHERE key = ?",
+                [(fetched_at, key) for key, fetched_at in self._refreshed.items()]
+            )
+            self._conn.executemany(
+                "UPDATE responses SET last_access = ? WHERE key = ?",
+                [(now, key) for key, now in self._accessed.items() if key not in self._pending]
+            )
+            if self._total > self.max_bytes:
+                self._evict()
+        self._pending.clear()
+        self._pending_bytes = 0
+        self._refreshed.clear()
+        self._accessed.clear()
+
+    def _evict(self):
+        evicted = 0
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM responses ORDER BY last_access"
+        ).fetchall():
+            if self._total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._total -= size
+            evicted += 1
+        logger.info(f"Evicted {evicted} cached responses")
+
+    def close(self):
+        """Flush and close the file; called once the run is done with the cache"""
+        with self._lock:
+            self._flush()
+            self._conn.close()
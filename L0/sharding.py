@@ -0,0 +1,444 @@
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import socket
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from config import CITIES, City, Config
+from db import close_pool, session
+from L0 import history
+from L0.etl import WeatherETL
+import metrics
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+@dataclass
+class Lease:
+    """A claimed shard; `attempt` and `worker` fence out workers whose lease has expired"""
+    run_key: str
+    shard: int
+    cities: List[City]
+    attempt: int
+    worker: str
+
+def new_run_key() -> str:
+    """
+    ETL_RUN_KEY if set, else a key unique to this invocation.
+
+    A shared default (such as the current hour) would make a retry in the
+    same hour find every shard done and fetch nothing.
+    """
+    if Config.ETL_RUN_KEY:
+        return Config.ETL_RUN_KEY
+    return f"{datetime.now(timezone.utc).strftime('%Y-%m-%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+def worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def create_lease_table():
+    with session("create_shard_leases") as conn, conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS etl_shard_leases (
+                run_key VARCHAR(64) NOT NULL,
+                shard INTEGER NOT NULL,
+                cities JSONB NOT NULL,
+                status VARCHAR(10) NOT NULL DEFAULT 'pending',
+                worker VARCHAR(100),
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_expires_at TIMESTAMP,
+                rows_written BIGINT,
+                failed_cities JSONB,
+                error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                completed_at TIMESTAMP,
+                PRIMARY KEY (run_key, shard)
+            );
+            CREATE INDEX IF NOT EXISTS idx_etl_shard_leases_claimable
+                ON etl_shard_leases (run_key, status, lease_expires_at);
+        """)
+
+def create_shards(run_key: str, cities: List[City], shard_size: int = Config.ETL_SHARD_SIZE) -> int:
+    """
+    Split `cities` into shards for `run_key`; returns how many were new.
+
+    Every worker calls this with the same run key. The first one creates
+    the shards and the rest are no-ops, so no coordinator is needed.
+    Joining an existing run leaves its shards alone: failed shards stay
+    failed until retry_shards() is called for the run.
+    """
+    shards = [
+        (run_key, number, json.dumps([[c.name, c.latitude, c.longitude] for c in cities[i:i + shard_size]]))
+        for number, i in enumerate(range(0, len(cities), shard_size))
+    ]
+    with session("create_shards") as conn, conn.cursor() as cur:
+        # Serialize creators so concurrent workers do not interleave inserts
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s));", (f"etl_shards:{run_key}",))
+        cur.execute("SELECT COUNT(*) FROM etl_shard_leases WHERE run_key = %s;", (run_key,))
+        if cur.fetchone()[0]:
+            return 0
+        cur.executemany("""
+            INSERT INTO etl_shard_leases (run_key, shard, cities)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (run_key, shard) DO NOTHING;
+        """, shards)
+    logger.info(f"Created {len(shards)} shards of up to {shard_size} cities for run {run_key}")
+    return len(shards)
+
+def retry_shards(run_key: str) -> int:
+    """
+    Give a run's failed shards, and shards whose lease expired, a fresh attempt budget.
+
+    Only called on an explicit retry (ETL_RETRY_FAILED or --retry-failed),
+    never when a worker joins, so shards given up on after
+    ETL_SHARD_MAX_ATTEMPTS stay failed. Done shards stay done. Returns
+    how many shards went back to pending.
+    """
+    with session("retry_shards") as conn, conn.cursor() as cur:
+        # Leases are fenced by worker as well, so restarting attempts is safe
+        cur.execute("""
+            UPDATE etl_shard_leases SET
+                status = 'pending',
+                worker = NULL,
+                attempts = 0,
+                lease_expires_at = NULL
+            WHERE run_key = %s
+            AND (
+                status = 'failed'
+                OR (status = 'leased' AND lease_expires_at < clock_timestamp()::timestamp)
+            );
+        """, (run_key,))
+        retried = cur.rowcount
+    if retried:
+        logger.info(f"Retrying {retried} failed or expired shards of run {run_key}")
+    return retried
+
+def claim_shard(
+    run_key: str,
+    worker: str,
+    lease_seconds: float = Config.ETL_LEASE_SECONDS,
+    max_attempts: int = Config.ETL_SHARD_MAX_ATTEMPTS
+) -> Optional[Lease]:
+    """
+    Lease the next pending shard, or one whose previous lease expired.
+
+    SKIP LOCKED lets concurrent workers pass over rows another worker is
+    claiming at the same moment instead of queueing behind it.
+    """
+    with session("claim_shard") as conn, conn.cursor() as cur:
+        # Shards whose workers keep dying are given up on rather than retried forever
+        cur.execute("""
+            UPDATE etl_shard_leases SET
+                status = 'failed',
+                worker = NULL,
+                error = 'Lease expired on the last attempt'
+            WHERE run_key = %s AND status = 'leased'
+            AND lease_expires_at < clock_timestamp()::timestamp
+            AND attempts >= %s;
+        """, (run_key, max_attempts))
+        cur.execute("""
+            UPDATE etl_shard_leases l SET
+                status = 'leased',
+                worker = %s,
+                attempts = l.attempts + 1,
+                lease_expires_at = clock_timestamp()::timestamp + make_interval(secs => %s)
+            WHERE (l.run_key, l.shard) = (
+                SELECT run_key, shard FROM etl_shard_leases
+                WHERE run_key = %s
+                AND (
+                    status = 'pending'
+                    OR (status = 'leased' AND lease_expires_at < clock_timestamp()::timestamp)
+                )
+                ORDER BY shard
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING l.shard, l.cities, l.attempts;
+        """, (worker, lease_seconds, run_key))
+        row = cur.fetchone()
+    if row is None:
+        return None
+    shard, cities, attempt = row
+    if attempt > 1:
+        metrics.increment("etl_shard_reclaims")
+        logger.warning(f"Reclaimed shard {shard} of run {run_key} (attempt {attempt})")
+    return Lease(run_key, shard, [City(*city) for city in cities], attempt, worker)
+
+def renew_lease(lease: Lease, lease_seconds: float = Config.ETL_LEASE_SECONDS) -> bool:
+    """Extend a lease; False when it has been taken over by another worker"""
+    with session("renew_shard_lease") as conn, conn.cursor() as cur:
+        cur.execute("""
+            UPDATE etl_shard_leases
+            SET lease_expires_at = clock_timestamp()::timestamp + make_interval(secs => %s)
+            WHERE run_key = %s AND shard = %s AND attempts = %s AND worker = %s
+            AND status = 'leased';
+        """, (lease_seconds, lease.run_key, lease.shard, lease.attempt, lease.worker))
+        return cur.rowcount == 1
+
+def complete_shard(lease: Lease, rows_written: int, failed_cities: Dict[str, str]) -> bool:
+    """
+    Mark a shard done if this worker still holds the lease.
+
+    The attempt number and worker fence the update, so a shard completes
+    exactly once even if a stalled worker finishes after its lease was
+    taken over. Forecast upserts are idempotent, so the duplicate work
+    such a worker did is harmless.
+    """
+    with session("complete_shard") as conn, conn.cursor() as cur:
+        cur.execute("""
+            UPDATE etl_shard_leases SET
+                status = 'done',
+                rows_written = %s,
+                failed_cities = %s,
+                completed_at = clock_timestamp()::timestamp
+            WHERE run_key = %s AND shard = %s AND attempts = %s AND worker = %s
+            AND status = 'leased';
+        """, (
+            rows_written, json.dumps(failed_cities),
+            lease.run_key, lease.shard, lease.attempt, lease.worker
+        ))
+        completed = cur.rowcount == 1
+    if completed:
+        metrics.increment("etl_shards_completed")
+    else:
+        metrics.increment("etl_shard_completions_rejected")
+        logger.warning(f"Lease on shard {lease.shard} was lost; completion left to its new owner")
+    return completed
+
+def release_shard(lease: Lease, error: Exception, max_attempts: int = Config.ETL_SHARD_MAX_ATTEMPTS):
+    """Return a failed shard for another attempt, or fail it after max_attempts"""
+    status = FAILED if lease.attempt >= max_attempts else PENDING
+    with session("release_shard") as conn, conn.cursor() as cur:
+        cur.execute("""
+            UPDATE etl_shard_leases SET
+                status = %s,
+                worker = NULL,
+                lease_expires_at = NULL,
+                error = %s
+            WHERE run_key = %s AND shard = %s AND attempts = %s AND worker = %s
+            AND status = 'leased';
+        """, (status, str(error), lease.run_key, lease.shard, lease.attempt, lease.worker))
+    metrics.increment("etl_shard_failures", status=status)
+
+def run_progress(run_key: str) -> Dict[str, int]:
+    """Shard counts by status for a run"""
+    with session("shard_progress") as conn, conn.cursor() as cur:
+        cur.execute("""
+            SELECT status, COUNT(*) FROM etl_shard_leases
+            WHERE run_key = %s GROUP BY status;
+        """, (run_key,))
+        return dict(cur.fetchall())
+
+class LeaseHeartbeat:
+    """
+    Renews a lease from its own thread until stopped.
+
+    The ETL's upserts are blocking psycopg2 calls on the event loop, so
+    a renewal scheduled on that loop could be starved by a long write
+    until the lease expired and another worker took the shard over.
+    """
+
+    def __init__(self, lease: Lease, lease_seconds: float):
+        self.lease = lease
+        self.lease_seconds = lease_seconds
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name=f"lease-shard-{lease.shard}", daemon=True
+        )
+
+    def __enter__(self) -> "LeaseHeartbeat":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            try:
+                renewed = renew_lease(self.lease, self.lease_seconds)
+            except Exception as e:
+                # A transient database error; the next tick tries again
+                logger.warning(f"Could not renew lease on shard {self.lease.shard}: {e}")
+                continue
+            if not renewed:
+                logger.warning(f"Lost lease on shard {self.lease.shard} of run {self.lease.run_key}")
+                return
+
+async def process_shard(lease: Lease, lease_seconds: float = Config.ETL_LEASE_SECONDS) -> bool:
+    """Run the ETL for one leased shard, renewing the lease while it works"""
+    etl = WeatherETL(lease.cities, lease.run_key)
+    try:
+        with LeaseHeartbeat(lease, lease_seconds), metrics.span("etl_shard"):
+            await (etl.run_streaming() if Config.STREAMING_ETL else etl.run())
+        if len(etl.client.failed) == len(lease.cities):
+            raise RuntimeError(f"No city in the shard could be fetched: {next(iter(etl.client.failed.values()))}")
+    except Exception as e:
+        logger.error(f"Shard {lease.shard} failed: {e}")
+        await asyncio.to_thread(release_shard, lease, e)
+        return False
+
+    written = etl.db.stats.inserted + etl.db.stats.updated + etl.db.stats.unchanged
+    return await asyncio.to_thread(complete_shard, lease, written, etl.client.failed)
+
+def finish_run(run_key: str):
+    """Set the run's forecast history finished_at, once every shard is done"""
+    if not Config.FORECAST_HISTORY:
+        return
+    with session("finish_run") as conn, conn.cursor() as cur:
+        history.finish_keyed_run(cur, run_key)
+
+async def run_worker_async(
+    run_key: str,
+    cities: Optional[List[City]] = None,
+    poll_interval: float = Config.ETL_POLL_INTERVAL
+) -> int:
+    """
+    Claim and process shards until every shard of the run is done or failed.
+
+    While other workers still hold leases this worker keeps polling, so
+    it can take over shards whose lease expires. Returns the number of
+    shards this worker completed.
+    """
+    worker = worker_name()
+    create_lease_table()
+    create_shards(run_key, cities if cities is not None else CITIES)
+
+    completed = 0
+    while True:
+        lease = await asyncio.to_thread(claim_shard, run_key, worker)
+        if lease is not None:
+            logger.info(f"{worker} processing shard {lease.shard} ({len(lease.cities)} cities)")
+            if await process_shard(lease):
+                completed += 1
+            continue
+
+        progress = await asyncio.to_thread(run_progress, run_key)
+        if not progress.get(PENDING) and not progress.get(LEASED):
+            if not progress.get(FAILED):
+                await asyncio.to_thread(finish_run, run_key)
+            break
+        await asyncio.sleep(poll_interval)
+
+    logger.info(f"{worker} finished: {completed} shards completed")
+    return completed
+
+def run_worker(run_key: str, cities: Optional[List[City]] = None) -> int:
+    try:
+        return asyncio.run(run_worker_async(run_key, cities))
+    finally:
+        close_pool()
+
+def _worker_process(
+    run_key: str,
+    cities: Optional[List[City]],
+    stage: str = "",
+    reports: Optional[multiprocessing.Queue] = None
+):
+    metrics.configure_logging()
+    metrics.join_stage(stage)
+    try:
+        run_worker(run_key, cities)
+    finally:
+        # A spawned worker has its own registry; hand it to the parent's report
+        if reports is not None:
+            reports.put(metrics.registry.report())
+
+def _collect_reports(processes: List[multiprocessing.Process], reports: multiprocessing.Queue) -> int:
+    """Merge worker reports into this process's registry while waiting for the workers"""
+    collected = 0
+    # Drained while the workers run, since a worker only exits once its report is read
+    while any(process.is_alive() for process in processes):
+        try:
+            metrics.registry.merge(reports.get(timeout=0.5))
+            collected += 1
+        except queue.Empty:
+            pass
+    for process in processes:
+        process.join()
+    while True:
+        try:
+            metrics.registry.merge(reports.get_nowait())
+            collected += 1
+        except queue.Empty:
+            return collected
+
+def run_sharded_etl(
+    workers: int = Config.ETL_WORKERS,
+    run_key: Optional[str] = None,
+    cities: Optional[List[City]] = None,
+    retry_failed: bool = Config.ETL_RETRY_FAILED
+) -> Dict[str, int]:
+    """
+    Run the ETL across `workers` local processes sharing one lease table.
+
+    More workers can join the same run from other machines with
+    `python -m L0.sharding --run-key <key>`, using the key logged here.
+    With `retry_failed`, an existing run's failed shards are retried.
+    Returns the final shard counts by status.
+    """
+    run_key = run_key or new_run_key()
+    logger.info(f"Starting sharded ETL run {run_key}")
+    start = time.perf_counter()
+    create_lease_table()
+    create_shards(run_key, cities if cities is not None else CITIES)
+    if retry_failed:
+        retry_shards(run_key)
+    # Spawned workers open their own connection pools and event loops
+    context = multiprocessing.get_context("spawn")
+    reports = context.Queue()
+    processes = [
+        context.Process(
+            target=_worker_process,
+            args=(run_key, cities, metrics.current_stage(), reports),
+            name=f"etl-worker-{i}"
+        )
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    if _collect_reports(processes, reports) < workers:
+        logger.warning("Some workers exited without reporting metrics")
+
+    progress = run_progress(run_key)
+    logger.info(
+        f"Sharded ETL run {run_key} finished in {time.perf_counter() - start:.2f}s "
+        f"with {workers} workers: {progress}"
+    )
+    failed_workers = [p.name for p in processes if p.exitcode != 0]
+    if failed_workers:
+        logger.error(f"Workers exited with errors: {', '.join(failed_workers)}")
+    if progress.get(FAILED) or progress.get(PENDING) or progress.get(LEASED):
+        raise RuntimeError(f"Sharded ETL run {run_key} incomplete: {progress}")
+    return progress
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Join a sharded ETL run as one worker")
+    parser.add_argument("--run-key", default=Config.ETL_RUN_KEY, required=not Config.ETL_RUN_KEY,
+                        help="run to join, as logged by the run (default: ETL_RUN_KEY)")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="give the run's failed shards a fresh attempt budget first")
+    args = parser.parse_args()
+    metrics.configure_logging()
+    if args.retry_failed:
+        create_lease_table()
+        retry_shards(args.run_key)
+    try:
+        run_worker(args.run_key)
+    finally:
+        metrics.log_summary()
+        metrics.write_report()
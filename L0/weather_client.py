@@ -1,49 +1,351 @@
-import httpx
 import asyncio
+import json
+from collections import OrderedDict
 from datetime import datetime
-from typing import List
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 import logging
-from L0.models import WeatherForecast
+from L0.fetch_engine import FetchEngine, FetchSession
+from L0.models import (
+    INVALID_TIMESTAMP, MISSING_VALUE, NEGATIVE_VALUE, OUT_OF_RANGE,
+    ForecastBatch, ForecastStore, WeatherForecast
+)
+from L0.response_cache import ResponseCache
 from config import City, Config
+import metrics
 
 logger = logging.getLogger(__name__)
 
+HOURLY_VARIABLES = "temperature_2m,precipitation,windspeed_10m"
+
+def grid_cell(city: City, resolution: float = Config.GRID_RESOLUTION) -> Tuple[int, int]:
+    """Index of the model grid cell a city falls into"""
+    return (
+        round(city.latitude / resolution),
+        round(city.longitude / resolution)
+    )
+
+def group_by_grid_cell(
+    cities: List[City],
+    resolution: float = Config.GRID_RESOLUTION
+) -> Dict[Tuple[int, int], List[City]]:
+    """Group cities sharing a grid cell, keeping first-seen order"""
+    cells: Dict[Tuple[int, int], List[City]] = OrderedDict()
+    for city in cities:
+        cells.setdefault(grid_cell(city, resolution), []).append(city)
+    return cells
+
 class WeatherClient:
-    async def fetch_forecasts(self, cities: List[City]) -> List[WeatherForecast]:
-        async with httpx.AsyncClient() as client:
-            tasks = [self._fetch_city_forecast(client, city) for city in cities]
+    def __init__(
+        self,
+        cache: Optional[ResponseCache] = None,
+        engine: Optional[FetchEngine] = None
+    ):
+        # Any object with ResponseCache's key/get/put/refresh/close methods works here
+        self.cache = cache if cache is not None else ResponseCache.from_config()
+        self.engine = engine or FetchEngine()
+        # City name -> error for cities the last fetch gave up on
+        self.failed: Dict[str, str] = {}
+
+    def close(self):
+        """Write out and close the response cache, if any"""
+        if self.cache is not None:
+            self.cache.close()
+
+    async def fetch_forecasts(
+        self,
+        cities: List[City],
+        batched: bool = Config.BATCHED_FETCH
+    ) -> List[WeatherForecast]:
+        forecasts = []
+        for city, hourly in await self.fetch_hourly(cities, batched):
+            try:
+                forecasts.extend(self._parse_hourly(city, hourly))
+            except Exception as e:
+                logger.error(f"Failed to parse forecast for {city.name}: {e}")
+        return forecasts
+
+    async def fetch_forecast_batches(
+        self,
+        cities: List[City],
+        batched: bool = Config.BATCHED_FETCH
+    ) -> List[ForecastBatch]:
+        """Fetch forecasts decoded into one columnar ForecastBatch per city"""
+        batches = []
+        for city, hourly in await self.fetch_hourly(cities, batched):
+            try:
+                batch = ForecastBatch.from_hourly(city.name, hourly)
+            except Exception as e:
+                logger.error(f"Failed to parse forecast for {city.name}: {e}")
+                continue
+            if batch.errors:
+                logger.warning(
+                    f"Dropped {len(batch.errors)} invalid rows for {city.name}: "
+                    f"{sorted(batch.errors.items())[:10]}"
+                )
+            batches.append(batch)
+        return batches
+
+    async def fetch_forecast_store(
+        self,
+        cities: List[City],
+        batched: bool = Config.BATCHED_FETCH
+    ) -> ForecastStore:
+        """Fetch forecasts into one compact ForecastStore, decoding city by city"""
+        store = ForecastStore()
+        for city, hourly in await self.fetch_hourly(cities, batched):
+            try:
+                batch = ForecastBatch.from_hourly(city.name, hourly)
+            except Exception as e:
+                logger.error(f"Failed to parse forecast for {city.name}: {e}")
+                continue
+            if batch.errors:
+                logger.warning(
+                    f"Dropped {len(batch.errors)} invalid rows for {city.name}: "
+                    f"{sorted(batch.errors.items())[:10]}"
+                )
+            store.extend_batch(batch)
+        return store
+
+    async def fetch_hourly(
+        self,
+        cities: List[City],
+        batched: bool = Config.BATCHED_FETCH
+    ) -> List[Tuple[City, dict]]:
+        """Fetch the raw `hourly` block for every city"""
+        if batched:
+            return await self.fetch_hourly_batched(cities)
+
+        self.failed = {}
+        async with self.engine.session() as session:
+            tasks = [self._fetch_city_forecast(session, city) for city in cities]
             results = await asyncio.gather(*tasks, return_exceptions=True)
             
-            forecasts = []
+            payloads = []
             for result in results:
                 if isinstance(result, Exception):
                     logger.error(f"Failed to fetch forecast: {result}")
                 else:
-                    forecasts.extend(result)
+                    payloads.extend(result)
             
-            return forecasts
+            self.report_failures()
+            return payloads
+
+    async def stream_hourly(
+        self,
+        cities: List[City],
+        batched: bool = Config.BATCHED_FETCH,
+        concurrency: int = Config.STREAM_FETCH_CONCURRENCY
+    ) -> AsyncIterator[List[Tuple[City, dict]]]:
+        """
+        Yield each request's (city, hourly) payloads as it completes.
+
+        At most `concurrency` requests are in flight, and no new request
+        is started while the consumer holds the generator suspended, so a
+        slow consumer throttles fetching.
+        """
+        if batched:
+            cells = list(group_by_grid_cell(cities).values())
+            units = [
+                cells[i:i + Config.WEATHER_BATCH_SIZE]
+                for i in range(0, len(cells), Config.WEATHER_BATCH_SIZE)
+            ]
+            fetch = self._fetch_batch_forecast
+        else:
+            units = cities
+            fetch = self._fetch_city_forecast
+
+        self.failed = {}
+        async with self.engine.session() as session:
+            remaining = iter(units)
+            pending = set()
+
+            def launch():
+                for unit in remaining:
+                    pending.add(asyncio.ensure_future(fetch(session, unit)))
+                    if len(pending) >= concurrency:
+                        break
+
+            launch()
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    pending.discard(task)
+                    if task.exception() is not None:
+                        logger.error(f"Failed to fetch forecast: {task.exception()}")
+                        continue
+                    yield task.result()
+                launch()
+            self.report_failures()
+
+    async def fetch_hourly_batched(
+        self,
+        cities: List[City],
+        batch_size: int = Config.WEATHER_BATCH_SIZE
+    ) -> List[Tuple[City, dict]]:
+        """
+        Fetch hourly blocks packing many locations into each request.
+
+        Cities in the same grid cell are fetched once and share the
+        response; cells are sent batch_size coordinates at a time.
+        """
+        cells = list(group_by_grid_cell(cities).values())
+        batches = [cells[i:i + batch_size] for i in range(0, len(cells), batch_size)]
+        logger.info(
+            f"Fetching {len(cities)} cities as {len(cells)} grid cells "
+            f"in {len(batches)} requests"
+        )
+
+        self.failed = {}
+        async with self.engine.session() as session:
+            tasks = [self._fetch_batch_forecast(session, batch) for batch in batches]
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+
+            payloads = []
+            for result in results:
+                if isinstance(result, Exception):
+                    logger.error(f"Failed to fetch forecast batch: {result}")
+                else:
+                    payloads.extend(result)
+
+            self.report_failures()
+            return payloads
+
+    def report_failures(self):
+        """Log and count the cities the last fetch could not retrieve"""
+        if not self.failed:
+            return
+        metrics.increment("fetch_failures", len(self.failed))
+        names = sorted(self.failed)
+        logger.error(
+            f"Failed to fetch {len(names)} cities after retries: "
+            f"{', '.join(names[:20])}{' ...' if len(names) > 20 else ''}"
+        )
+
+    async def _fetch_batch_forecast(
+        self,
+        session: FetchSession,
+        cells: List[List[City]]
+    ) -> List[Tuple[City, dict]]:
+        # One representative coordinate per cell
+        representatives = [cell[0] for cell in cells]
+        names = ", ".join(city.name for city in representatives)
+        try:
+            params = {
+                "latitude": ",".join(str(city.latitude) for city in representatives),
+                "longitude": ",".join(str(city.longitude) for city in representatives),
+                "hourly": HOURLY_VARIABLES,
+                "timezone": "auto"
+            }
+
+            data = await self._get_json(session, params, request="batch")
+
+            # A single location comes back as an object, several as a list
+            locations = data if isinstance(data, list) else [data]
+            if len(locations) != len(cells):
+                raise ValueError(
+                    f"Expected {len(cells)} locations in response, got {len(locations)}"
+                )
+
+            payloads = [
+                (city, location["hourly"])
+                for cell, location in zip(cells, locations)
+                for city in cell
+            ]
+
+            logger.info(f"Successfully fetched forecast batch for {names}")
+            return payloads
+
+        except Exception as e:
+            logger.error(f"Error fetching forecast batch for {names}: {e}")
+            for cell in cells:
+                for city in cell:
+                    self.failed[city.name] = str(e)
+            raise
 
     async def _fetch_city_forecast(
         self, 
-        client: httpx.AsyncClient, 
+        session: FetchSession, 
         city: City
-    ) -> List[WeatherForecast]:
+    ) -> List[Tuple[City, dict]]:
         try:
             params = {
                 "latitude": city.latitude,
                 "longitude": city.longitude,
-                "hourly": "temperature_2m,precipitation,windspeed_10m",
+                "hourly": HOURLY_VARIABLES,
                 "timezone": "auto"
             }
 
-            response = await client.get(Config.WEATHER_API_URL, params=params)
+            data = await self._get_json(session, params, request="city", city=city.name)
+
+            logger.info(f"Successfully fetched forecast for {city.name}")
+            return [(city, data["hourly"])]
+
+        except Exception as e:
+            logger.error(f"Error fetching forecast for {city.name}: {e}")
+            self.failed[city.name] = str(e)
+            raise 
+
+    async def _get_json(self, session: FetchSession, params: dict, **labels):
+        """
+        GET the forecast endpoint, going through the response cache if configured.
+
+        `labels` tag the request's latency metrics.
+        """
+        if self.cache is None:
+            response = await self._get(session, params, {}, labels)
             response.raise_for_status()
-            data = response.json()
+            return self._decode_json(response.content)
 
-            forecasts = []
-            hourly = data["hourly"]
-            
-            for i, time_str in enumerate(hourly["time"]):
+        # SQLite reads and writes run in a worker thread, off the event loop
+        key = self.cache.key(Config.WEATHER_API_URL, params)
+        cached = await asyncio.to_thread(self.cache.get, key)
+        if cached is not None and cached.fresh:
+            metrics.increment("response_cache", result="hit")
+            return self._decode_json(cached.body)
+
+        # Revalidate stale entries when the server gave us validators
+        headers = {}
+        if cached is not None:
+            if cached.etag:
+                headers["If-None-Match"] = cached.etag
+            if cached.last_modified:
+                headers["If-Modified-Since"] = cached.last_modified
+
+        response = await self._get(session, params, headers, labels)
+        if response.status_code == 304 and cached is not None:
+            metrics.increment("response_cache", result="revalidated")
+            await asyncio.to_thread(self.cache.refresh, key)
+            return self._decode_json(cached.body)
+        response.raise_for_status()
+        metrics.increment("response_cache", result="miss")
+
+        await asyncio.to_thread(
+            self.cache.put,
+            key,
+            response.content,
+            response.headers.get("etag"),
+            response.headers.get("last-modified")
+        )
+        return self._decode_json(response.content)
+
+    @staticmethod
+    async def _get(session: FetchSession, params: dict, headers: dict, labels: dict):
+        # Includes retries and time spent waiting for a concurrency slot
+        with metrics.span("http_fetch", **labels):
+            response = await session.get(Config.WEATHER_API_URL, params, headers)
+        metrics.increment("http_responses", status=response.status_code)
+        return response
+
+    @staticmethod
+    def _decode_json(body: bytes):
+        with metrics.span("json_decode"):
+            return json.loads(body)
+
+    @staticmethod
+    def _parse_hourly(city: City, hourly: dict) -> List[WeatherForecast]:
+        forecasts = []
+        for i, time_str in enumerate(hourly["time"]):
+            try:
                 forecast = WeatherForecast(
                     city=city.name,
                     timestamp=datetime.fromisoformat(time_str),
@@ -51,11 +353,15 @@ class WeatherClient:
                     precipitation=hourly["precipitation"][i],
                     windspeed=hourly["windspeed_10m"][i]
                 )
-                forecasts.append(forecast)
-
-            logger.info(f"Successfully fetched forecast for {city.name}")
-            return forecasts
-
-        except Exception as e:
-            logger.error(f"Error fetching forecast for {city.name}: {e}")
-            raise 
+            except ValueError as e:
+                # Range checks raise one of a few fixed messages; anything else
+                # is fromisoformat's, which quotes the value and is no label
+                reason = str(e) if str(e) in (NEGATIVE_VALUE, OUT_OF_RANGE) else INVALID_TIMESTAMP
+                metrics.increment("forecast_rows_rejected", reason=reason)
+                raise
+            except TypeError:
+                metrics.increment("forecast_rows_rejected", reason=MISSING_VALUE)
+                raise
+            forecasts.append(forecast)
+        metrics.increment("forecast_rows_validated", len(forecasts))
+        return forecasts
@@ -1,19 +1,93 @@
-import psycopg2
 import logging
 from config import Config
+from db import session, using_duckdb
+import metrics
+from L0 import aggregates, history, partitions
+from L0.database import forget_hashes
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
-def run_data_cleaning():
+def log_cleaning_summary(
+    duplicates_removed: int,
+    invalid_removed: int,
+    old_removed: int,
+    rounded: int,
+    total_remaining: int,
+    estimated: bool = False
+):
+    total_label = "Total records remaining (estimated)" if estimated else "Total records remaining"
+    logger.info(f"""
+            Cleaning Summary:
+            ----------------
+            Duplicates removed: {duplicates_removed}
+            Invalid records removed: {invalid_removed}
+            Old records removed: {old_removed}
+            Records rounded: {rounded}
+            {total_label}: {total_remaining}
+            """)
+
+def round_sql(column: str) -> str:
+    """SQL rounding a float column to 2 decimals"""
+    if using_duckdb():
+        # DuckDB's NUMERIC is DECIMAL(18,3), which would round twice
+        return f"ROUND({column}, 2)"
+    return f"ROUND({column}::numeric, 2)"
+
+def load_archive():
+    """Import the Parquet archive, or fail with a config error if pyarrow is missing"""
+    try:
+        # pyarrow is optional and slow to import, so only load it when archiving
+        from L0 import archive
+    except ImportError as e:
+        raise ValueError(f"ARCHIVE_PATH needs pyarrow installed ({e})") from e
+    return archive
+
+def remove_old_records(cur) -> int:
+    """
+    Delete forecasts older than the retention window.
+
+    With Config.ARCHIVE_PATH set they are first exported to the Parquet
+    archive in the same transaction. On a partitioned table whole expired
+    days are detached and dropped first, leaving only the boundary day
+    for a row-level delete. Cities that lost rows have their content
+    hashes forgotten.
+    """
+    removed = 0
+    cities = set()
+    if Config.ARCHIVE_PATH:
+        load_archive().archive_expired(cur)
+    if not using_duckdb() and partitions.is_partitioned(cur):
+        dropped, cities = partitions.drop_expired_partitions(cur)
+        removed += dropped
+    cur.execute("""
+        DELETE FROM weather_forecasts 
+        WHERE timestamp < LOCALTIMESTAMP - %s * INTERVAL '1 day'
+        RETURNING city;
+    """, (Config.RETENTION_DAYS,))
+    removed += cur.rowcount
+    cities |= {row[0] for row in cur.fetchall()}
+    forget_hashes(cur, cities)
+    if Config.FORECAST_HISTORY:
+        logger.info(f"Removed {history.remove_expired_history(cur)} expired forecast history versions")
+    return removed
+
+def sync_aggregates(cur, touched: set):
+    """Recompute daily aggregates for buckets changed by cleaning and expire old ones"""
+    if not Config.DAILY_AGGREGATES:
+        return
+    aggregates.refresh_aggregates(cur, touched)
+    aggregates.remove_expired_aggregates(cur)
+
+def run_data_cleaning(incremental: bool = Config.INCREMENTAL_CLEANING):
     """Clean weather forecast data in the database"""
-    conn = psycopg2.connect(Config.DATABASE_URL)
-    
+    if Config.ARCHIVE_PATH:
+        # Fail before the transaction starts rather than after its first deletes
+        load_archive()
+    if incremental:
+        return run_incremental_cleaning()
+
     try:
-        with conn.cursor() as cur:
+        with session("data_cleaning") as conn, conn.cursor() as cur:
             logger.info("Starting data cleaning...")
             
             # Remove duplicates (keep most recent)
@@ -22,9 +96,10 @@ def run_data_cleaning():
                 WHERE a.id < b.id 
                 AND a.city = b.city 
                 AND a.timestamp = b.timestamp
-                RETURNING a.id;
+                RETURNING a.city;
             """)
             duplicates_removed = cur.rowcount
+            removed_cities = {row[0] for row in cur.fetchall()}
             logger.info(f"Removed {duplicates_removed} duplicate records")
             
             # Remove invalid values
@@ -35,57 +110,192 @@ def run_data_cleaning():
                 OR windspeed < 0
                 OR city IS NULL 
                 OR timestamp IS NULL
-                RETURNING id;
+                RETURNING city, DATE(timestamp);
             """)
             invalid_removed = cur.rowcount
+            touched = set(cur.fetchall())
+            removed_cities |= {city for city, day in touched}
+            forget_hashes(cur, removed_cities)
             logger.info(f"Removed {invalid_removed} records with invalid values")
             
-            # Remove old data (older than 30 days)
-            cur.execute("""
-                DELETE FROM weather_forecasts 
-                WHERE timestamp < CURRENT_TIMESTAMP - INTERVAL '30 days'
-                RETURNING id;
-            """)
-            old_removed = cur.rowcount
+            # Remove old data (older than Config.RETENTION_DAYS)
+            old_removed = remove_old_records(cur)
             logger.info(f"Removed {old_removed} old records")
             
             # Round numerical values
-            cur.execute("""
+            cur.execute(f"""
                 UPDATE weather_forecasts 
                 SET 
-                    temperature = ROUND(temperature::numeric, 2),
-                    precipitation = ROUND(precipitation::numeric, 2),
-                    windspeed = ROUND(windspeed::numeric, 2)
+                    temperature = {round_sql("temperature")},
+                    precipitation = {round_sql("precipitation")},
+                    windspeed = {round_sql("windspeed")}
                 WHERE 
-                    temperature != ROUND(temperature::numeric, 2)
-                    OR precipitation != ROUND(precipitation::numeric, 2)
-                    OR windspeed != ROUND(windspeed::numeric, 2)
-                RETURNING id;
+                    temperature != {round_sql("temperature")}
+                    OR precipitation != {round_sql("precipitation")}
+                    OR windspeed != {round_sql("windspeed")}
+                RETURNING city, DATE(timestamp);
             """)
             rounded = cur.rowcount
+            touched |= set(cur.fetchall())
             logger.info(f"Rounded values in {rounded} records")
             
+            sync_aggregates(cur, touched)
+
             # Get total count for reference
             cur.execute("SELECT COUNT(*) FROM weather_forecasts")
             total_remaining = cur.fetchone()[0]
             
-            conn.commit()
-            logger.info(f"""
-            Cleaning Summary:
-            ----------------
-            Duplicates removed: {duplicates_removed}
-            Invalid records removed: {invalid_removed}
-            Old records removed: {old_removed}
-            Records rounded: {rounded}
-            Total records remaining: {total_remaining}
-            """)
+            log_cleaning_summary(
+                duplicates_removed, invalid_removed, old_removed, rounded, total_remaining
+            )
             
     except Exception as e:
-        conn.rollback()
         logger.error(f"Error during data cleaning: {e}")
         raise
-    finally:
-        conn.close()
+
+def settled_mark(cur):
+    """
+    Highest created_at below which every row is committed and visible.
+
+    created_at is the writing transaction's start time, so an ETL
+    transaction still open now may later commit rows older than
+    MAX(created_at). On Postgres the mark therefore stops just before the
+    oldest open transaction in this database; those rows are picked up by
+    the next run instead of being skipped for good.
+    """
+    if using_duckdb():
+        # A single writer process, so nothing commits behind the scan
+        cur.execute("SELECT MAX(created_at) FROM weather_forecasts")
+        return cur.fetchone()[0]
+
+    # Read before the table: a transaction committing in between is either
+    # open here or visible to the next statement's snapshot
+    cur.execute("""
+        SELECT LEAST(MIN(xact_start), clock_timestamp())::timestamp - INTERVAL '1 microsecond'
+        FROM pg_stat_activity
+        WHERE datname = current_database() AND pid <> pg_backend_pid();
+    """)
+    open_since = cur.fetchone()[0]
+    cur.execute("SELECT MAX(created_at) FROM weather_forecasts")
+    newest = cur.fetchone()[0]
+    return None if newest is None else min(newest, open_since)
+
+def run_incremental_cleaning():
+    """
+    Clean only rows written since the previous run.
+
+    Rows are tracked by a created_at high-water mark stored in
+    cleaning_watermarks; validation and rounding are bounded to the
+    (previous mark, settled_mark()] window. The duplicate sweep
+    is skipped because UNIQUE(city, timestamp) already prevents
+    duplicates, retention uses the timestamp index, and the remaining
+    total is the planner's estimate instead of a COUNT(*) (on Postgres;
+    DuckDB counts exactly from its column metadata).
+    """
+    try:
+        with session("data_cleaning") as conn, conn.cursor() as cur:
+            logger.info("Starting incremental data cleaning...")
+
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS cleaning_watermarks (
+                    stage VARCHAR(50) PRIMARY KEY,
+                    high_water_mark TIMESTAMP NOT NULL,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+            """)
+            # DuckDB has no row locks; its single writer process needs none
+            cur.execute(f"""
+                SELECT high_water_mark FROM cleaning_watermarks
+                WHERE stage = 'data_cleaning'
+                {"" if using_duckdb() else "FOR UPDATE"};
+            """)
+            row = cur.fetchone()
+            previous_mark = row[0] if row else None
+
+            current_mark = settled_mark(cur)
+            logger.info(f"Cleaning rows created after {previous_mark} up to {current_mark}")
+
+            invalid_removed = rounded = 0
+            touched = set()
+            if current_mark is not None:
+                # Remove invalid values among new rows
+                cur.execute("""
+                    DELETE FROM weather_forecasts 
+                    WHERE created_at > COALESCE(%s, '-infinity'::timestamp)
+                    AND created_at <= %s
+                    AND (
+                        temperature < -100 OR temperature > 100
+                        OR precipitation < 0
+                        OR windspeed < 0
+                        OR city IS NULL 
+                        OR timestamp IS NULL
+                    )
+                    RETURNING city, DATE(timestamp);
+                """, (previous_mark, current_mark))
+                invalid_removed = cur.rowcount
+                touched |= set(cur.fetchall())
+                forget_hashes(cur, {city for city, day in touched})
+                logger.info(f"Removed {invalid_removed} records with invalid values")
+
+                # Round numerical values among new rows
+                cur.execute(f"""
+                    UPDATE weather_forecasts 
+                    SET 
+                        temperature = {round_sql("temperature")},
+                        precipitation = {round_sql("precipitation")},
+                        windspeed = {round_sql("windspeed")}
+                    WHERE created_at > COALESCE(%s, '-infinity'::timestamp)
+                    AND created_at <= %s
+                    AND (
+                        temperature != {round_sql("temperature")}
+                        OR precipitation != {round_sql("precipitation")}
+                        OR windspeed != {round_sql("windspeed")}
+                    )
+                    RETURNING city, DATE(timestamp);
+                """, (previous_mark, current_mark))
+                rounded = cur.rowcount
+                touched |= set(cur.fetchall())
+                logger.info(f"Rounded values in {rounded} records")
+
+                cur.execute("""
+                    INSERT INTO cleaning_watermarks (stage, high_water_mark)
+                    VALUES ('data_cleaning', %s)
+                    ON CONFLICT (stage) DO UPDATE SET
+                        high_water_mark = EXCLUDED.high_water_mark,
+                        updated_at = now();
+                """, (current_mark,))
+
+            # Remove old data (older than Config.RETENTION_DAYS)
+            old_removed = remove_old_records(cur)
+            logger.info(f"Removed {old_removed} old records")
+
+            sync_aggregates(cur, touched)
+
+            if using_duckdb():
+                # Exact counts are cheap on columnar storage
+                cur.execute("SELECT COUNT(*) FROM weather_forecasts")
+            else:
+                # Planner estimate across the table and any child partitions
+                cur.execute("""
+                    SELECT COALESCE(SUM(GREATEST(reltuples, 0)), 0)::bigint
+                    FROM pg_class
+                    WHERE oid = 'weather_forecasts'::regclass
+                    OR oid IN (
+                        SELECT inhrelid FROM pg_inherits
+                        WHERE inhparent = 'weather_forecasts'::regclass
+                    );
+                """)
+            total_remaining = cur.fetchone()[0]
+
+            log_cleaning_summary(
+                0, invalid_removed, old_removed, rounded, total_remaining,
+                estimated=not using_duckdb()
+            )
+
+    except Exception as e:
+        logger.error(f"Error during incremental data cleaning: {e}")
+        raise
 
 if __name__ == "__main__":
+    metrics.configure_logging()
     run_data_cleaning()
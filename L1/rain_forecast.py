@@ -1,148 +1,314 @@
-import psycopg2
 import logging
 from config import Config
+from db import json_agg_objects, session, using_duckdb
+from L0 import duckdb_storage
+from L0.aggregates import EPISODE_FIELDS
+import metrics
 from datetime import datetime
+from typing import Optional
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
-def create_rain_forecasts_table():
+def create_rain_forecasts_table(conn=None):
     """Create table for storing detailed daily rain forecasts"""
-    conn = psycopg2.connect(Config.DATABASE_URL)
+    if conn is None:
+        with session("create_rain_forecasts_table") as conn:
+            return create_rain_forecasts_table(conn)
+
     try:
         with conn.cursor() as cur:
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS daily_rain_forecasts (
-                    id SERIAL PRIMARY KEY,
-                    city VARCHAR(100) NOT NULL,
-                    forecast_date DATE NOT NULL,
-                    rain_start TIMESTAMP NOT NULL,
-                    rain_end TIMESTAMP NOT NULL,
-                    total_rain DECIMAL NOT NULL,
-                    max_rain_intensity DECIMAL NOT NULL,
-                    avg_temperature DECIMAL NOT NULL,
-                    avg_wind DECIMAL NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(city, forecast_date)
-                );
-            """)
-            conn.commit()
-            logger.info("Daily rain forecasts table created/verified")
+            if using_duckdb():
+                duckdb_storage.create_rain_forecasts_table(cur)
+            else:
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS daily_rain_forecasts (
+                        id SERIAL PRIMARY KEY,
+                        city VARCHAR(100) NOT NULL,
+                        forecast_date DATE NOT NULL,
+                        rain_start TIMESTAMP NOT NULL,
+                        rain_end TIMESTAMP NOT NULL,
+                        total_rain DECIMAL NOT NULL,
+                        max_rain_intensity DECIMAL NOT NULL,
+                        avg_temperature DECIMAL NOT NULL,
+                        avg_wind DECIMAL NOT NULL,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        UNIQUE(city, forecast_date)
+                    );
+                    ALTER TABLE daily_rain_forecasts
+                        ADD COLUMN IF NOT EXISTS rain_episodes JSONB;
+                """)
+        logger.info("Daily rain forecasts table created/verified")
     except Exception as e:
         logger.error(f"Error creating table: {e}")
         raise
-    finally:
-        conn.close()
 
-def get_rain_forecasts():
-    """Get locations and times where rain is expected in next 7 days, organized by day"""
-    conn = psycopg2.connect(Config.DATABASE_URL)
-    
-    try:
-        # First ensure table exists
-        create_rain_forecasts_table()
+RAIN_WINDOW = """
+    precipitation > 0
+    AND timestamp > LOCALTIMESTAMP
+    AND timestamp < CURRENT_DATE + INTERVAL '7 days'
+"""
+
+def query_rain_days(cur) -> list:
+    """Daily summaries for rainy days, aggregated server-side but stored row by row"""
+    cur.execute(f"""
+        WITH daily_summary AS (
+            SELECT 
+                city,
+                DATE(timestamp) as date,
+                MIN(timestamp) as rain_start,
+                MAX(timestamp) as rain_end,
+                SUM(precipitation) as total_rain,
+                MAX(precipitation) as max_rain,
+                AVG(temperature) as avg_temp,
+                AVG(windspeed) as avg_wind
+            FROM weather_forecasts
+            WHERE {RAIN_WINDOW}
+            GROUP BY city, DATE(timestamp)
+            HAVING SUM(precipitation) > 0
+        )
+        SELECT *
+        FROM daily_summary
+        ORDER BY city, date;
+    """)
+    rain_results = cur.fetchall()
+
+    # Store the daily rain forecasts
+    for row in rain_results:
+        city, date, rain_start, rain_end, total_rain, max_rain, avg_temp, avg_wind = row
         
+        # Insert or update the daily forecast
+        cur.execute("""
+            INSERT INTO daily_rain_forecasts 
+                (city, forecast_date, rain_start, rain_end, total_rain, 
+                 max_rain_intensity, avg_temperature, avg_wind)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (city, forecast_date) 
+            DO UPDATE SET
+                rain_start = EXCLUDED.rain_start,
+                rain_end = EXCLUDED.rain_end,
+                total_rain = EXCLUDED.total_rain,
+                max_rain_intensity = EXCLUDED.max_rain_intensity,
+                avg_temperature = EXCLUDED.avg_temperature,
+                avg_wind = EXCLUDED.avg_wind,
+                created_at = now();
+        """, (
+            city, date, rain_start, rain_end, total_rain, 
+            max_rain, avg_temp, avg_wind
+        ))
+    return rain_results
+
+def materialize_rain_forecasts(cur) -> list:
+    """
+    Materialize daily_rain_forecasts with one INSERT ... SELECT on the server.
+
+    Consecutive rainy hours form an episode (gaps-and-islands over
+    ROW_NUMBER()), stored per day as a JSON list alongside the overall
+    span. Only the upserted rows come back, sorted for display.
+    """
+    cur.execute(f"""
+        WITH rainy AS (
+            SELECT
+                city,
+                DATE(timestamp) AS date,
+                timestamp,
+                precipitation,
+                temperature,
+                windspeed,
+                timestamp - ROW_NUMBER() OVER (
+                    PARTITION BY city, DATE(timestamp) ORDER BY timestamp
+                ) * INTERVAL '1 hour' AS episode
+            FROM weather_forecasts
+            WHERE {RAIN_WINDOW}
+        ),
+        episodes AS (
+            SELECT
+                city,
+                date,
+                {json_agg_objects(EPISODE_FIELDS, "episode_start")} AS rain_episodes
+            FROM (
+                SELECT
+                    city,
+                    date,
+                    MIN(timestamp) AS episode_start,
+                    MAX(timestamp) AS episode_end,
+                    SUM(precipitation) AS episode_rain
+                FROM rainy
+                GROUP BY city, date, episode
+            ) e
+            GROUP BY city, date
+        ),
+        daily_summary AS (
+            SELECT 
+                city,
+                date,
+                MIN(timestamp) as rain_start,
+                MAX(timestamp) as rain_end,
+                SUM(precipitation) as total_rain,
+                MAX(precipitation) as max_rain,
+                AVG(temperature) as avg_temp,
+                AVG(windspeed) as avg_wind
+            FROM rainy
+            GROUP BY city, date
+            HAVING SUM(precipitation) > 0
+        )
+        INSERT INTO daily_rain_forecasts 
+            (city, forecast_date, rain_start, rain_end, total_rain, 
+             max_rain_intensity, avg_temperature, avg_wind, rain_episodes)
+        SELECT d.*, e.rain_episodes
+        FROM daily_summary d
+        JOIN episodes e USING (city, date)
+        ON CONFLICT (city, forecast_date) 
+        DO UPDATE SET
+            rain_start = EXCLUDED.rain_start,
+            rain_end = EXCLUDED.rain_end,
+            total_rain = EXCLUDED.total_rain,
+            max_rain_intensity = EXCLUDED.max_rain_intensity,
+            avg_temperature = EXCLUDED.avg_temperature,
+            avg_wind = EXCLUDED.avg_wind,
+            rain_episodes = EXCLUDED.rain_episodes,
+            created_at = now()
+        RETURNING
+            city, forecast_date, rain_start, rain_end, total_rain,
+            max_rain_intensity, avg_temperature, avg_wind, rain_episodes;
+    """)
+    return sorted(cur.fetchall(), key=lambda row: (row[0], row[1]))
+
+def materialize_rain_forecasts_from_aggregates(cur) -> list:
+    """
+    Materialize daily_rain_forecasts from daily_weather_aggregates.
+
+    The rainy-hour span, averages and episodes are already maintained
+    per (city, day) by the ETL, so this reads one row per city and day
+    instead of scanning hourly forecasts. Days are whole calendar days,
+    including today's earlier hours.
+    """
+    cur.execute("""
+        INSERT INTO daily_rain_forecasts 
+            (city, forecast_date, rain_start, rain_end, total_rain, 
+             max_rain_intensity, avg_temperature, avg_wind, rain_episodes)
+        SELECT
+            city, forecast_date, rain_start, rain_end, total_precip,
+            max_precip, rain_avg_temp, rain_avg_wind, rain_episodes
+        FROM daily_weather_aggregates
+        WHERE forecast_date >= CURRENT_DATE
+        AND forecast_date < CURRENT_DATE + 7
+        AND total_precip > 0
+        ON CONFLICT (city, forecast_date) 
+        DO UPDATE SET
+            rain_start = EXCLUDED.rain_start,
+            rain_end = EXCLUDED.rain_end,
+            total_rain = EXCLUDED.total_rain,
+            max_rain_intensity = EXCLUDED.max_rain_intensity,
+            avg_temperature = EXCLUDED.avg_temperature,
+            avg_wind = EXCLUDED.avg_wind,
+            rain_episodes = EXCLUDED.rain_episodes,
+            created_at = now()
+        RETURNING
+            city, forecast_date, rain_start, rain_end, total_rain,
+            max_rain_intensity, avg_temperature, avg_wind, rain_episodes;
+    """)
+    return sorted(cur.fetchall(), key=lambda row: (row[0], row[1]))
+
+def get_today_summaries(cur) -> dict:
+    # Get weather summaries from OpenAI
+    cur.execute("""
+        SELECT 
+            city,
+            summary_text
+        FROM weather_summaries
+        WHERE summary_date = CURRENT_DATE
+        ORDER BY city;
+    """)
+    return {row[0]: row[1] for row in cur.fetchall()}
+
+def format_rain_period(rain_start, rain_end, rain_episodes=None) -> str:
+    if rain_episodes and len(rain_episodes) > 1:
+        # jsonb timestamps come back as ISO strings
+        periods = ", ".join(
+            f"{episode['start'][11:16]} - {episode['end'][11:16]}"
+            for episode in rain_episodes
+        )
+        return f"Rain periods: {periods}"
+    return f"Rain period: {rain_start.strftime('%H:%M')} - {rain_end.strftime('%H:%M')}"
+
+def display_rain_forecasts(rain_results, summaries: dict):
+    logger.info("\nDetailed Weather Forecast:")
+    logger.info("---------------------------------")
+
+    # Display the forecast
+    current_city = None
+    for row in rain_results:
+        city, date, rain_start, rain_end, total_rain, max_rain, avg_temp, avg_wind = row[:8]
+        rain_episodes = row[8] if len(row) > 8 else None
+        
+        if city != current_city:
+            logger.info(f"\n{city}:")
+            if city in summaries:
+                logger.info(f"{summaries[city]}\n")
+            current_city = city
+        
+        logger.info(
+            f"{date.strftime('%Y-%m-%d')}: "
+            f"{format_rain_period(rain_start, rain_end, rain_episodes)}, "
+            f"Total rain: {total_rain:.1f}mm, "
+            f"Max intensity: {max_rain:.1f}mm, "
+            f"Avg temperature: {avg_temp:.1f}°C, "
+            f"Avg wind: {avg_wind:.1f}km/h"
+        )
+
+def update_rain_forecasts() -> list:
+    """Materialize daily_rain_forecasts for the next 7 days, returning the rows written"""
+    with session("rain_forecast") as conn:
+        # First ensure table exists
+        create_rain_forecasts_table(conn)
+
+        with conn.cursor() as cur:
+            if Config.DAILY_AGGREGATES:
+                return materialize_rain_forecasts_from_aggregates(cur)
+            if Config.SERVER_SIDE_RAIN:
+                return materialize_rain_forecasts(cur)
+            return query_rain_days(cur)
+
+def load_rain_forecasts(since: Optional[datetime] = None) -> list:
+    """
+    Stored rain days for the next 7 days, shaped like update_rain_forecasts' rows.
+
+    With `since`, only rows written at or after that time are returned,
+    i.e. those materialized by a run that started then.
+    """
+    with session("load_rain_forecasts") as conn:
+        create_rain_forecasts_table(conn)
         with conn.cursor() as cur:
-            # Get daily summaries for rainy days
-            cur.execute("""
-                WITH daily_summary AS (
-                    SELECT 
-                        city,
-                        DATE(timestamp) as date,
-                        MIN(timestamp) as rain_start,
-                        MAX(timestamp) as rain_end,
-                        SUM(precipitation) as total_rain,
-                        MAX(precipitation) as max_rain,
-                        AVG(temperature) as avg_temp,
-                        AVG(windspeed) as avg_wind
-                    FROM weather_forecasts
-                    WHERE 
-                        precipitation > 0
-                        AND timestamp > CURRENT_TIMESTAMP
-                        AND timestamp < CURRENT_DATE + INTERVAL '7 days'
-                    GROUP BY city, DATE(timestamp)
-                    HAVING SUM(precipitation) > 0
-                )
-                SELECT *
-                FROM daily_summary
-                ORDER BY city, date;
-            """)
-            
-            rain_results = cur.fetchall()
-            
-            if not rain_results:
-                logger.info("No rain expected in any location in next 7 days")
-                return
-
-            # Get weather summaries from OpenAI
             cur.execute("""
-                SELECT 
-                    city,
-                    summary_text
-                FROM weather_summaries
-                WHERE summary_date = CURRENT_DATE
-                ORDER BY city;
-            """)
-            
-            summaries = {row[0]: row[1] for row in cur.fetchall()}
-            
-            logger.info("\nDetailed Weather Forecast:")
-            logger.info("---------------------------------")
-            
-            # Store the daily rain forecasts
-            for row in rain_results:
-                city, date, rain_start, rain_end, total_rain, max_rain, avg_temp, avg_wind = row
-                
-                # Insert or update the daily forecast
-                cur.execute("""
-                    INSERT INTO daily_rain_forecasts 
-                        (city, forecast_date, rain_start, rain_end, total_rain, 
-                         max_rain_intensity, avg_temperature, avg_wind)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (city, forecast_date) 
-                    DO UPDATE SET
-                        rain_start = EXCLUDED.rain_start,
-                        rain_end = EXCLUDED.rain_end,
-                        total_rain = EXCLUDED.total_rain,
-                        max_rain_intensity = EXCLUDED.max_rain_intensity,
-                        avg_temperature = EXCLUDED.avg_temperature,
-                        avg_wind = EXCLUDED.avg_wind,
-                        created_at = CURRENT_TIMESTAMP;
-                """, (
-                    city, date, rain_start, rain_end, total_rain, 
-                    max_rain, avg_temp, avg_wind
-                ))
-            
-            conn.commit()
-            
-            # Display the forecast
-            current_city = None
-            for row in rain_results:
-                city, date, rain_start, rain_end, total_rain, max_rain, avg_temp, avg_wind = row
-                
-                if city != current_city:
-                    logger.info(f"\n{city}:")
-                    if city in summaries:
-                        logger.info(f"{summaries[city]}\n")
-                    current_city = city
-                
-                logger.info(
-                    f"{date.strftime('%Y-%m-%d')}: "
-                    f"Rain period: {rain_start.strftime('%H:%M')} - {rain_end.strftime('%H:%M')}, "
-                    f"Total rain: {total_rain:.1f}mm, "
-                    f"Max intensity: {max_rain:.1f}mm, "
-                    f"Avg temperature: {avg_temp:.1f}°C, "
-                    f"Avg wind: {avg_wind:.1f}km/h"
-                )
-            
+                SELECT
+                    city, forecast_date, rain_start, rain_end, total_rain,
+                    max_rain_intensity, avg_temperature, avg_wind, rain_episodes
+                FROM daily_rain_forecasts
+                WHERE forecast_date >= CURRENT_DATE
+                AND forecast_date < CURRENT_DATE + 7
+                AND (%(since)s::timestamp IS NULL OR created_at >= %(since)s::timestamp)
+                ORDER BY city, forecast_date;
+            """, {"since": since})
+            return cur.fetchall()
+
+def show_rain_forecasts(rain_results: list):
+    """Display rain days alongside today's summaries"""
+    if not rain_results:
+        logger.info("No rain expected in any location in next 7 days")
+        return
+
+    with session("rain_report") as conn, conn.cursor() as cur:
+        summaries = get_today_summaries(cur)
+    display_rain_forecasts(rain_results, summaries)
+
+def get_rain_forecasts():
+    """Get locations and times where rain is expected in next 7 days, organized by day"""
+    try:
+        show_rain_forecasts(update_rain_forecasts())
     except Exception as e:
         logger.error(f"Error querying rain forecast: {e}")
         raise
-    finally:
-        conn.close()
 
 if __name__ == "__main__":
+    metrics.configure_logging()
     get_rain_forecasts()
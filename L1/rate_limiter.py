@@ -0,0 +1,55 @@
+import asyncio
+import time
+from typing import Optional
+
+class TokenBucket:
+    """
+    Async token bucket refilled continuously at `per_minute` units per minute.
+
+    The bucket holds at most one minute of budget. Waiters are served in
+    arrival order. Create it inside the running event loop.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.available = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1.0):
+        # Oversized requests would never fit; let them through on a full bucket
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.available >= amount:
+                    self.available -= amount
+                    return
+                await asyncio.sleep((amount - self.available) / self.rate)
+
+    def refund(self, amount: float):
+        """Return unused budget, e.g. when a request used fewer tokens than reserved"""
+        self._refill()
+        self.available = min(self.capacity, self.available + amount)
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits applied together"""
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: Optional[float] = None):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+    async def acquire(self, tokens: float = 0.0):
+        await self.requests.acquire(1)
+        if self.tokens is not None and tokens:
+            await self.tokens.acquire(tokens)
+
+    def reconcile(self, reserved: float, used: float):
+        if self.tokens is not None and used < reserved:
+            self.tokens.refund(reserved - used)
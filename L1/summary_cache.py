@@ -0,0 +1,111 @@
+import hashlib
+import logging
+from dataclasses import dataclass
+from typing import Optional
+from config import Config
+from db import session
+import metrics
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+
+stats = CacheStats()
+
+def create_cache_table(conn):
+    """Create the summary cache table next to weather_summaries"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS summary_cache (
+                cache_key CHAR(64) PRIMARY KEY,
+                model VARCHAR(100) NOT NULL,
+                summary_text TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+            CREATE INDEX IF NOT EXISTS idx_summary_cache_last_used
+                ON summary_cache (last_used_at);
+        """)
+
+def cache_key(model: str, prompt_template: str, city: str, weather_text: str) -> str:
+    """Content address of a summary request"""
+    digest = hashlib.sha256()
+    for part in (model, prompt_template, city, weather_text):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def get_cached(key: str) -> Optional[str]:
+    """Return a fresh cached summary and mark it used, counting the hit or miss"""
+    if not Config.SUMMARY_CACHE_ENABLED:
+        return None
+    try:
+        with session("summary_cache_get") as conn, conn.cursor() as cur:
+            cur.execute("""
+                UPDATE summary_cache
+                SET last_used_at = CURRENT_TIMESTAMP
+                WHERE cache_key = %s
+                AND created_at > CURRENT_TIMESTAMP - %s * INTERVAL '1 hour'
+                RETURNING summary_text;
+            """, (key, Config.SUMMARY_CACHE_TTL_HOURS))
+            row = cur.fetchone()
+    except Exception as e:
+        logger.error(f"Error reading summary cache: {e}")
+        row = None
+
+    if row is None:
+        stats.misses += 1
+        metrics.increment("summary_cache", result="miss")
+        return None
+    stats.hits += 1
+    metrics.increment("summary_cache", result="hit")
+    return row[0]
+
+def put(key: str, model: str, summary: str):
+    if not Config.SUMMARY_CACHE_ENABLED or not summary:
+        return
+    try:
+        with session("summary_cache_put") as conn, conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO summary_cache (cache_key, model, summary_text)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (cache_key) DO UPDATE SET
+                    summary_text = EXCLUDED.summary_text,
+                    created_at = now(),
+                    last_used_at = now();
+            """, (key, model, summary))
+    except Exception as e:
+        logger.error(f"Error caching summary: {e}")
+
+def evict():
+    """Drop expired entries, then the least recently used beyond the size limit"""
+    if not Config.SUMMARY_CACHE_ENABLED:
+        return
+    with session("summary_cache_evict") as conn, conn.cursor() as cur:
+        cur.execute("""
+            DELETE FROM summary_cache
+            WHERE created_at <= CURRENT_TIMESTAMP - %s * INTERVAL '1 hour';
+        """, (Config.SUMMARY_CACHE_TTL_HOURS,))
+        expired = cur.rowcount
+        cur.execute("""
+            DELETE FROM summary_cache
+            WHERE cache_key IN (
+                SELECT cache_key FROM summary_cache
+                ORDER BY last_used_at DESC
+                OFFSET %s
+            );
+        """, (Config.SUMMARY_CACHE_MAX_ENTRIES,))
+        overflow = cur.rowcount
+    if expired or overflow:
+        logger.info(f"Evicted {expired} expired and {overflow} overflow cached summaries")
+
+def reset_stats():
+    stats.hits = 0
+    stats.misses = 0
+
+def log_stats():
+    if Config.SUMMARY_CACHE_ENABLED:
+        logger.info(f"Summary cache: {stats.hits} hits, {stats.misses} misses")
@@ -1,50 +1,103 @@
-import psycopg2
+import asyncio
 import openai
 import logging
 import os
+import random
 import time
 from datetime import datetime
+from itertools import groupby
+from typing import Dict, List, Optional
 from config import Config
+from db import session, using_duckdb
+from L0 import duckdb_storage
+from L1 import summary_cache
+from L1.rate_limiter import RateLimiter
+import metrics
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
-api_key = os.getenv('OPENAI_API_KEY')
-if not api_key:
-    raise ValueError("OPENAI_API_KEY environment variable is not set")
+_client = None
+_async_client = None
 
-client = openai.OpenAI(
-    api_key=api_key
-)
+MODEL = "gpt-3.5-turbo"
+MAX_TOKENS = 200
+SYSTEM_PROMPT = "You are a weather forecaster providing clear, concise 7-day weather summaries."
+USER_PROMPT_TEMPLATE = """Based on this 7-day weather forecast for {city}, create a brief, 
+                        natural-sounding summary highlighting the 7-day weather pattern, significant changes, 
+                        and notable conditions:
+
+                        {weather_text}
+
+                        Please provide a concise, human-friendly summary in 3-4 sentences."""
+
+def get_api_key() -> str:
+    api_key = os.getenv('OPENAI_API_KEY')
+    if not api_key:
+        raise ValueError("OPENAI_API_KEY environment variable is not set")
+    return api_key
+
+def get_client() -> openai.OpenAI:
+    """Client for sequential generation, created on first use"""
+    global _client
+    if _client is None:
+        _client = openai.OpenAI(api_key=get_api_key())
+    return _client
+
+def get_async_client() -> openai.AsyncOpenAI:
+    """Async client for concurrent generation; retries are handled here, not by the SDK"""
+    global _async_client
+    if _async_client is None:
+        _async_client = openai.AsyncOpenAI(api_key=get_api_key(), max_retries=0)
+    return _async_client
+
+async def close_async_client():
+    """Close the async client; its connections belong to the current event loop"""
+    global _async_client
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
 
 def create_summary_table():
     """Create table for weather summaries if it doesn't exist"""
-    conn = psycopg2.connect(Config.DATABASE_URL)
-    try:
+    with session("create_summary_table") as conn:
         with conn.cursor() as cur:
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS weather_summaries (
-                    id SERIAL PRIMARY KEY,
-                    city VARCHAR(50) NOT NULL,
-                    summary_date DATE NOT NULL,
-                    summary_text TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(city, summary_date)
-                );
-            """)
-            conn.commit()
-            logger.info("Summary table created/verified")
-    finally:
-        conn.close()
+            if using_duckdb():
+                duckdb_storage.create_summary_table(cur)
+            else:
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS weather_summaries (
+                        id SERIAL PRIMARY KEY,
+                        city VARCHAR(50) NOT NULL,
+                        summary_date DATE NOT NULL,
+                        summary_text TEXT NOT NULL,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        UNIQUE(city, summary_date)
+                    );
+                """)
+        summary_cache.create_cache_table(conn)
+        logger.info("Summary table created/verified")
+
+# Daily rows from the incrementally maintained aggregate table, shaped like the
+# hourly GROUP BY below: (date, avg_temp, total_precip, avg_wind, min_temp, max_temp)
+AGGREGATE_COLUMNS = "forecast_date, avg_temp, total_precip, avg_wind, min_temp, max_temp"
+AGGREGATE_WINDOW = "forecast_date >= CURRENT_DATE AND forecast_date < CURRENT_DATE + 7"
 
 def get_city_weather_data(city: str):
     """Get 7-day weather data for a city"""
-    conn = psycopg2.connect(Config.DATABASE_URL)
-    try:
+    with session("get_city_weather_data") as conn:
         with conn.cursor() as cur:
+            if Config.DAILY_AGGREGATES:
+                cur.execute(f"""
+                    SELECT {AGGREGATE_COLUMNS}
+                    FROM daily_weather_aggregates
+                    WHERE city = %s
+                    AND {AGGREGATE_WINDOW}
+                    ORDER BY forecast_date;
+                """, (city,))
+                data = cur.fetchall()
+                logger.info(f"Retrieved {len(data)} daily weather records for {city}")
+                return data
+
             cur.execute("""
                 SELECT 
                     DATE(timestamp) as date,
@@ -62,8 +115,73 @@ def get_city_weather_data(city: str):
             data = cur.fetchall()
             logger.info(f"Retrieved {len(data)} daily weather records for {city}")
             return data
-    finally:
-        conn.close()
+
+def get_all_cities_weather_data() -> Dict[str, List[tuple]]:
+    """
+    Get 7-day weather data for every city in a single query.
+
+    Rows are streamed through a server-side cursor and grouped by city,
+    each row shaped like get_city_weather_data's.
+    """
+    with session("get_all_cities_weather_data") as conn:
+        with conn.cursor(name="all_cities_weather_data") as cur:
+            cur.itersize = Config.BATCH_SIZE
+            if Config.DAILY_AGGREGATES:
+                cur.execute(f"""
+                    SELECT city, {AGGREGATE_COLUMNS}
+                    FROM daily_weather_aggregates
+                    WHERE {AGGREGATE_WINDOW}
+                    ORDER BY city, forecast_date;
+                """)
+            else:
+                cur.execute("""
+                    SELECT 
+                        city,
+                        DATE(timestamp) as date,
+                        AVG(temperature) as avg_temp,
+                        SUM(precipitation) as total_precip,
+                        AVG(windspeed) as avg_wind,
+                        MIN(temperature) as min_temp,
+                        MAX(temperature) as max_temp
+                    FROM weather_forecasts
+                    WHERE timestamp BETWEEN CURRENT_DATE AND CURRENT_DATE + INTERVAL '7 days'
+                    GROUP BY city, DATE(timestamp)
+                    ORDER BY city, DATE(timestamp);
+                """)
+            data = {
+                city: [row[1:] for row in rows]
+                for city, rows in groupby(cur, key=lambda row: row[0])
+            }
+    logger.info(f"Retrieved daily weather records for {len(data)} cities")
+    return data
+
+def format_weather_text(weather_data) -> str:
+    """Render daily aggregates as the prompt's forecast table"""
+    return "\n".join([
+        f"Date: {row[0].strftime('%Y-%m-%d')}, "
+        f"Avg Temp: {row[1]:.1f}°C (Min: {row[4]:.1f}°C, Max: {row[5]:.1f}°C), "
+        f"Total Precip: {row[2]:.1f}mm, Avg Wind: {row[3]:.1f}km/h"
+        for row in weather_data
+    ])
+
+def build_messages(city: str, weather_text: str) -> list:
+    return [
+        {
+            "role": "system", 
+            "content": SYSTEM_PROMPT
+        },
+        {
+            "role": "user",
+            "content": USER_PROMPT_TEMPLATE.format(city=city, weather_text=weather_text)
+        }
+    ]
+
+def record_usage(response):
+    """Count a completion's prompt and completion tokens"""
+    if response.usage is None:
+        return
+    metrics.increment("llm_tokens", response.usage.prompt_tokens, kind="prompt")
+    metrics.increment("llm_tokens", response.usage.completion_tokens, kind="completion")
 
 def generate_summary(city: str, weather_data, base_delay=5, max_retries=4):
     """
@@ -81,12 +199,12 @@ def generate_summary(city: str, weather_data, base_delay=5, max_retries=4):
         logger.warning(f"No weather data available for {city}")
         return None
         
-    weather_text = "\n".join([
-        f"Date: {row[0].strftime('%Y-%m-%d')}, "
-        f"Avg Temp: {row[1]:.1f}°C (Min: {row[4]:.1f}°C, Max: {row[5]:.1f}°C), "
-        f"Total Precip: {row[2]:.1f}mm, Avg Wind: {row[3]:.1f}km/h"
-        for row in weather_data
-    ])
+    weather_text = format_weather_text(weather_data)
+    key = summary_cache.cache_key(MODEL, SYSTEM_PROMPT + USER_PROMPT_TEMPLATE, city, weather_text)
+    cached = summary_cache.get_cached(key)
+    if cached:
+        logger.info(f"Using cached summary for {city}")
+        return cached
     
     for attempt in range(max_retries):
         try:
@@ -94,31 +212,20 @@ def generate_summary(city: str, weather_data, base_delay=5, max_retries=4):
             if attempt > 0:
                 delay = base_delay * (2 ** attempt)
                 logger.info(f"Rate limit reached. Waiting {delay} seconds before attempt {attempt + 1}/{max_retries}")
+                metrics.increment("llm_retries", model=MODEL)
                 time.sleep(delay)
             
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {
-                        "role": "system", 
-                        "content": "You are a weather forecaster providing clear, concise 7-day weather summaries."
-                    },
-                    {
-                        "role": "user",
-                        "content": f"""Based on this 7-day weather forecast for {city}, create a brief, 
-                        natural-sounding summary highlighting the 7-day weather pattern, significant changes, 
-                        and notable conditions:
-
-                        {weather_text}
-
-                        Please provide a concise, human-friendly summary in 3-4 sentences."""
-                    }
-                ],
-                max_tokens=200,
-                temperature=0.7
-            )
+            with metrics.span("llm_request", model=MODEL):
+                response = get_client().chat.completions.create(
+                    model=MODEL,
+                    messages=build_messages(city, weather_text),
+                    max_tokens=MAX_TOKENS,
+                    temperature=0.7
+                )
+            record_usage(response)
             summary = response.choices[0].message.content.strip()
             logger.info(f"Generated summary for {city}")
+            summary_cache.put(key, MODEL, summary)
             
             # Add fixed delay after successful call to prevent rate limits
             time.sleep(1)
@@ -127,68 +234,213 @@ def generate_summary(city: str, weather_data, base_delay=5, max_retries=4):
             return summary
             
         except openai.RateLimitError as e:
+            metrics.increment("llm_errors", model=MODEL, error="rate_limit")
             if attempt == max_retries - 1:
                 logger.error(f"Rate limit reached for {city} after {max_retries} attempts")
                 return None
             continue
             
         except Exception as e:
+            metrics.increment("llm_errors", model=MODEL, error=type(e).__name__)
             logger.error(f"Error generating summary for {city}: {e}")
             return None
 
-def save_summary(city: str, summary: str):
-    """Save the generated summary to database"""
+def save_summary(city: str, summary: str) -> bool:
+    """Save the generated summary to database, returning whether it was stored"""
     if not summary:
-        return
+        return False
         
-    conn = psycopg2.connect(Config.DATABASE_URL)
     try:
-        with conn.cursor() as cur:
+        with session("save_summary") as conn, conn.cursor() as cur:
             cur.execute("""
                 INSERT INTO weather_summaries (city, summary_date, summary_text)
                 VALUES (%s, CURRENT_DATE, %s)
                 ON CONFLICT (city, summary_date) 
                 DO UPDATE SET 
                     summary_text = EXCLUDED.summary_text,
-                    created_at = CURRENT_TIMESTAMP;
+                    created_at = now();
             """, (city, summary))
-            conn.commit()
-            logger.info(f"Saved summary for {city}")
+        logger.info(f"Saved summary for {city}")
+        return True
     except Exception as e:
-        conn.rollback()
         logger.error(f"Error saving summary for {city}: {e}")
+        return False
+
+def check_failures(failed: List[str], total: int):
+    """
+    Fail the stage when any city was left without a summary.
+
+    generate_summary logs and returns None instead of raising, so without
+    this the stage would be recorded as done and skipped on the next run.
+    Summaries that did succeed are cached, so a retry only calls the LLM
+    for the failed cities.
+    """
+    if failed:
+        shown = ", ".join(sorted(failed)[:10]) + (", ..." if len(failed) > 10 else "")
+        raise RuntimeError(f"No summary for {len(failed)} of {total} cities: {shown}")
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Seconds to wait from a rate-limit response's Retry-After headers, if any"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = response.headers.get(header)
+        if value is None:
+            continue
+        try:
+            return float(value) * scale
+        except ValueError:
+            continue
+    return None
+
+async def generate_summary_async(
+    city: str,
+    weather_data,
+    limiter: RateLimiter,
+    base_delay=5,
+    max_retries=4
+):
+    """
+    Generate a weather summary without blocking other cities.
+
+    Each call waits for request and token budget from the shared limiter.
+    Rate-limited calls sleep for the server's Retry-After, falling back
+    to jittered exponential backoff, before retrying this city only.
+    """
+    if not weather_data:
+        logger.warning(f"No weather data available for {city}")
+        return None
+
+    weather_text = format_weather_text(weather_data)
+    key = summary_cache.cache_key(MODEL, SYSTEM_PROMPT + USER_PROMPT_TEMPLATE, city, weather_text)
+    cached = await asyncio.to_thread(summary_cache.get_cached, key)
+    if cached:
+        logger.info(f"Using cached summary for {city}")
+        return cached
+
+    messages = build_messages(city, weather_text)
+    # Rough prompt size (~4 characters per token) plus the completion budget
+    reserved = sum(len(m["content"]) for m in messages) / 4 + MAX_TOKENS
+
+    for attempt in range(max_retries):
+        try:
+            with metrics.span("llm_rate_limit_wait", model=MODEL):
+                await limiter.acquire(reserved)
+            with metrics.span("llm_request", model=MODEL):
+                response = await get_async_client().chat.completions.create(
+                    model=MODEL,
+                    messages=messages,
+                    max_tokens=MAX_TOKENS,
+                    temperature=0.7
+                )
+            record_usage(response)
+            if response.usage is not None:
+                limiter.reconcile(reserved, response.usage.total_tokens)
+            summary = response.choices[0].message.content.strip()
+            logger.info(f"Generated summary for {city}")
+            await asyncio.to_thread(summary_cache.put, key, MODEL, summary)
+            return summary
+
+        except openai.RateLimitError as e:
+            metrics.increment("llm_errors", model=MODEL, error="rate_limit")
+            if attempt == max_retries - 1:
+                logger.error(f"Rate limit reached for {city} after {max_retries} attempts")
+                return None
+            metrics.increment("llm_retries", model=MODEL)
+            delay = _retry_after(e)
+            if delay is None:
+                delay = base_delay * (2 ** attempt) * random.uniform(0.5, 1.5)
+            logger.info(
+                f"Rate limit reached for {city}. Waiting {delay:.1f} seconds "
+                f"before attempt {attempt + 2}/{max_retries}"
+            )
+            await asyncio.sleep(delay)
+
+        except Exception as e:
+            metrics.increment("llm_errors", model=MODEL, error=type(e).__name__)
+            logger.error(f"Error generating summary for {city}: {e}")
+            return None
+
+async def generate_weather_summaries_async(concurrency: int = Config.SUMMARY_CONCURRENCY):
+    """Generate and save summaries for all cities with bounded concurrency"""
+    create_summary_table()
+    summary_cache.evict()
+    summary_cache.reset_stats()
+
+    weather_by_city = await asyncio.to_thread(get_all_cities_weather_data)
+    cities = list(weather_by_city)
+    logger.info(f"Found {len(cities)} cities to process")
+
+    limiter = RateLimiter(
+        Config.SUMMARY_REQUESTS_PER_MINUTE,
+        Config.SUMMARY_TOKENS_PER_MINUTE
+    )
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def process(city: str) -> bool:
+        async with semaphore:
+            logger.info(f"Processing {city}")
+            weather_data = weather_by_city[city]
+            stored = True
+            if weather_data:
+                summary = await generate_summary_async(city, weather_data, limiter)
+                stored = bool(summary) and await asyncio.to_thread(save_summary, city, summary)
+            logger.info(f"Completed processing {city}")
+            return stored
+
+    try:
+        results = await asyncio.gather(*(process(city) for city in cities), return_exceptions=True)
     finally:
-        conn.close()
+        await close_async_client()
+    failed = []
+    for city, result in zip(cities, results):
+        if isinstance(result, Exception):
+            logger.error(f"Failed to process {city}: {result}")
+        if result is not True:
+            failed.append(city)
+    summary_cache.log_stats()
+    check_failures(failed, len(cities))
 
 def generate_weather_summaries():
     """Main function to generate and save weather summaries"""
+    # Fail before any work rather than once per city
+    get_api_key()
+
+    if Config.ASYNC_SUMMARIES:
+        try:
+            asyncio.run(generate_weather_summaries_async())
+        except Exception as e:
+            logger.error(f"Error in generate_weather_summaries: {e}")
+            raise
+        return
+
     try:
         create_summary_table()
+        summary_cache.evict()
+        summary_cache.reset_stats()
         
-        conn = psycopg2.connect(Config.DATABASE_URL)
-        try:
-            with conn.cursor() as cur:
-                cur.execute("SELECT DISTINCT city FROM weather_forecasts;")
-                cities = [row[0] for row in cur.fetchall()]
-                logger.info(f"Found {len(cities)} cities to process")
-        finally:
-            conn.close()
+        weather_by_city = get_all_cities_weather_data()
+        logger.info(f"Found {len(weather_by_city)} cities to process")
         
-        for city in cities:
+        failed = []
+        for city, weather_data in weather_by_city.items():
             logger.info(f"Processing {city}")
             
-            weather_data = get_city_weather_data(city)
-            
             if weather_data:
                 summary = generate_summary(city, weather_data)
-                if summary:
-                    save_summary(city, summary)
+                if not (summary and save_summary(city, summary)):
+                    failed.append(city)
             
             logger.info(f"Completed processing {city}")
+        
+        summary_cache.log_stats()
+        check_failures(failed, len(weather_by_city))
             
     except Exception as e:
         logger.error(f"Error in generate_weather_summaries: {e}")
         raise
 
 if __name__ == "__main__":
+    metrics.configure_logging()
     generate_weather_summaries()
@@ -0,0 +1,91 @@
+import argparse
+import json
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import unquote, urlparse
+from config import Config
+from L2.read_api import ForecastReader
+import metrics
+
+logger = logging.getLogger(__name__)
+
+class ReadApiHandler(BaseHTTPRequestHandler):
+    """
+    GET /forecast/<city>   precomputed forecast, rain days and summary
+    GET /cities            cities with a payload
+    GET /healthz           generation being served
+    """
+    # Keep-alive: clients reuse connections across requests
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out as separate writes; don't let Nagle hold the body back
+    disable_nagle_algorithm = True
+    reader: ForecastReader
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def send_body(self, body: bytes, status: int = 200, etag: Optional[str] = None):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if etag:
+            self.send_header("ETag", f'"{etag}"')
+            self.send_header("Cache-Control", f"max-age={Config.SERVING_MAX_AGE}")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path.startswith("/forecast/"):
+            self.forecast(unquote(path[len("/forecast/"):]))
+        elif path == "/cities":
+            self.send_body(self.reader.cities_body)
+        elif path == "/healthz":
+            self.send_body(json.dumps({"generation": self.reader.generation}).encode())
+        else:
+            self.send_body(b'{"error":"not found"}', status=404)
+
+    def forecast(self, city: str):
+        payload = self.reader.get(city)
+        if payload is None:
+            metrics.increment("read_api_responses", status=404)
+            self.send_body(b'{"error":"unknown city"}', status=404)
+            return
+        if self.headers.get("If-None-Match") == f'"{payload.etag}"':
+            metrics.increment("read_api_responses", status=304)
+            self.send_response(304)
+            self.send_header("ETag", f'"{payload.etag}"')
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        metrics.increment("read_api_responses", status=200)
+        self.send_body(payload.body, etag=payload.etag)
+
+def make_server(
+    reader: ForecastReader,
+    host: str = Config.SERVING_HOST,
+    port: int = Config.SERVING_PORT
+) -> ThreadingHTTPServer:
+    handler = type("BoundReadApiHandler", (ReadApiHandler,), {"reader": reader})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+def serve(host: str = Config.SERVING_HOST, port: int = Config.SERVING_PORT):
+    reader = ForecastReader().start()
+    server = make_server(reader, host, port)
+    logger.info(f"Serving forecasts on http://{host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        reader.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve precomputed city forecasts over HTTP")
+    parser.add_argument("--host", default=Config.SERVING_HOST)
+    parser.add_argument("--port", type=int, default=Config.SERVING_PORT)
+    args = parser.parse_args()
+    metrics.configure_logging()
+    serve(args.host, args.port)
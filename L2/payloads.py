@@ -0,0 +1,155 @@
+import hashlib
+import json
+import logging
+from datetime import date, datetime
+from decimal import Decimal
+from itertools import groupby
+from typing import Dict, List, Tuple
+from psycopg2.extras import execute_values
+from config import Config
+from db import session
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Payload writers NOTIFY this channel with the new generation after committing
+CHANNEL = "city_payloads"
+
+def create_payloads_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS city_payloads (
+            city VARCHAR(100) PRIMARY KEY,
+            generation BIGINT NOT NULL,
+            body BYTEA NOT NULL,
+            etag CHAR(64) NOT NULL,
+            built_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE SEQUENCE IF NOT EXISTS city_payload_generation_seq;
+    """)
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+def encode(payload: dict) -> bytes:
+    return json.dumps(payload, separators=(",", ":"), default=_json_default).encode()
+
+def _hourly_forecasts(cur) -> Dict[str, dict]:
+    """Next 7 days of hourly values per city, as Open-Meteo style column lists"""
+    cur.execute("""
+        SELECT city, timestamp, temperature, precipitation, windspeed
+        FROM weather_forecasts
+        WHERE timestamp >= date_trunc('hour', LOCALTIMESTAMP)
+        AND timestamp < CURRENT_DATE + INTERVAL '7 days'
+        ORDER BY city, timestamp;
+    """)
+    forecasts = {}
+    for city, rows in groupby(cur, key=lambda row: row[0]):
+        rows = list(rows)
+        forecasts[city] = {
+            "time": [row[1] for row in rows],
+            "temperature": [row[2] for row in rows],
+            "precipitation": [row[3] for row in rows],
+            "windspeed": [row[4] for row in rows]
+        }
+    return forecasts
+
+def _rain_days(cur) -> Dict[str, List[dict]]:
+    cur.execute("""
+        SELECT
+            city, forecast_date, rain_start, rain_end, total_rain,
+            max_rain_intensity, avg_temperature, avg_wind, rain_episodes
+        FROM daily_rain_forecasts
+        WHERE forecast_date >= CURRENT_DATE
+        AND forecast_date < CURRENT_DATE + 7
+        ORDER BY city, forecast_date;
+    """)
+    return {
+        city: [
+            {
+                "date": row[1],
+                "rain_start": row[2],
+                "rain_end": row[3],
+                "total_rain": row[4],
+                "max_intensity": row[5],
+                "avg_temperature": row[6],
+                "avg_wind": row[7],
+                "episodes": row[8]
+            }
+            for row in rows
+        ]
+        for city, rows in groupby(cur.fetchall(), key=lambda row: row[0])
+    }
+
+def _summaries(cur) -> Dict[str, Tuple[date, str]]:
+    """Most recent summary per city, if it is from today"""
+    cur.execute("""
+        SELECT city, summary_date, summary_text
+        FROM weather_summaries
+        WHERE summary_date = CURRENT_DATE;
+    """)
+    return {row[0]: (row[1], row[2]) for row in cur.fetchall()}
+
+def _table_exists(cur, table: str) -> bool:
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL", (table,))
+    return cur.fetchone()[0]
+
+def build_payloads() -> int:
+    """
+    Serialize one JSON document per city for the read API.
+
+    Each document holds the city's hourly forecast, rain days and today's
+    summary. All rows are replaced under a new generation in one
+    transaction; NOTIFY is delivered on commit, so listening readers
+    reload only once the whole generation is visible. Returns the
+    number of cities written.
+    """
+    with session("build_payloads") as conn, conn.cursor() as cur:
+        create_payloads_table(cur)
+        forecasts = _hourly_forecasts(cur)
+        rain_days = _rain_days(cur) if _table_exists(cur, "daily_rain_forecasts") else {}
+        summaries = _summaries(cur) if _table_exists(cur, "weather_summaries") else {}
+
+        cur.execute("SELECT nextval('city_payload_generation_seq'), LOCALTIMESTAMP")
+        generation, built_at = cur.fetchone()
+
+        rows = []
+        with metrics.span("payload_encode"):
+            for city in sorted(set(forecasts) | set(rain_days) | set(summaries)):
+                summary = summaries.get(city)
+                body = encode({
+                    "city": city,
+                    "generation": generation,
+                    "built_at": built_at,
+                    "summary": summary[1] if summary else None,
+                    "summary_date": summary[0] if summary else None,
+                    "hourly": forecasts.get(city, {}),
+                    "rain_days": rain_days.get(city, [])
+                })
+                rows.append((city, generation, body, hashlib.sha256(body).hexdigest()))
+
+        execute_values(cur, """
+            INSERT INTO city_payloads (city, generation, body, etag)
+            VALUES %s
+            ON CONFLICT (city) DO UPDATE SET
+                generation = EXCLUDED.generation,
+                body = EXCLUDED.body,
+                etag = EXCLUDED.etag,
+                built_at = CURRENT_TIMESTAMP
+        """, rows, page_size=Config.BATCH_SIZE)
+        cur.execute("DELETE FROM city_payloads WHERE generation < %s", (generation,))
+        cur.execute("SELECT pg_notify(%s, %s)", (CHANNEL, str(generation)))
+
+    metrics.increment("payloads_built", len(rows))
+    logger.info(
+        f"Built payload generation {generation} for {len(rows)} cities "
+        f"({sum(len(row[2]) for row in rows) / 1024:.0f} KiB)"
+    )
+    return len(rows)
+
+if __name__ == "__main__":
+    metrics.configure_logging()
+    build_payloads()
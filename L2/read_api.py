@@ -0,0 +1,192 @@
+import json
+import logging
+import select
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Optional
+import psycopg2
+from config import Config
+from db import session
+from L2.payloads import CHANNEL
+import metrics
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class Payload:
+    city: str
+    generation: int
+    body: bytes
+    etag: str
+
+class PayloadCache:
+    """
+    Bounded LRU of per-city payloads.
+
+    Only cities that have a payload are cached; ForecastReader answers
+    unknown cities from its city set, so they cannot evict real entries.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Payload]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, city: str) -> Optional[Payload]:
+        with self._lock:
+            payload = self._entries.get(city)
+            if payload is not None:
+                self._entries.move_to_end(city)
+            return payload
+
+    def put(self, city: str, payload: Payload):
+        with self._lock:
+            self._entries[city] = payload
+            self._entries.move_to_end(city)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class ForecastReader:
+    """
+    Per-city forecast payloads served from memory.
+
+    start() loads the current generation, up to the cache size, and
+    starts a listener thread on its own connection. When build_payloads
+    commits a new generation it NOTIFYs, and the listener swaps in a
+    freshly loaded cache, so reads never wait on Postgres. The listener
+    also polls every refresh_interval seconds in case a notification was
+    missed while reconnecting. Only known cities that did not fit in the
+    cache are read from the database on demand; unknown ones are answered
+    from the generation's city set without touching cache or database.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = Config.SERVING_CACHE_SIZE,
+        refresh_interval: float = Config.SERVING_REFRESH_INTERVAL
+    ):
+        self.max_entries = max_entries
+        self.refresh_interval = refresh_interval
+        self.generation: Optional[int] = None
+        self.cache = PayloadCache(max_entries)
+        self.cities: FrozenSet[str] = frozenset()
+        self.cities_body = b"[]"
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._listener: Optional[threading.Thread] = None
+
+    def start(self) -> "ForecastReader":
+        self.reload()
+        self._listener = threading.Thread(target=self._listen, name="payload-listener", daemon=True)
+        self._listener.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._listener is not None:
+            self._listener.join()
+
+    def get(self, city: str) -> Optional[Payload]:
+        if city not in self.cities:
+            metrics.increment("read_api_cache", result="unknown")
+            return None
+        payload = self.cache.get(city)
+        if payload is not None:
+            metrics.increment("read_api_cache", result="hit")
+            return payload
+
+        metrics.increment("read_api_cache", result="miss")
+        payload = self._load_one(city)
+        # A reload may have swapped the cache while we were reading
+        if payload is not None and (self.generation is None or payload.generation >= self.generation):
+            self.cache.put(city, payload)
+        return payload
+
+    def reload(self, generation: Optional[int] = None) -> bool:
+        """Load the latest generation into a new cache; False if it is already current"""
+        with self._reload_lock:
+            with session("read_api_reload") as conn, conn.cursor() as cur:
+                cur.execute("SELECT to_regclass('city_payloads') IS NOT NULL")
+                if not cur.fetchone()[0]:
+                    return False
+                cur.execute("SELECT MAX(generation) FROM city_payloads")
+                latest = cur.fetchone()[0]
+                if latest is None or latest == self.generation:
+                    return False
+                cur.execute("SELECT city FROM city_payloads ORDER BY city")
+                cities = [row[0] for row in cur.fetchall()]
+                cur.execute("""
+                    SELECT city, generation, body, etag FROM city_payloads
+                    ORDER BY city
+                    LIMIT %s;
+                """, (self.max_entries,))
+                cache = PayloadCache(self.max_entries)
+                for city, row_generation, body, etag in cur.fetchall():
+                    cache.put(city, Payload(city, row_generation, bytes(body), etag))
+
+            self.cities = frozenset(cities)
+            self.cities_body = json.dumps(cities, separators=(",", ":")).encode()
+            self.cache = cache
+            self.generation = latest
+        metrics.increment("read_api_reloads")
+        logger.info(f"Serving payload generation {latest}: {len(cities)} cities, {len(cache)} cached")
+        return True
+
+    @staticmethod
+    def _load_one(city: str) -> Optional[Payload]:
+        with session("read_api_get") as conn, conn.cursor() as cur:
+            cur.execute(
+                "SELECT generation, body, etag FROM city_payloads WHERE city = %s", (city,)
+            )
+            row = cur.fetchone()
+        if row is None:
+            return None
+        return Payload(city, row[0], bytes(row[1]), row[2])
+
+    def _listen(self):
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(Config.DATABASE_URL)
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {CHANNEL};")
+                # Anything committed before LISTEN took effect is picked up here
+                self.reload()
+                checked = time.monotonic()
+                while not self._stop.is_set():
+                    # Short waits so stop() is not held up by refresh_interval
+                    ready, _, _ = select.select([conn], [], [], min(self.refresh_interval, 1.0))
+                    if ready:
+                        conn.poll()
+                    if conn.notifies or time.monotonic() - checked >= self.refresh_interval:
+                        conn.notifies.clear()
+                        self.reload()
+                        checked = time.monotonic()
+            except Exception as e:
+                logger.error(f"Payload listener error, reconnecting: {e}")
+                self._stop.wait(min(self.refresh_interval, 5.0))
+            finally:
+                if conn is not None:
+                    conn.close()
+
+_reader: Optional[ForecastReader] = None
+_reader_lock = threading.Lock()
+
+def get_reader() -> ForecastReader:
+    """Process-wide reader, started on first use"""
+    global _reader
+    with _reader_lock:
+        if _reader is None:
+            _reader = ForecastReader().start()
+        return _reader
+
+def get_forecast(city: str) -> Optional[Dict]:
+    """Decoded payload for one city, or None if it has none"""
+    payload = get_reader().get(city)
+    return json.loads(payload.body) if payload is not None else None
@@ -0,0 +1,160 @@
+import json
+import math
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+from urllib.parse import parse_qs, urlparse
+from config import City
+
+FORECAST_HOURS = 7 * 24
+
+def synthetic_cities(count: int) -> List[City]:
+    """
+    Deterministic city set spread over central Europe.
+
+    Cities are laid out on a jittered grid about 0.05 degrees apart, so
+    large sets still mostly land in distinct model grid cells.
+    """
+    side = max(1, math.ceil(math.sqrt(count)))
+    cities = []
+    for i in range(count):
+        row, col = divmod(i, side)
+        jitter = (zlib.crc32(str(i).encode()) % 1000) / 100000
+        cities.append(City(
+            f"City{i:05d}",
+            round(44.0 + row * 0.05 + jitter, 6),
+            round(5.0 + col * 0.05 + jitter, 6)
+        ))
+    return cities
+
+def synthetic_hourly(latitude: float, longitude: float, start: datetime) -> dict:
+    """Open-Meteo shaped `hourly` block with location-dependent weather"""
+    seed = zlib.crc32(f"{latitude:.4f},{longitude:.4f}".encode()) % 1000
+    times, temperature, precipitation, windspeed = [], [], [], []
+    for hour in range(FORECAST_HOURS):
+        times.append((start + timedelta(hours=hour)).strftime("%Y-%m-%dT%H:%M"))
+        temperature.append(round(12 + 8 * math.sin((hour + seed) / 24 * 2 * math.pi), 1))
+        rain = math.sin((hour + seed) / 9)
+        precipitation.append(round(max(0.0, rain) * 1.5, 1) if seed % 3 else 0.0)
+        windspeed.append(round(5 + (hour + seed) % 11 * 1.3, 1))
+    return {
+        "time": times,
+        "temperature_2m": temperature,
+        "precipitation": precipitation,
+        "windspeed_10m": windspeed
+    }
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Concurrent fetches open many connections at once
+    request_queue_size = 1024
+
+class FakeService:
+    """Local HTTP server running in a background thread"""
+
+    def __init__(self, handler: type, latency: float = 0.0):
+        self.requests = 0
+        self.latency = latency
+        self._lock = threading.Lock()
+        service = self
+
+        class Handler(handler):
+            def log_message(self, format, *args):
+                pass
+
+            def count(self):
+                with service._lock:
+                    service.requests += 1
+                if service.latency:
+                    time.sleep(service.latency)
+
+        self._server = _Server(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+class _JsonHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def send_json(self, payload, status: int = 200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class OpenMeteoHandler(_JsonHandler):
+    """Answers /v1/forecast like Open-Meteo, including comma-separated locations"""
+
+    def do_GET(self):
+        self.count()
+        query = parse_qs(urlparse(self.path).query)
+        latitudes = query.get("latitude", [""])[0].split(",")
+        longitudes = query.get("longitude", [""])[0].split(",")
+        if len(latitudes) != len(longitudes) or not latitudes[0]:
+            self.send_json({"error": True, "reason": "Invalid coordinates"}, status=400)
+            return
+
+        start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        locations = [
+            {
+                "latitude": float(lat),
+                "longitude": float(lon),
+                "hourly": synthetic_hourly(float(lat), float(lon), start)
+            }
+            for lat, lon in zip(latitudes, longitudes)
+        ]
+        self.send_json(locations if len(locations) > 1 else locations[0])
+
+class ChatCompletionsHandler(_JsonHandler):
+    """Minimal OpenAI chat completions endpoint returning a canned summary"""
+
+    def do_POST(self):
+        self.count()
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        prompt = " ".join(m.get("content", "") for m in request.get("messages", []))
+        prompt_tokens = len(prompt) // 4
+        completion_tokens = 60
+        self.send_json({
+            "id": "chatcmpl-benchmark",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "benchmark"),
+            "choices": [{
+                "index": 0,
+                "message": {
+                    "role": "assistant",
+                    "content": "Mild and changeable week with showers midweek and a breezy finish."
+                },
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        })
+
+def open_meteo(latency: float = 0.0) -> FakeService:
+    """Fake Open-Meteo; the forecast endpoint is at `<url>/v1/forecast`"""
+    return FakeService(OpenMeteoHandler, latency)
+
+def chat_completions(latency: float = 0.0) -> FakeService:
+    """Stub LLM; use `<url>/v1` as the OpenAI base URL"""
+    return FakeService(ChatCompletionsHandler, latency)
@@ -0,0 +1,50 @@
+import os
+import resource
+import sys
+import threading
+import time
+
+def current_rss() -> int:
+    """Resident set size in bytes (0 where /proc is unavailable)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+def max_rss() -> int:
+    """Process-lifetime peak RSS in bytes"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+class RssSampler:
+    """
+    Track peak RSS over a block by polling in a background thread.
+
+    getrusage only reports the lifetime peak, so per-stage peaks are
+    sampled from /proc; where that is missing the lifetime peak is used.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, current_rss())
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self.peak = current_rss()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+        if not self.peak:
+            self.peak = max_rss()
@@ -0,0 +1,139 @@
+"""
+In-memory forecast representation benchmark.
+
+Decodes the same synthetic hourly payloads into a list of WeatherForecast
+dataclasses, a list of slotted ForecastRecords and one ForecastStore, and
+reports the traced allocation per hourly record for each, plus the time
+to build the container and to turn it back into database row tuples.
+
+    python -m benchmarks.memory --cities 6000 --output benchmarks/results
+
+No database or network access is needed.
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple
+
+import metrics
+from benchmarks.fakes import synthetic_cities, synthetic_hourly
+from L0.models import ForecastBatch, ForecastRecord, ForecastStore, checked_values
+from L0.weather_client import WeatherClient
+
+logger = logging.getLogger("benchmarks.memory")
+
+def build_dataclasses(payloads: List[Tuple]) -> List:
+    forecasts = []
+    for city, hourly in payloads:
+        forecasts.extend(WeatherClient._parse_hourly(city, hourly))
+    return forecasts
+
+def build_records(payloads: List[Tuple]) -> List[ForecastRecord]:
+    records = []
+    for city, hourly in payloads:
+        for i, time_str in enumerate(hourly["time"]):
+            records.append(ForecastRecord(
+                city.name,
+                datetime.fromisoformat(time_str),
+                *checked_values(
+                    hourly["temperature_2m"][i],
+                    hourly["precipitation"][i],
+                    hourly["windspeed_10m"][i]
+                )
+            ))
+    return records
+
+def build_store(payloads: List[Tuple]) -> ForecastStore:
+    store = ForecastStore()
+    for city, hourly in payloads:
+        store.extend_batch(ForecastBatch.from_hourly(city.name, hourly))
+    return store
+
+def measure(build: Callable[[], object]) -> Tuple[object, Dict[str, float]]:
+    """Build a container, returning it with its traced size and build time"""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    container = build()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return container, {"bytes": size, "peak_bytes": peak, "build_seconds": elapsed}
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--cities", type=int, default=6000,
+                        help="synthetic cities, 168 hourly records each (default: 6000)")
+    parser.add_argument("--output", help="directory for a JSON results file")
+    args = parser.parse_args(argv)
+    metrics.configure_logging()
+
+    start = datetime.now().replace(minute=0, second=0, microsecond=0)
+    payloads = [
+        (city, synthetic_hourly(city.latitude, city.longitude, start))
+        for city in synthetic_cities(args.cities)
+    ]
+
+    builders = {
+        "dataclass": lambda: build_dataclasses(payloads),
+        "slots": lambda: build_records(payloads),
+        "store": lambda: build_store(payloads),
+    }
+    results = {}
+    expected = None
+    for name, build in builders.items():
+        container, result = measure(build)
+        records = len(container)
+        to_rows = time.perf_counter()
+        if isinstance(container, ForecastStore):
+            rows = container.to_rows()
+        else:
+            rows = [(f.city, f.timestamp, f.temperature, f.precipitation, f.windspeed) for f in container]
+        result["to_rows_seconds"] = time.perf_counter() - to_rows
+        # Every representation must hand the database exactly the same rows
+        if expected is None:
+            expected = rows
+        elif rows != expected:
+            logger.error(f"{name} rows differ from WeatherForecast rows")
+            return 1
+        results[name] = {
+            "records": records,
+            "bytes_per_record": round(result["bytes"] / records, 1),
+            "total_mb": round(result["bytes"] / 2 ** 20, 1),
+            "build_seconds": round(result["build_seconds"], 3),
+            "to_rows_seconds": round(result["to_rows_seconds"], 3),
+        }
+        logger.info(
+            f"{name:>10}: {records} records, {results[name]['bytes_per_record']:7.1f} bytes/record, "
+            f"build {results[name]['build_seconds']:.2f}s, to_rows {results[name]['to_rows_seconds']:.2f}s"
+        )
+        del container, rows
+
+    ratio = results["dataclass"]["bytes_per_record"] / results["store"]["bytes_per_record"]
+    logger.info(f"ForecastStore uses {ratio:.1f}x less memory per record than WeatherForecast")
+
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+        path = os.path.join(
+            args.output, f"memory-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+        )
+        with open(path, "w") as f:
+            json.dump({
+                "started_at": datetime.now().isoformat(timespec="seconds"),
+                "python": sys.version.split()[0],
+                "cities": args.cities,
+                "representations": results,
+                "dataclass_to_store_ratio": round(ratio, 1),
+            }, f, indent=2)
+        logger.info(f"Results written to {path}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
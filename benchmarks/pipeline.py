@@ -0,0 +1,260 @@
+"""
+Offline pipeline benchmark.
+
+Runs the ETL, data cleaning, summary and rain stages against a local
+Postgres (DATABASE_URL), a fake Open-Meteo server and a stub LLM
+endpoint, for synthetic city sets of increasing size. Per-stage wall
+time, rows/sec, peak RSS and query counts are printed and written as
+JSON; --compare flags stages slower than a previous results file.
+
+    DATABASE_URL=postgresql://localhost/weather_bench \\
+        python -m benchmarks.pipeline --cities 8,100,1000,10000 --reset
+
+Feature flags are read from the environment as usual and recorded in
+the results. The synchronous summary path waits a second per city, so
+large sets want ASYNC_SUMMARIES=true and a generous
+SUMMARY_REQUESTS_PER_MINUTE.
+
+--reset truncates the pipeline tables before each city set; only use
+it against a scratch database.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from benchmarks import fakes
+from benchmarks.instrumentation import RssSampler
+import metrics
+
+STAGES = ["etl", "cleaning", "summaries", "rain"]
+
+PIPELINE_TABLES = [
+    "weather_forecasts",
+    "forecast_content_hashes",
+    "daily_weather_aggregates",
+    "cleaning_watermarks",
+    "weather_summaries",
+    "summary_cache",
+    "daily_rain_forecasts",
+]
+
+# Never written to results files
+SECRET_SETTINGS = {"DATABASE_URL", "OPENAI_API_KEY"}
+
+logger = logging.getLogger("benchmarks.pipeline")
+
+def config_snapshot() -> dict:
+    from config import Config
+    return {
+        name: getattr(Config, name)
+        for name in sorted(vars(Config))
+        if name.isupper() and name not in SECRET_SETTINGS
+    }
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def scalar(sql: str):
+    from db import session
+    with session("benchmark") as conn, conn.cursor() as cur:
+        cur.execute(sql)
+        return cur.fetchone()[0]
+
+def count_rows(table: str, where: str = "TRUE") -> int:
+    if not scalar(f"SELECT to_regclass('{table}') IS NOT NULL"):
+        return 0
+    return scalar(f"SELECT COUNT(*) FROM {table} WHERE {where}")
+
+def reset_tables():
+    from db import session
+    with session("benchmark_reset") as conn, conn.cursor() as cur:
+        for table in PIPELINE_TABLES:
+            cur.execute(f"SELECT to_regclass('{table}') IS NOT NULL")
+            if cur.fetchone()[0]:
+                cur.execute(f"TRUNCATE {table}")
+
+def measure(stage: str, run: Callable[[], None], rows: Callable[[], int]) -> dict:
+    """Run one stage, then count the rows it produced outside the measured window"""
+    with RssSampler() as rss, metrics.stage(stage):
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+    query_count = int(metrics.registry.counter_total("db_statements", stage=stage))
+    row_count = rows()
+
+    result = {
+        "wall_seconds": round(elapsed, 4),
+        "rows": row_count,
+        "rows_per_sec": round(row_count / elapsed, 1) if elapsed > 0 else None,
+        "peak_rss_mb": round(rss.peak / 2 ** 20, 1),
+        "queries": query_count,
+    }
+    logger.info(
+        f"{stage:>10}: {elapsed:8.2f}s  {row_count:>9} rows  "
+        f"{result['rows_per_sec'] or 0:>10.0f} rows/s  "
+        f"{result['peak_rss_mb']:>7.1f} MB  {query_count:>7} queries"
+    )
+    return result
+
+def run_city_set(cities, stages: List[str], weather_api, llm) -> Dict[str, dict]:
+    from config import Config
+    from L0.etl import WeatherETL
+    from L1.data_cleaning import run_data_cleaning
+    from L1.rain_forecast import get_rain_forecasts
+    from L1.weather_summary import generate_weather_summaries
+
+    def etl():
+        pipeline = WeatherETL(cities)
+        if Config.STREAMING_ETL:
+            asyncio.run(pipeline.run_streaming())
+        else:
+            asyncio.run(pipeline.run())
+        written.append(
+            pipeline.db.stats.inserted + pipeline.db.stats.updated + pipeline.db.stats.unchanged
+        )
+
+    written: List[int] = []
+    runs = {
+        "etl": (etl, lambda: written[-1] if written else 0),
+        "cleaning": (run_data_cleaning, lambda: count_rows("weather_forecasts")),
+        "summaries": (
+            generate_weather_summaries,
+            lambda: count_rows("weather_summaries", "summary_date = CURRENT_DATE")
+        ),
+        "rain": (get_rain_forecasts, lambda: count_rows("daily_rain_forecasts")),
+    }
+
+    results = {}
+    metrics.registry.reset()
+    for stage in stages:
+        weather_requests, llm_requests = weather_api.requests, llm.requests
+        results[stage] = measure(stage, *runs[stage])
+        results[stage]["weather_api_requests"] = weather_api.requests - weather_requests
+        results[stage]["llm_requests"] = llm.requests - llm_requests
+    return results
+
+def compare(results: dict, baseline_path: str, threshold: float) -> List[str]:
+    """Stages whose wall time grew by more than `threshold` over the baseline"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    regressions = []
+    for size, stages in results["runs"].items():
+        for stage, current in stages.items():
+            previous = baseline.get("runs", {}).get(size, {}).get(stage)
+            if not previous or not previous["wall_seconds"]:
+                continue
+            ratio = current["wall_seconds"] / previous["wall_seconds"]
+            # Ignore noise on stages that take a few milliseconds
+            slower = current["wall_seconds"] - previous["wall_seconds"] > 0.05
+            marker = "REGRESSION" if ratio > 1 + threshold and slower else ""
+            logger.info(
+                f"{size:>6} cities {stage:>10}: {previous['wall_seconds']:8.2f}s -> "
+                f"{current['wall_seconds']:8.2f}s ({ratio:5.2f}x) {marker}"
+            )
+            if marker:
+                regressions.append(f"{size} cities/{stage}")
+    return regressions
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--cities", default="8,100,1000",
+        help="comma-separated synthetic city set sizes (default: 8,100,1000)"
+    )
+    parser.add_argument(
+        "--stages", default=",".join(STAGES),
+        help=f"comma-separated stages to run (default: {','.join(STAGES)})"
+    )
+    parser.add_argument("--api-latency", type=float, default=0.0,
+                        help="seconds the fake Open-Meteo waits per request")
+    parser.add_argument("--llm-latency", type=float, default=0.0,
+                        help="seconds the stub LLM waits per completion")
+    parser.add_argument("--reset", action="store_true",
+                        help="truncate pipeline tables before each city set")
+    parser.add_argument("--output", default="benchmarks/results",
+                        help="directory for the JSON results file")
+    parser.add_argument("--compare", metavar="BASELINE",
+                        help="previous results file to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="relative slowdown reported as a regression (default: 0.2)")
+    parser.add_argument("--verbose", action="store_true",
+                        help="keep the pipeline's INFO logging")
+    return parser.parse_args(argv)
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    sizes = [int(size) for size in args.cities.split(",")]
+    stages = [stage.strip() for stage in args.stages.split(",")]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        raise SystemExit(f"Unknown stages: {', '.join(sorted(unknown))}")
+    if not os.getenv("DATABASE_URL"):
+        raise SystemExit("DATABASE_URL must point at a local Postgres for benchmarking")
+
+    with fakes.open_meteo(args.api_latency) as weather_api, \
+            fakes.chat_completions(args.llm_latency) as llm:
+        from config import Config
+        from db import close_pool
+        Config.WEATHER_API_URL = f"{weather_api.url}/v1/forecast"
+        # Read by the OpenAI clients, which weather_summary builds on first use
+        os.environ["OPENAI_BASE_URL"] = f"{llm.url}/v1"
+        os.environ["OPENAI_API_KEY"] = "benchmark"
+
+        metrics.configure_logging(logging.INFO if args.verbose else logging.WARNING)
+        logger.setLevel(logging.INFO)
+
+        results = {
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "git_revision": git_revision(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "api_latency": args.api_latency,
+            "llm_latency": args.llm_latency,
+            "config": config_snapshot(),
+            "runs": {},
+            "metrics": {},
+        }
+        try:
+            for size in sizes:
+                logger.info(f"--- {size} cities ---")
+                if args.reset:
+                    reset_tables()
+                results["runs"][str(size)] = run_city_set(
+                    fakes.synthetic_cities(size), stages, weather_api, llm
+                )
+                results["metrics"][str(size)] = metrics.registry.report()
+        finally:
+            close_pool()
+
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(
+        args.output, f"pipeline-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, default=str)
+    logger.info(f"Results written to {path}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions:
+            logger.error(f"Regressions: {', '.join(regressions)}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+"""
+Read API load test.
+
+Builds the per-city payloads from the database (DATABASE_URL), starts the
+read API on a local port and drives it from several keep-alive client
+threads, reporting p50/p90/p99 latency and requests/sec over HTTP and for
+in-process ForecastReader.get calls. Cache misses, the only reads that
+reach the database, are counted to show hot reads stay in memory.
+
+    DATABASE_URL=postgresql://localhost/weather_bench \\
+        python -m benchmarks.read_api --seed 1000 --clients 8 --duration 10
+
+--seed N first loads N synthetic cities through the ETL and a fake
+Open-Meteo server. Payloads are rebuilt halfway through the HTTP phase
+to measure how long the reader takes to pick up a new generation.
+"""
+import argparse
+import asyncio
+import http.client
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List
+from urllib.parse import quote
+
+from benchmarks import fakes
+from config import Config
+import metrics
+
+logger = logging.getLogger("benchmarks.read_api")
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    samples = sorted(samples)
+    def at(q: float) -> float:
+        return samples[min(len(samples) - 1, int(q * len(samples)))] * 1000
+    return {
+        "requests": len(samples),
+        "p50_ms": round(at(0.50), 3),
+        "p90_ms": round(at(0.90), 3),
+        "p99_ms": round(at(0.99), 3),
+        "max_ms": round(samples[-1] * 1000, 3),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+    }
+
+def seed(count: int):
+    from L0.etl import WeatherETL
+
+    with fakes.open_meteo() as weather_api:
+        Config.WEATHER_API_URL = f"{weather_api.url}/v1/forecast"
+        asyncio.run(WeatherETL(fakes.synthetic_cities(count)).run())
+
+def client(port: int, cities: List[str], deadline: float, samples: List[float], errors: List[str]):
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    rng = random.Random(threading.get_ident())
+    while time.perf_counter() < deadline:
+        # Skewed towards a hot set, as real traffic is
+        city = cities[min(int(rng.paretovariate(1.2)) - 1, len(cities) - 1)]
+        start = time.perf_counter()
+        try:
+            conn.request("GET", f"/forecast/{quote(city, safe='')}")
+            response = conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(str(e))
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port)
+            continue
+        samples.append(time.perf_counter() - start)
+        if response.status != 200:
+            errors.append(f"HTTP {response.status} for {city}")
+    conn.close()
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--seed", type=int, help="load this many synthetic cities first")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent HTTP clients (default: 8)")
+    parser.add_argument("--duration", type=float, default=10.0,
+                        help="seconds of HTTP load (default: 10)")
+    parser.add_argument("--output", help="directory for a JSON results file")
+    args = parser.parse_args(argv)
+    metrics.configure_logging()
+
+    from L2.http_api import make_server
+    from L2.payloads import build_payloads
+    from L2.read_api import ForecastReader
+
+    if args.seed:
+        seed(args.seed)
+    build_payloads()
+
+    # Fallback polling off: invalidation must come from NOTIFY
+    reader = ForecastReader(refresh_interval=3600).start()
+    cities = sorted(reader.cities)
+    if not cities:
+        logger.error("No payloads built; seed the database first")
+        return 1
+    server = make_server(reader, "127.0.0.1", 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+    results = {"cities": len(cities), "cached": len(reader.cache)}
+
+    # In-process reads
+    misses = metrics.registry.counter_total("read_api_cache", result="miss")
+    samples = []
+    for _ in range(100000):
+        city = random.choice(cities)
+        start = time.perf_counter()
+        reader.get(city)
+        samples.append(time.perf_counter() - start)
+    results["in_process"] = percentiles(samples)
+    results["in_process"]["cache_misses"] = int(
+        metrics.registry.counter_total("read_api_cache", result="miss") - misses
+    )
+
+    # HTTP reads, with a payload rebuild halfway through
+    misses = metrics.registry.counter_total("read_api_cache", result="miss")
+    samples, errors = [], []
+    deadline = time.perf_counter() + args.duration
+    threads = [
+        threading.Thread(target=client, args=(port, cities, deadline, samples, errors))
+        for _ in range(args.clients)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration / 2)
+    generation = reader.generation
+    rebuilt = time.perf_counter()
+    build_payloads()
+    built = time.perf_counter()
+    while reader.generation == generation and time.perf_counter() < deadline:
+        time.sleep(0.001)
+    picked_up = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    results["http"] = percentiles(samples)
+    results["http"]["requests_per_sec"] = round(len(samples) / elapsed, 1)
+    results["http"]["errors"] = len(errors)
+    results["http"]["cache_misses"] = int(
+        metrics.registry.counter_total("read_api_cache", result="miss") - misses
+    )
+    results["rebuild"] = {
+        "build_seconds": round(built - rebuilt, 3),
+        "new_generation_served_after_commit_ms": round((picked_up - built) * 1000, 1),
+        "generation": reader.generation,
+    }
+    server.shutdown()
+    reader.stop()
+
+    for phase in ("in_process", "http"):
+        r = results[phase]
+        logger.info(
+            f"{phase:>10}: {r['requests']} reads, p50 {r['p50_ms']:.3f} ms, "
+            f"p90 {r['p90_ms']:.3f} ms, p99 {r['p99_ms']:.3f} ms, max {r['max_ms']:.1f} ms"
+        )
+    logger.info(
+        f"HTTP: {results['http']['requests_per_sec']:,.0f} requests/sec over {args.clients} clients, "
+        f"{results['http']['errors']} errors; cache misses: "
+        f"{results['in_process']['cache_misses']} in-process, {results['http']['cache_misses']} HTTP"
+    )
+    logger.info(
+        f"New generation served {results['rebuild']['new_generation_served_after_commit_ms']} ms "
+        f"after its build committed"
+    )
+    if errors:
+        logger.warning(f"First errors: {errors[:5]}")
+
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+        path = os.path.join(
+            args.output, f"read-api-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+        )
+        with open(path, "w") as f:
+            json.dump({
+                "started_at": datetime.now().isoformat(timespec="seconds"),
+                "python": sys.version.split()[0],
+                "clients": args.clients,
+                "duration": args.duration,
+                **results,
+            }, f, indent=2)
+        logger.info(f"Results written to {path}")
+    return 1 if errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
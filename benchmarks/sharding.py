@@ -0,0 +1,159 @@
+"""
+Sharded ETL scaling benchmark.
+
+Runs the sharded ETL against a local Postgres (DATABASE_URL) and a fake
+Open-Meteo server with 1, 2, 4... local worker processes over the same
+synthetic city set, and reports wall time and rows/sec per worker count.
+Each run checks that every shard completed exactly once and that every
+city has forecasts written by that run.
+
+    DATABASE_URL=postgresql://localhost/weather_bench \\
+        python -m benchmarks.sharding --cities 2000 --workers 1,2,4
+
+--kill-after N kills one worker N seconds into each run with SIGKILL,
+with a short lease, so its shard has to be reclaimed after expiry.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+from benchmarks import fakes
+from config import Config
+import metrics
+
+logger = logging.getLogger("benchmarks.sharding")
+
+def scalar(sql: str, params=()):
+    from db import session
+
+    with session("benchmark_query") as conn, conn.cursor() as cur:
+        cur.execute(sql, params)
+        return cur.fetchone()[0]
+
+def run_workers(run_key: str, cities, workers: int, kill_after: Optional[float]) -> float:
+    from L0 import sharding
+
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=sharding._worker_process, args=(run_key, cities), name=f"etl-worker-{i}")
+        for i in range(workers)
+    ]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    if kill_after is not None:
+        time.sleep(kill_after)
+        victim = processes[0]
+        if victim.is_alive():
+            logger.info(f"Killing {victim.name} (pid {victim.pid})")
+            os.kill(victim.pid, signal.SIGKILL)
+    for process in processes:
+        process.join()
+    return time.perf_counter() - start
+
+def verify(run_key: str, cities, started_at: datetime) -> Dict[str, int]:
+    """Shard outcome counts; raises if any shard or city was missed"""
+    shards = scalar("SELECT COUNT(*) FROM etl_shard_leases WHERE run_key = %s", (run_key,))
+    done = scalar(
+        "SELECT COUNT(*) FROM etl_shard_leases WHERE run_key = %s AND status = 'done'", (run_key,)
+    )
+    reclaimed = scalar(
+        "SELECT COUNT(*) FROM etl_shard_leases WHERE run_key = %s AND attempts > 1", (run_key,)
+    )
+    # Cities that got no fresh rows during this run
+    stale = scalar("""
+        SELECT COUNT(*) FROM unnest(%s::text[]) AS c(city)
+        WHERE NOT EXISTS (
+            SELECT 1 FROM weather_forecasts w
+            WHERE w.city = c.city AND w.created_at >= %s
+        )
+    """, ([city.name for city in cities], started_at))
+    if done != shards or stale:
+        raise RuntimeError(f"{done}/{shards} shards done, {stale} cities without fresh rows")
+    return {"shards": shards, "reclaimed": reclaimed}
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--cities", type=int, default=2000, help="synthetic cities (default: 2000)")
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--shard-size", type=int, default=50, help="cities per shard (default: 50)")
+    parser.add_argument("--api-latency", type=float, default=0.02,
+                        help="fake Open-Meteo response delay in seconds (default: 0.02)")
+    parser.add_argument("--kill-after", type=float,
+                        help="SIGKILL one worker this many seconds into each run")
+    parser.add_argument("--output", help="directory for a JSON results file")
+    args = parser.parse_args(argv)
+    metrics.configure_logging()
+
+    cities = fakes.synthetic_cities(args.cities)
+    results = {}
+    with fakes.open_meteo(args.api_latency) as weather_api:
+        # Spawned workers read their configuration from the environment
+        os.environ["WEATHER_API_URL"] = f"{weather_api.url}/v1/forecast"
+        os.environ["ETL_SHARD_SIZE"] = str(args.shard_size)
+        if args.kill_after is not None:
+            os.environ["ETL_LEASE_SECONDS"] = "3"
+            os.environ["ETL_POLL_INTERVAL"] = "0.5"
+
+        # This process imported config already
+        Config.WEATHER_API_URL = os.environ["WEATHER_API_URL"]
+
+        from db import close_pool
+        from L0 import sharding
+
+        sharding.create_lease_table()
+        # Warm up tables and the fake server outside the timed runs
+        sharding.run_worker(f"bench-warmup-{os.getpid()}", cities[:args.shard_size])
+
+        for workers in [int(w) for w in args.workers.split(",")]:
+            run_key = f"bench-{datetime.now().strftime('%Y%m%d%H%M%S')}-{workers}"
+            started_at = scalar("SELECT LOCALTIMESTAMP")
+            seconds = run_workers(run_key, cities, workers, args.kill_after)
+            outcome = verify(run_key, cities, started_at)
+            rows = int(scalar(
+                "SELECT COALESCE(SUM(rows_written), 0) FROM etl_shard_leases WHERE run_key = %s",
+                (run_key,)
+            ))
+            results[workers] = {
+                "seconds": round(seconds, 3),
+                "rows": rows,
+                "rows_per_sec": round(rows / seconds, 1),
+                **outcome
+            }
+            logger.info(
+                f"{workers} workers: {seconds:.2f}s, {rows / seconds:,.0f} rows/sec, "
+                f"{outcome['shards']} shards ({outcome['reclaimed']} reclaimed)"
+            )
+        close_pool()
+
+    baseline = results[min(results)]["rows_per_sec"]
+    for workers, result in results.items():
+        result["speedup"] = round(result["rows_per_sec"] / baseline, 2)
+    logger.info("Speedup: " + ", ".join(f"{w}={r['speedup']}x" for w, r in results.items()))
+
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+        path = os.path.join(
+            args.output, f"sharding-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+        )
+        with open(path, "w") as f:
+            json.dump({
+                "started_at": datetime.now().isoformat(timespec="seconds"),
+                "python": sys.version.split()[0],
+                "cities": args.cities,
+                "shard_size": args.shard_size,
+                "api_latency": args.api_latency,
+                "workers": results,
+            }, f, indent=2)
+        logger.info(f"Results written to {path}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""
+CLI startup benchmark.
+
+For each main.py subcommand, starts a fresh interpreter that parses the
+command line and imports everything the stage needs, stopping before it
+does any work, and reports wall time and peak RSS. The `eager` row
+imports every stage module up front, as main.py used to.
+
+    python -m benchmarks.startup --repeat 5 --output benchmarks/results
+
+No database or network access is needed.
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List
+
+import metrics
+
+logger = logging.getLogger("benchmarks.startup")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COMMAND_SCRIPT = """
+import main
+pipeline = main.build_pipeline()
+main.parse_args(pipeline, {argv!r})
+for name in {stages!r}:
+    pipeline.load(name)
+"""
+
+EAGER_SCRIPT = """
+import main
+import L0.etl
+import L1.data_cleaning
+import L1.weather_summary
+import L1.rain_forecast
+"""
+
+def measure(script: str) -> Dict[str, float]:
+    """Wall time and peak RSS of one fresh interpreter running `script`"""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-c", script], cwd=ROOT, env=env)
+    # wait4 reports this child's own resource usage
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise RuntimeError(f"Startup script exited with {process.returncode}")
+    peak = usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+    return {"seconds": elapsed, "peak_rss": peak}
+
+def commands() -> Dict[str, str]:
+    sys.path.insert(0, ROOT)
+    import main
+
+    pipeline = main.build_pipeline()
+    scripts = {"list": COMMAND_SCRIPT.format(argv=["list"], stages=[])}
+    for name in pipeline.order:
+        scripts[name] = COMMAND_SCRIPT.format(argv=[name], stages=[name])
+    scripts["run"] = COMMAND_SCRIPT.format(argv=["run"], stages=pipeline.order)
+    scripts["eager"] = EAGER_SCRIPT
+    return scripts
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="interpreter starts per command (default: 5)")
+    parser.add_argument("--output", help="directory for a JSON results file")
+    args = parser.parse_args(argv)
+    metrics.configure_logging()
+
+    # Cold imports are dominated by bytecode compilation; warm the cache first
+    subprocess.run([sys.executable, "-m", "compileall", "-q", ROOT], check=True)
+
+    results = {}
+    for command, script in commands().items():
+        runs: List[Dict[str, float]] = [measure(script) for _ in range(args.repeat)]
+        results[command] = {
+            "median_ms": round(statistics.median(r["seconds"] for r in runs) * 1000, 1),
+            "min_ms": round(min(r["seconds"] for r in runs) * 1000, 1),
+            "peak_rss_mb": round(max(r["peak_rss"] for r in runs) / 2 ** 20, 1),
+        }
+        logger.info(
+            f"{command:>12}: {results[command]['median_ms']:7.1f} ms median  "
+            f"{results[command]['peak_rss_mb']:6.1f} MB peak RSS"
+        )
+
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+        path = os.path.join(
+            args.output, f"startup-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+        )
+        with open(path, "w") as f:
+            json.dump({
+                "started_at": datetime.now().isoformat(timespec="seconds"),
+                "python": sys.version.split()[0],
+                "repeat": args.repeat,
+                "commands": results,
+            }, f, indent=2)
+        logger.info(f"Results written to {path}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
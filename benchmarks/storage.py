@@ -0,0 +1,183 @@
+"""
+Storage backend benchmark.
+
+Loads the same synthetic forecast rows into Postgres (DATABASE_URL) and
+an embedded DuckDB file, then times each storage-heavy step on both:
+the first upsert, a second upsert changing every row, full data
+cleaning, a daily aggregate rebuild and server-side rain
+materialization. Reports seconds and rows/sec per step and the size
+the tables take on disk.
+
+    DATABASE_URL=postgresql://localhost/weather_bench \\
+        python -m benchmarks.storage --cities 1000 --output benchmarks/results
+
+The Postgres tables are truncated first, so point DATABASE_URL at a
+scratch database. `--backends duckdb` needs no server at all.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple
+
+import metrics
+from benchmarks.fakes import synthetic_cities, synthetic_hourly
+from config import Config
+from db import close_pool, session, table_exists
+from L0.models import ForecastBatch
+
+logger = logging.getLogger("benchmarks.storage")
+
+TABLES = (
+    "weather_forecasts", "forecast_content_hashes",
+    "daily_weather_aggregates", "daily_rain_forecasts"
+)
+
+def synthetic_rows(count: int) -> List[Tuple]:
+    start = datetime.now().replace(minute=0, second=0, microsecond=0)
+    rows = []
+    for city in synthetic_cities(count):
+        hourly = synthetic_hourly(city.latitude, city.longitude, start)
+        rows.extend(ForecastBatch.from_hourly(city.name, hourly).to_rows())
+    return rows
+
+def prepare():
+    """Create the tables and empty them, so every backend starts from scratch"""
+    from L0.aggregates import create_aggregates_table
+    from L0.database import Database
+    from L1.rain_forecast import create_rain_forecasts_table
+
+    Database().close()
+    with session("benchmark_reset") as conn:
+        with conn.cursor() as cur:
+            for table in TABLES:
+                if table_exists(cur, table):
+                    cur.execute(f"DELETE FROM {table}")
+            # Created while weather_forecasts is empty, so no backfill runs here
+            create_aggregates_table(cur)
+        create_rain_forecasts_table(conn)
+
+def upsert(rows: List[Tuple]) -> Callable[[], int]:
+    def run() -> int:
+        from L0.database import Database
+
+        db = Database()
+        try:
+            for start in range(0, len(rows), Config.STORE_WRITE_CHUNK_ROWS):
+                db.upsert_rows(rows[start:start + Config.STORE_WRITE_CHUNK_ROWS])
+        finally:
+            db.close()
+        return len(rows)
+    return run
+
+def cleaning(rows: int) -> Callable[[], int]:
+    def run() -> int:
+        from L1.data_cleaning import run_data_cleaning
+
+        run_data_cleaning(incremental=False)
+        return rows
+    return run
+
+def aggregates() -> int:
+    from L0.aggregates import refresh_aggregates
+
+    with session("benchmark_aggregates") as conn, conn.cursor() as cur:
+        return refresh_aggregates(cur)
+
+def rain() -> int:
+    from L1.rain_forecast import materialize_rain_forecasts
+
+    with session("benchmark_rain") as conn, conn.cursor() as cur:
+        return len(materialize_rain_forecasts(cur))
+
+def table_bytes(backend: str) -> int:
+    if backend == "duckdb":
+        # Measured after close_pool(), which checkpoints the file
+        return os.path.getsize(Config.DUCKDB_PATH)
+    with session("benchmark_size") as conn, conn.cursor() as cur:
+        cur.execute(
+            "SELECT SUM(pg_total_relation_size(t)) FROM unnest(%s::regclass[]) AS t",
+            (list(TABLES),)
+        )
+        return int(cur.fetchone()[0])
+
+def run_backend(backend: str, rows: List[Tuple]) -> Dict[str, dict]:
+    Config.STORAGE_BACKEND = backend
+    prepare()
+    changed = [(c, t, temperature + 0.5, p, w) for c, t, temperature, p, w in rows]
+    steps = {
+        "insert": upsert(rows),
+        "update": upsert(changed),
+        "cleaning": cleaning(len(rows)),
+        "aggregates": aggregates,
+        "rain": rain,
+    }
+    results = {}
+    for name, step in steps.items():
+        start = time.perf_counter()
+        written = step()
+        elapsed = time.perf_counter() - start
+        results[name] = {
+            "rows": written,
+            "seconds": round(elapsed, 3),
+            "rows_per_sec": round(written / max(elapsed, 1e-9)),
+        }
+        logger.info(
+            f"{backend:>8} {name:>10}: {elapsed:7.3f}s, {written} rows "
+            f"({results[name]['rows_per_sec']:,} rows/sec)"
+        )
+
+    if backend == "duckdb":
+        close_pool()
+    results["table_mb"] = round(table_bytes(backend) / 2 ** 20, 1)
+    close_pool()
+    logger.info(f"{backend:>8} tables: {results['table_mb']} MB")
+    return results
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--cities", type=int, default=1000,
+                        help="synthetic cities, 168 hourly rows each (default: 1000)")
+    parser.add_argument("--backends", default="postgres,duckdb",
+                        help="comma-separated backends to run (default: postgres,duckdb)")
+    parser.add_argument("--output", help="directory for a JSON results file")
+    args = parser.parse_args(argv)
+    metrics.configure_logging()
+    backends = args.backends.split(",")
+
+    rows = synthetic_rows(args.cities)
+    logger.info(f"{len(rows)} rows for {args.cities} cities")
+    results = {}
+    with tempfile.TemporaryDirectory() as scratch:
+        Config.DUCKDB_PATH = os.path.join(scratch, "benchmark.duckdb")
+        for backend in backends:
+            results[backend] = run_backend(backend, rows)
+
+    if "postgres" in results and "duckdb" in results:
+        for step, result in results["duckdb"].items():
+            if isinstance(result, dict):
+                speedup = results["postgres"][step]["seconds"] / max(result["seconds"], 1e-9)
+                logger.info(f"{step:>10}: DuckDB {speedup:.1f}x the speed of Postgres")
+
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+        path = os.path.join(
+            args.output, f"storage-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+        )
+        with open(path, "w") as f:
+            json.dump({
+                "started_at": datetime.now().isoformat(timespec="seconds"),
+                "python": sys.version.split()[0],
+                "cities": args.cities,
+                "rows": len(rows),
+                "backends": results,
+            }, f, indent=2)
+        logger.info(f"Results written to {path}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,6 @@
 from dataclasses import dataclass
 from typing import List
 import os
-import logging
 
 @dataclass(frozen=True)
 class City:
@@ -22,11 +21,110 @@ CITIES = [
 
 class Config:
     DATABASE_URL = os.getenv('DATABASE_URL')
-    WEATHER_API_URL = "https://api.open-meteo.com/v1/forecast"
+    WEATHER_API_URL = os.getenv('WEATHER_API_URL', "https://api.open-meteo.com/v1/forecast")
     BATCH_SIZE = 1000
+    DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', '1'))
+    DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', '4'))
+    DB_HEALTHCHECK_INTERVAL = float(os.getenv('DB_HEALTHCHECK_INTERVAL', '30'))  # seconds idle before ping
+    COPY_MIN_ROWS = int(os.getenv('COPY_MIN_ROWS', '5000'))  # smaller batches use execute_values
+    # Only rewrite rows whose values changed; optionally skip cities with an unchanged payload hash
+    CHANGE_AWARE_UPSERT = os.getenv('CHANGE_AWARE_UPSERT', 'false').lower() == 'true'
+    SKIP_UNCHANGED_CITIES = os.getenv('SKIP_UNCHANGED_CITIES', 'false').lower() == 'true'
     OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-) 
+    # Storage backend: 'postgres' (DATABASE_URL) or 'duckdb', an embedded file for local and edge runs
+    STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'postgres').lower()
+    DUCKDB_PATH = os.getenv('DUCKDB_PATH', 'weather.duckdb')
+    DUCKDB_MEMORY_LIMIT = os.getenv('DUCKDB_MEMORY_LIMIT')  # e.g. '512MB'; default: 80% of RAM
+
+    # Daily range partitions on weather_forecasts.timestamp; retention drops partitions
+    PARTITIONED_STORAGE = os.getenv('PARTITIONED_STORAGE', 'false').lower() == 'true'
+    PARTITION_DAYS_AHEAD = int(os.getenv('PARTITION_DAYS_AHEAD', '10'))
+    RETENTION_DAYS = int(os.getenv('RETENTION_DAYS', '30'))
+
+    # Maintain daily_weather_aggregates during ETL; L1 stages read from it
+    DAILY_AGGREGATES = os.getenv('DAILY_AGGREGATES', 'false').lower() == 'true'
+
+    # Clean only rows created since the last run's high-water mark
+    INCREMENTAL_CLEANING = os.getenv('INCREMENTAL_CLEANING', 'false').lower() == 'true'
+
+    # Materialize daily_rain_forecasts (with rain episodes) in one server-side statement
+    SERVER_SIDE_RAIN = os.getenv('SERVER_SIDE_RAIN', 'false').lower() == 'true'
+
+    # Concurrent summary generation with request and token rate limits
+    ASYNC_SUMMARIES = os.getenv('ASYNC_SUMMARIES', 'false').lower() == 'true'
+    SUMMARY_CONCURRENCY = int(os.getenv('SUMMARY_CONCURRENCY', '4'))
+    SUMMARY_REQUESTS_PER_MINUTE = float(os.getenv('SUMMARY_REQUESTS_PER_MINUTE', '60'))
+    SUMMARY_TOKENS_PER_MINUTE = float(os.getenv('SUMMARY_TOKENS_PER_MINUTE', '40000'))
+
+    # Content-addressed cache of generated summaries
+    SUMMARY_CACHE_ENABLED = os.getenv('SUMMARY_CACHE_ENABLED', 'true').lower() == 'true'
+    SUMMARY_CACHE_TTL_HOURS = int(os.getenv('SUMMARY_CACHE_TTL_HOURS', '72'))
+    SUMMARY_CACHE_MAX_ENTRIES = int(os.getenv('SUMMARY_CACHE_MAX_ENTRIES', '10000'))
+
+    # Batched fetching: many coordinates per request, one fetch per grid cell
+    BATCHED_FETCH = os.getenv('BATCHED_FETCH', 'false').lower() == 'true'
+    WEATHER_BATCH_SIZE = int(os.getenv('WEATHER_BATCH_SIZE', '50'))
+    GRID_RESOLUTION = float(os.getenv('GRID_RESOLUTION', '0.1'))  # degrees
+
+    # On-disk Open-Meteo response cache; disabled unless a path is set
+    RESPONSE_CACHE_PATH = os.getenv('RESPONSE_CACHE_PATH')
+    RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', '3600'))  # seconds
+    RESPONSE_CACHE_MAX_BYTES = int(os.getenv('RESPONSE_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+
+    # Decode hourly payloads into NumPy-backed ForecastBatch columns
+    COLUMNAR_DECODE = os.getenv('COLUMNAR_DECODE', 'false').lower() == 'true'
+
+    # Hold fetched forecasts in an array-backed ForecastStore; written in chunks of this many rows
+    COMPACT_FORECASTS = os.getenv('COMPACT_FORECASTS', 'false').lower() == 'true'
+    STORE_WRITE_CHUNK_ROWS = int(os.getenv('STORE_WRITE_CHUNK_ROWS', '50000'))
+
+    # Streaming ETL: fetches feed a bounded queue drained by a chunked writer
+    STREAMING_ETL = os.getenv('STREAMING_ETL', 'false').lower() == 'true'
+    STREAM_QUEUE_SIZE = int(os.getenv('STREAM_QUEUE_SIZE', '32'))
+    STREAM_FETCH_CONCURRENCY = int(os.getenv('STREAM_FETCH_CONCURRENCY', '16'))
+
+    # Open-Meteo fetching: adaptive concurrency, connection pool, timeouts (seconds) and retries
+    FETCH_CONCURRENCY = int(os.getenv('FETCH_CONCURRENCY', '16'))
+    FETCH_MIN_CONCURRENCY = int(os.getenv('FETCH_MIN_CONCURRENCY', '1'))
+    FETCH_MAX_CONCURRENCY = int(os.getenv('FETCH_MAX_CONCURRENCY', '64'))
+    HTTP_MAX_CONNECTIONS = int(os.getenv('HTTP_MAX_CONNECTIONS', '64'))
+    HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('HTTP_MAX_KEEPALIVE_CONNECTIONS', '32'))
+    HTTP_KEEPALIVE_EXPIRY = float(os.getenv('HTTP_KEEPALIVE_EXPIRY', '30'))
+    HTTP2 = os.getenv('HTTP2', 'false').lower() == 'true'  # needs httpx[http2]
+    FETCH_CONNECT_TIMEOUT = float(os.getenv('FETCH_CONNECT_TIMEOUT', '5'))
+    FETCH_READ_TIMEOUT = float(os.getenv('FETCH_READ_TIMEOUT', '30'))
+    FETCH_POOL_TIMEOUT = float(os.getenv('FETCH_POOL_TIMEOUT', '30'))
+    FETCH_MAX_ATTEMPTS = int(os.getenv('FETCH_MAX_ATTEMPTS', '4'))
+    FETCH_BACKOFF_BASE = float(os.getenv('FETCH_BACKOFF_BASE', '0.5'))
+    FETCH_BACKOFF_MAX = float(os.getenv('FETCH_BACKOFF_MAX', '30'))
+
+    # Sharded ETL: worker processes lease city shards from etl_shard_leases
+    SHARDED_ETL = os.getenv('SHARDED_ETL', 'false').lower() == 'true'
+    ETL_WORKERS = int(os.getenv('ETL_WORKERS', str(os.cpu_count() or 1)))  # local processes
+    ETL_SHARD_SIZE = int(os.getenv('ETL_SHARD_SIZE', '50'))  # cities per shard
+    ETL_LEASE_SECONDS = float(os.getenv('ETL_LEASE_SECONDS', '120'))
+    ETL_SHARD_MAX_ATTEMPTS = int(os.getenv('ETL_SHARD_MAX_ATTEMPTS', '3'))
+    ETL_POLL_INTERVAL = float(os.getenv('ETL_POLL_INTERVAL', '1'))  # seconds between checks for expired leases
+    ETL_RUN_KEY = os.getenv('ETL_RUN_KEY')  # default: unique per run
+    ETL_RETRY_FAILED = os.getenv('ETL_RETRY_FAILED', 'false').lower() == 'true'  # reset an existing run's failed shards
+
+    # Run-versioned forecast history: one forecast_runs row per ETL run, changed hours only
+    FORECAST_HISTORY = os.getenv('FORECAST_HISTORY', 'false').lower() == 'true'
+    HISTORY_RETENTION_DAYS = int(os.getenv('HISTORY_RETENTION_DAYS', '90'))
+
+    # Parquet archive of rows leaving the retention window (needs pyarrow); disabled unless a path is set
+    ARCHIVE_PATH = os.getenv('ARCHIVE_PATH')
+    ARCHIVE_COMPRESSION = os.getenv('ARCHIVE_COMPRESSION', 'zstd')
+    ARCHIVE_ROW_GROUP_SIZE = int(os.getenv('ARCHIVE_ROW_GROUP_SIZE', '65536'))
+    ARCHIVE_FETCH_ROWS = int(os.getenv('ARCHIVE_FETCH_ROWS', '10000'))
+
+    # Read API: per-city payloads built after each run, served from an in-process LRU
+    SERVING_CACHE_SIZE = int(os.getenv('SERVING_CACHE_SIZE', '10000'))  # cities
+    SERVING_REFRESH_INTERVAL = float(os.getenv('SERVING_REFRESH_INTERVAL', '30'))  # seconds between fallback polls
+    SERVING_HOST = os.getenv('SERVING_HOST', '127.0.0.1')
+    SERVING_PORT = int(os.getenv('SERVING_PORT', '8080'))
+    SERVING_MAX_AGE = int(os.getenv('SERVING_MAX_AGE', '60'))  # Cache-Control for clients
+
+    # Run metrics export at the end of main.py: *.prom for Prometheus textfile, else JSON
+    METRICS_PATH = os.getenv('METRICS_PATH')
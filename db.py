@@ -0,0 +1,373 @@
+import json
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, cursor
+from psycopg2.pool import ThreadedConnectionPool
+from config import Config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+_pool: Optional[ThreadedConnectionPool] = None
+_slots: Optional[threading.BoundedSemaphore] = None
+_lock = threading.Lock()
+_last_used: Dict[int, float] = {}
+# Pool and slot semaphore each checked-out connection came from, so it goes
+# back to them even if close_pool() has since replaced the globals
+_origins: Dict[int, Tuple[ThreadedConnectionPool, threading.BoundedSemaphore]] = {}
+_duckdb = None
+
+BACKENDS = ("postgres", "duckdb")
+# Features built on Postgres-only machinery (partitions, LISTEN, server-side
+# cursors, multi-process writers, psycopg2 helpers)
+POSTGRES_ONLY = (
+    "PARTITIONED_STORAGE", "FORECAST_HISTORY", "SHARDED_ETL", "ARCHIVE_PATH",
+    "SKIP_UNCHANGED_CITIES"
+)
+DML_STATEMENTS = ("INSERT", "UPDATE", "DELETE")
+_PLACEHOLDER = re.compile(r"%\((\w+)\)s|%s|%%")
+# String literals, quoted identifiers and comments, which may mention RETURNING
+_NOT_SQL = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|--[^\n]*|/\*.*?\*/", re.S)
+_RETURNING = re.compile(r"\bRETURNING\b", re.I)
+
+def _statement_kind(query) -> str:
+    if isinstance(query, bytes):
+        query = query[:32].decode("utf-8", "replace")
+    words = str(query).split(None, 1)
+    return words[0].upper() if words else "EMPTY"
+
+class InstrumentedCursor(cursor):
+    """Cursor recording statement time and rows affected per pipeline stage"""
+
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            self._record(query, time.perf_counter() - start)
+
+    def copy_expert(self, sql, file, size=8192):
+        start = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            self._record(sql, time.perf_counter() - start)
+
+    def _record(self, query, seconds: float):
+        _record_statement(query, seconds, self.rowcount)
+
+def _record_statement(query, seconds: float, rowcount: int):
+    labels = {
+        "stage": metrics.current_stage() or "none",
+        "statement": _statement_kind(query)
+    }
+    metrics.observe("db_statement", seconds, **labels)
+    metrics.increment("db_statements", **labels)
+    if rowcount > 0:
+        metrics.increment("db_rows", rowcount, **labels)
+
+def _has_returning(query: str) -> bool:
+    """Whether a DML statement has a RETURNING clause, ignoring literals and comments"""
+    return _RETURNING.search(_NOT_SQL.sub(" ", query)) is not None
+
+def using_duckdb() -> bool:
+    """True when Config.STORAGE_BACKEND selects the embedded DuckDB file"""
+    if Config.STORAGE_BACKEND not in BACKENDS:
+        raise ValueError(
+            f"Unknown STORAGE_BACKEND {Config.STORAGE_BACKEND!r}; expected one of {', '.join(BACKENDS)}"
+        )
+    return Config.STORAGE_BACKEND == "duckdb"
+
+def duckdb_sql(query: str) -> str:
+    """Rewrite psycopg2 placeholders (%s, %(name)s) as DuckDB's (?, $name)"""
+    def replace(match):
+        if match.group(1):
+            return f"${match.group(1)}"
+        return "?" if match.group(0) == "%s" else "%"
+    return _PLACEHOLDER.sub(replace, query)
+
+class DuckDBCursor:
+    """
+    Cursor over a DuckDBConnection, behaving like InstrumentedCursor.
+
+    Takes psycopg2 placeholders, sets rowcount for INSERT, UPDATE and
+    DELETE (the number of rows returned with RETURNING), decodes JSON
+    columns as psycopg2 does, and records the same statement metrics, so
+    SQL both engines understand runs unchanged on either backend. A
+    connection holds one result at a time, shared by its cursors.
+    """
+
+    def __init__(self, connection: "DuckDBConnection"):
+        self.connection = connection
+        self.rowcount = -1
+        # Accepted for named-cursor callers; DuckDB results are fetched in chunks anyway
+        self.itersize = Config.BATCH_SIZE
+        self._rows: Optional[Iterator] = None
+        self._json_columns: list = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._rows = None
+
+    @property
+    def description(self):
+        return self.connection.duck.description
+
+    def execute(self, query, vars=None):
+        self.connection.begin()
+        self._rows = None
+        self.rowcount = -1
+        start = time.perf_counter()
+        try:
+            if vars is None:
+                self.connection.duck.execute(query)
+            else:
+                self.connection.duck.execute(duckdb_sql(query), vars)
+            description = self.connection.duck.description or []
+            self._json_columns = [
+                i for i, column in enumerate(description) if str(column[1]) == "JSON"
+            ]
+            # DuckDB reports affected rows as a one-row "Count" result;
+            # WITH ... INSERT counts as DML too
+            if _statement_kind(query) in DML_STATEMENTS + ("WITH",):
+                if _has_returning(query):
+                    rows = self.connection.duck.fetchall()
+                    self.rowcount = len(rows)
+                    self._rows = iter(rows)
+                elif [column[0] for column in description] == ["Count"]:
+                    self.rowcount = self.connection.duck.fetchone()[0]
+                    self._rows = iter(())
+        finally:
+            _record_statement(query, time.perf_counter() - start, self.rowcount)
+        return self
+
+    def _decode(self, row):
+        if row is None or not self._json_columns:
+            return row
+        row = list(row)
+        for i in self._json_columns:
+            if row[i] is not None:
+                row[i] = json.loads(row[i])
+        return tuple(row)
+
+    def fetchone(self):
+        row = next(self._rows, None) if self._rows is not None else self.connection.duck.fetchone()
+        return self._decode(row)
+
+    def fetchmany(self, size: Optional[int] = None):
+        size = size or self.itersize
+        if self._rows is not None:
+            rows = [row for _, row in zip(range(size), self._rows)]
+        else:
+            rows = self.connection.duck.fetchmany(size)
+        return [self._decode(row) for row in rows]
+
+    def fetchall(self):
+        rows = list(self._rows) if self._rows is not None else self.connection.duck.fetchall()
+        return [self._decode(row) for row in rows]
+
+    def __iter__(self):
+        while True:
+            rows = self.fetchmany()
+            if not rows:
+                return
+            yield from rows
+
+class DuckDBConnection:
+    """
+    One DuckDB connection in psycopg2's shape.
+
+    As with psycopg2, a transaction starts with the first statement and
+    lasts until commit() or rollback(). Each instance is a separate
+    connection to the process-wide database, so threads can hold their
+    own sessions; DuckDB resolves concurrent writes optimistically.
+    """
+
+    def __init__(self, duck):
+        self.duck = duck
+        self.closed = False
+        self._in_transaction = False
+
+    def cursor(self, name: Optional[str] = None, **kwargs) -> DuckDBCursor:
+        return DuckDBCursor(self)
+
+    def begin(self):
+        if not self._in_transaction:
+            self.duck.begin()
+            self._in_transaction = True
+
+    def commit(self):
+        if self._in_transaction:
+            self._in_transaction = False
+            self.duck.commit()
+
+    def rollback(self):
+        if self._in_transaction:
+            self._in_transaction = False
+            self.duck.rollback()
+
+    def close(self):
+        if not self.closed:
+            self.rollback()
+            self.duck.close()
+            self.closed = True
+
+def get_duckdb():
+    """Return the process-wide DuckDB database, opening Config.DUCKDB_PATH on first use"""
+    global _duckdb
+    with _lock:
+        if _duckdb is None:
+            enabled = [name for name in POSTGRES_ONLY if getattr(Config, name)]
+            if enabled:
+                raise ValueError(f"{', '.join(enabled)} need STORAGE_BACKEND=postgres")
+            # Optional dependency, only needed for embedded runs
+            import duckdb
+
+            config = {}
+            if Config.DUCKDB_MEMORY_LIMIT:
+                config["memory_limit"] = Config.DUCKDB_MEMORY_LIMIT
+            _duckdb = duckdb.connect(Config.DUCKDB_PATH, config=config)
+            logger.info(f"Opened DuckDB database {Config.DUCKDB_PATH}")
+        return _duckdb
+
+def get_pool() -> ThreadedConnectionPool:
+    """Return the process-wide connection pool, creating it on first use"""
+    return _current_pool()[0]
+
+def _current_pool() -> Tuple[ThreadedConnectionPool, threading.BoundedSemaphore]:
+    global _pool, _slots
+    with _lock:
+        if _pool is None or _pool.closed:
+            _pool = ThreadedConnectionPool(
+                Config.DB_POOL_MIN_SIZE,
+                Config.DB_POOL_MAX_SIZE,
+                Config.DATABASE_URL,
+                cursor_factory=InstrumentedCursor
+            )
+            _slots = threading.BoundedSemaphore(Config.DB_POOL_MAX_SIZE)
+            logger.info(
+                f"Opened database pool "
+                f"(min={Config.DB_POOL_MIN_SIZE}, max={Config.DB_POOL_MAX_SIZE})"
+            )
+        return _pool, _slots
+
+def _is_healthy(conn) -> bool:
+    if conn.closed:
+        return False
+    idle = time.monotonic() - _last_used.get(id(conn), 0.0)
+    if idle < Config.DB_HEALTHCHECK_INTERVAL:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error as e:
+        logger.warning(f"Discarding unhealthy database connection: {e}")
+        return False
+
+def acquire():
+    """
+    Check out a healthy connection, blocking while the pool is exhausted.
+
+    Connections idle for longer than Config.DB_HEALTHCHECK_INTERVAL
+    seconds are pinged first; broken ones are closed and replaced. With
+    the DuckDB backend this is a new connection to the embedded database.
+    """
+    if using_duckdb():
+        return DuckDBConnection(get_duckdb().cursor())
+    pool, slots = _current_pool()
+    slots.acquire()
+    try:
+        for _ in range(Config.DB_POOL_MAX_SIZE + 1):
+            conn = pool.getconn()
+            if _is_healthy(conn):
+                _origins[id(conn)] = (pool, slots)
+                return conn
+            _last_used.pop(id(conn), None)
+            pool.putconn(conn, close=True)
+        raise psycopg2.OperationalError("No healthy database connection available")
+    except Exception:
+        slots.release()
+        raise
+
+def release(conn):
+    """
+    Return a connection to the pool it came from, rolling back any open transaction.
+
+    A connection outliving close_pool() is closed instead.
+    """
+    if isinstance(conn, DuckDBConnection):
+        conn.close()
+        return
+    pool, slots = _origins.pop(id(conn))
+    try:
+        if pool.closed:
+            if not conn.closed:
+                conn.close()
+            return
+        if not conn.closed and conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+        _last_used[id(conn)] = time.monotonic()
+        pool.putconn(conn, close=bool(conn.closed))
+    finally:
+        slots.release()
+
+@contextmanager
+def session(stage: str) -> Iterator:
+    """
+    Pooled connection scoped to one transaction.
+
+    Commits when the block exits normally and rolls back if it raises.
+    """
+    conn = acquire()
+    start = time.perf_counter()
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        release(conn)
+        elapsed = time.perf_counter() - start
+        metrics.observe("db_session", elapsed, session=stage)
+        logger.debug(f"{stage} session finished in {elapsed:.3f}s")
+
+def close_pool():
+    """Close every pooled connection, and the DuckDB database if open"""
+    global _pool, _duckdb
+    with _lock:
+        if _pool is not None and not _pool.closed:
+            _pool.closeall()
+            logger.info("Closed database pool")
+        _pool = None
+        _last_used.clear()
+        if _duckdb is not None:
+            _duckdb.close()
+            _duckdb = None
+            logger.info("Closed DuckDB database")
+
+def json_agg_objects(fields: str, order_by: str) -> str:
+    """SQL aggregate collecting one JSON object of ('key', value, ...) `fields` per row into an array"""
+    if using_duckdb():
+        return f"to_json(list(json_object({fields}) ORDER BY {order_by}))"
+    return f"jsonb_agg(jsonb_build_object({fields}) ORDER BY {order_by})"
+
+def table_exists(cur, table: str) -> bool:
+    """Whether `table` exists, on either backend"""
+    cur.execute(
+        "SELECT COUNT(*) > 0 FROM information_schema.tables WHERE table_name = %s", (table,)
+    )
+    return cur.fetchone()[0]
@@ -1,11 +1,188 @@
-from L0.etl import run_etl
-from L1.data_cleaning import run_data_cleaning
-from L1.weather_summary import generate_weather_summaries
-from L1.rain_forecast import get_rain_forecasts
+import argparse
+import hashlib
+import logging
+import sys
+from typing import Optional
+from config import Config
+from db import close_pool, session, table_exists, using_duckdb
+from scheduler import Pipeline, PipelineError, Stage, lazy, load_state
+import metrics
 
-if __name__ == "__main__":
+# Stage modules are imported by the stages themselves when they run, so a
+# cleaning-only run never loads httpx, NumPy or the OpenAI SDK.
+
+logger = logging.getLogger(__name__)
+
+def forecasts_fingerprint(granularity: str) -> Optional[str]:
+    """
+    Signal of weather_forecasts' content plus the current time truncated to `granularity`.
+
+    With CHANGE_AWARE_UPSERT only inserts and changed rows stamp
+    created_at, so MAX(created_at) is enough and comes from the index.
+    Otherwise every upsert re-stamps created_at, so the rows themselves
+    are checksummed: a count and exact integer sums of the hundredths,
+    which do not depend on scan order. Stages reading forecasts only need
+    to rerun when this moves or their time window does.
+    """
+    with session("forecasts_fingerprint") as conn, conn.cursor() as cur:
+        if not table_exists(cur, "weather_forecasts"):
+            return None
+        if Config.CHANGE_AWARE_UPSERT:
+            signal = "MAX(created_at)"
+        else:
+            signal = """
+                COUNT(*), MIN(timestamp), MAX(timestamp),
+                SUM(ROUND(temperature * 100)), SUM(ROUND(precipitation * 100)),
+                SUM(ROUND(windspeed * 100))
+            """
+        cur.execute(f"""
+            SELECT {signal}, date_trunc(%s, LOCALTIMESTAMP)
+            FROM weather_forecasts;
+        """, (granularity,))
+        return "|".join(str(value) for value in cur.fetchone())
+
+def summaries_fingerprint() -> Optional[str]:
+    """
+    Today's forecasts fingerprint plus the cities that have a stored summary.
+
+    A city whose summary is missing (or was deleted) changes this, so the
+    stage runs again to fill it in.
+    """
+    forecasts = forecasts_fingerprint("day")
+    if forecasts is None:
+        return None
+    with session("summaries_fingerprint") as conn, conn.cursor() as cur:
+        cities = []
+        if table_exists(cur, "weather_summaries"):
+            cur.execute(
+                "SELECT city FROM weather_summaries WHERE summary_date = CURRENT_DATE ORDER BY city"
+            )
+            cities = [row[0] for row in cur.fetchall()]
+    stored = hashlib.sha256("\n".join(cities).encode()).hexdigest()
+    return f"{forecasts}|{len(cities)}:{stored}"
+
+def payloads_fingerprint() -> Optional[str]:
+    """
+    This hour's forecasts fingerprint plus when summaries and rain last finished.
+
+    Payloads embed both stages' outputs, so a new summary or rain
+    materialization rebuilds them even if the forecasts did not move.
+    """
+    forecasts = forecasts_fingerprint("hour")
+    if forecasts is None:
+        return None
+    upstream = load_state(("summaries", "rain"))
+    finished = [
+        f"{name}={upstream[name].finished_at if name in upstream else None}"
+        for name in ("summaries", "rain")
+    ]
+    return "|".join([forecasts] + finished)
+
+def build_pipeline() -> Pipeline:
+    """
+    The daily run as a dependency graph.
+
+    Summaries and rain materialization both only need cleaned forecasts,
+    so they run side by side; the rain report and the read API payloads
+    wait for both. The read API listens for Postgres notifications, so
+    its payloads stage is left out on the DuckDB backend.
+    """
+    def rain_report():
+        from L1.rain_forecast import load_rain_forecasts, show_rain_forecasts
+
+        rows = pipeline.results.get("rain")
+        if rows is None:
+            # Rain was skipped or not selected: show what its last run materialized
+            last_run = pipeline.state.get("rain")
+            rows = load_rain_forecasts(last_run.started_at if last_run else None)
+        show_rain_forecasts(rows)
 
-    run_etl()
-    run_data_cleaning()
-    generate_weather_summaries()
-    get_rain_forecasts()
+    stages = [
+        Stage(
+            "etl", lazy("L0.etl:run_etl"),
+            description="fetch forecasts from Open-Meteo and upsert them"
+        ),
+        Stage(
+            "cleaning", lazy("L1.data_cleaning:run_data_cleaning"), after=("etl",),
+            fingerprint=lambda: forecasts_fingerprint("day"),
+            description="remove invalid and expired forecasts"
+        ),
+        Stage(
+            "summaries", lazy("L1.weather_summary:generate_weather_summaries"),
+            after=("cleaning",),
+            fingerprint=summaries_fingerprint,
+            description="generate daily LLM weather summaries"
+        ),
+        Stage(
+            "rain", lazy("L1.rain_forecast:update_rain_forecasts"), after=("cleaning",),
+            fingerprint=lambda: forecasts_fingerprint("hour"),
+            description="materialize daily rain forecasts"
+        ),
+        Stage(
+            "rain_report", rain_report, after=("summaries", "rain"),
+            description="show rain days alongside today's summaries"
+        ),
+    ]
+    if not using_duckdb():
+        stages.append(Stage(
+            "payloads", lazy("L2.payloads:build_payloads"), after=("summaries", "rain"),
+            fingerprint=payloads_fingerprint,
+            description="precompute per-city read API payloads"
+        ))
+    pipeline = Pipeline(stages)
+    return pipeline
+
+def parse_args(pipeline: Pipeline, argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run the weather pipeline, or one stage of it"
+    )
+    commands = parser.add_subparsers(dest="command", metavar="command")
+
+    run = commands.add_parser("run", help="run stages as a dependency graph (default)")
+    run.add_argument(
+        "stages", nargs="*",
+        help="stages to run (default: all); dependencies outside the list are assumed done"
+    )
+    run.add_argument("--force", action="store_true",
+                     help="run stages even if their inputs are unchanged")
+
+    for name in pipeline.order:
+        stage = commands.add_parser(name, help=pipeline.stages[name].description)
+        stage.add_argument("--force", action="store_true",
+                           help="run even if the inputs are unchanged")
+
+    commands.add_parser("list", help="print the stages in dependency order")
+
+    argv = list(sys.argv[1:] if argv is None else argv)
+    # Bare `main.py [--force]` runs the whole pipeline
+    if not argv or (argv[0] not in commands.choices and argv[0] not in ("-h", "--help")):
+        argv = ["run"] + argv
+    return parser.parse_args(argv)
+
+def main(argv=None) -> int:
+    pipeline = build_pipeline()
+    args = parse_args(pipeline, argv)
+
+    if args.command == "list":
+        for name in pipeline.order:
+            stage = pipeline.stages[name]
+            after = f" (after {', '.join(stage.after)})" if stage.after else ""
+            print(f"{name:<12} {stage.description}{after}")
+        return 0
+
+    metrics.configure_logging()
+    selected = (args.stages or None) if args.command == "run" else [args.command]
+    try:
+        statuses = pipeline.run(selected, force=args.force)
+        logger.info("Stage results: " + ", ".join(f"{k}={v}" for k, v in statuses.items()))
+        return 0
+    except PipelineError as e:
+        logger.error(str(e))
+        return 1
+    finally:
+        close_pool()
+        metrics.log_summary()
+        metrics.write_report()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,248 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "weather_pipeline"
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+Labels = Tuple[Tuple[str, str], ...]
+
+_stage: ContextVar[str] = ContextVar("stage", default="")
+_process_start = time.perf_counter()
+
+def configure_logging(level: int = logging.INFO):
+    """Configure root logging once for the process; entry points call this"""
+    logging.basicConfig(level=level, format=LOG_FORMAT)
+
+@dataclass
+class Timing:
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+class Registry:
+    """
+    In-process counters and timings keyed by name and labels.
+
+    Stage spans are also kept in order as a coarse trace of the run.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = datetime.now()
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.timings: Dict[Tuple[str, Labels], Timing] = {}
+        self.trace: List[dict] = []
+
+    def increment(self, name: str, value: float = 1, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            timing = self.timings.get(key)
+            if timing is None:
+                timing = self.timings[key] = Timing()
+            timing.add(seconds)
+
+    def record_span(self, name: str, start: float, seconds: float, **labels):
+        with self._lock:
+            self.trace.append({
+                "name": name,
+                "labels": dict(labels),
+                "start": round(start, 6),
+                "seconds": round(seconds, 6)
+            })
+
+    def reset(self):
+        with self._lock:
+            self.started_at = datetime.now()
+            self.counters.clear()
+            self.timings.clear()
+            self.trace.clear()
+
+    def merge(self, report: dict):
+        """Add the counters and timings of another process's report() to this registry"""
+        with self._lock:
+            for entry in report["counters"]:
+                key = (entry["name"], _labels(entry["labels"]))
+                self.counters[key] = self.counters.get(key, 0) + entry["value"]
+            for entry in report["timings"]:
+                key = (entry["name"], _labels(entry["labels"]))
+                timing = self.timings.get(key)
+                if timing is None:
+                    timing = self.timings[key] = Timing()
+                timing.count += entry["count"]
+                timing.total += entry["total_seconds"]
+                timing.max = max(timing.max, entry["max_seconds"])
+
+    def counter_total(self, name: str, **labels) -> float:
+        """Sum of a counter across label sets matching the given labels"""
+        wanted = set(labels.items())
+        with self._lock:
+            return sum(
+                value for (key, key_labels), value in self.counters.items()
+                if key == name and wanted <= set(key_labels)
+            )
+
+    def report(self) -> dict:
+        with self._lock:
+            return {
+                "started_at": self.started_at.isoformat(timespec="seconds"),
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(self.counters.items())
+                ],
+                "timings": [
+                    {
+                        "name": name,
+                        "labels": dict(labels),
+                        "count": timing.count,
+                        "total_seconds": round(timing.total, 6),
+                        "max_seconds": round(timing.max, 6)
+                    }
+                    for (name, labels), timing in sorted(self.timings.items())
+                ],
+                "trace": list(self.trace)
+            }
+
+    def to_prometheus(self) -> str:
+        """Render in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            timings = sorted(self.timings.items())
+
+        seen = set()
+        for (name, labels), value in counters:
+            metric = f"{PREFIX}_{name}_total"
+            if metric not in seen:
+                lines.append(f"# TYPE {metric} counter")
+                seen.add(metric)
+            lines.append(f"{metric}{_format_labels(labels)} {value:g}")
+
+        # Each metric family's samples must be contiguous
+        for name in sorted({name for (name, _), _ in timings}):
+            metric = f"{PREFIX}_{name}_seconds"
+            family = [(labels, timing) for (key, labels), timing in timings if key == name]
+            lines.append(f"# TYPE {metric} summary")
+            for labels, timing in family:
+                lines.append(f"{metric}_count{_format_labels(labels)} {timing.count}")
+                lines.append(f"{metric}_sum{_format_labels(labels)} {timing.total:.6f}")
+            lines.append(f"# TYPE {metric}_max gauge")
+            for labels, timing in family:
+                lines.append(f"{metric}_max{_format_labels(labels)} {timing.max:.6f}")
+        return "\n".join(lines) + "\n"
+
+def _labels(labels: dict) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+registry = Registry()
+increment = registry.increment
+observe = registry.observe
+
+def current_stage() -> str:
+    """Pipeline stage the calling code runs under, or '' outside of one"""
+    return _stage.get()
+
+def join_stage(name: str):
+    """Label this process's records with a stage a parent process is timing"""
+    _stage.set(name)
+
+@contextmanager
+def span(name: str, **labels) -> Iterator[None]:
+    """Time a block into the `name` timing, whether or not it raises"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe(name, time.perf_counter() - start, **labels)
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    Run a block as pipeline stage `name`.
+
+    Statements and spans recorded inside carry the stage, including in
+    asyncio tasks and threads started from asyncio.to_thread.
+    """
+    token = _stage.set(name)
+    start = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except Exception:
+        failed = True
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        registry.observe("stage", seconds, stage=name)
+        registry.record_span(
+            "stage", start - _process_start, seconds,
+            stage=name, status="error" if failed else "ok"
+        )
+        _stage.reset(token)
+
+def write_report(path: Optional[str] = None) -> Optional[str]:
+    """
+    Export metrics to `path` (default Config.METRICS_PATH).
+
+    Paths ending in .prom get the Prometheus text format for the node
+    exporter's textfile collector, anything else a JSON run report. The
+    file is replaced atomically so collectors never read a partial one.
+    """
+    path = path or Config.METRICS_PATH
+    if not path:
+        return None
+
+    if path.endswith(".prom"):
+        content = registry.to_prometheus()
+    else:
+        content = json.dumps(registry.report(), indent=2)
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+    logger.info(f"Wrote run metrics to {path}")
+    return path
+
+def log_summary():
+    """Log where the run's time went, one line per stage"""
+    report = registry.report()
+    for entry in report["trace"]:
+        logger.info(
+            f"Stage {entry['labels']['stage']}: {entry['seconds']:.2f}s "
+            f"({entry['labels']['status']})"
+        )
+    statements = registry.counter_total("db_statements")
+    if statements:
+        logger.info(f"Database statements: {statements:g}")
@@ -0,0 +1,235 @@
+import importlib
+import logging
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from db import session
+import metrics
+
+logger = logging.getLogger(__name__)
+
+DONE = "done"
+SKIPPED = "skipped"
+FAILED = "failed"
+BLOCKED = "blocked"
+
+class LazyCallable:
+    """
+    Function referenced as "module:function", imported on first call.
+
+    Lets the pipeline be declared without importing every stage's
+    dependencies up front.
+    """
+
+    def __init__(self, target: str):
+        self.target = target
+        self._function: Optional[Callable] = None
+
+    def load(self) -> Callable:
+        if self._function is None:
+            module_name, function_name = self.target.split(":")
+            self._function = getattr(importlib.import_module(module_name), function_name)
+        return self._function
+
+    def __call__(self, *args, **kwargs):
+        return self.load()(*args, **kwargs)
+
+    def __repr__(self) -> str:
+        return f"LazyCallable({self.target!r})"
+
+def lazy(target: str) -> LazyCallable:
+    return LazyCallable(target)
+
+@dataclass
+class Stage:
+    """
+    One pipeline step.
+
+    `after` names the stages that must finish first. `fingerprint`
+    summarizes the stage's inputs; when it matches the value stored by
+    the last successful run the stage is skipped. It is stored as taken
+    after the stage finishes, so a stage writing to its own inputs (data
+    cleaning rewriting forecasts, summaries filling in missing cities)
+    does not look changed on the next run. Stages without one always run,
+    and a stage that raises is not recorded, so it runs again.
+    """
+    name: str
+    run: Callable[[], Any]
+    after: Tuple[str, ...] = ()
+    fingerprint: Optional[Callable[[], Optional[str]]] = None
+    description: str = ""
+
+@dataclass
+class StageState:
+    fingerprint: Optional[str]
+    started_at: datetime
+    finished_at: datetime
+
+class PipelineError(Exception):
+    def __init__(self, failed: List[str]):
+        super().__init__(f"Pipeline stages failed: {', '.join(failed)}")
+        self.failed = failed
+
+def create_state_table():
+    with session("create_pipeline_runs_table") as conn, conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS pipeline_runs (
+                stage VARCHAR(50) PRIMARY KEY,
+                input_fingerprint TEXT,
+                started_at TIMESTAMP NOT NULL,
+                finished_at TIMESTAMP NOT NULL
+            );
+        """)
+
+def load_state(stages: Iterable[str]) -> Dict[str, StageState]:
+    """Last successful run of each stage"""
+    with session("load_pipeline_runs") as conn, conn.cursor() as cur:
+        cur.execute("""
+            SELECT stage, input_fingerprint, started_at, finished_at
+            FROM pipeline_runs
+            WHERE stage = ANY(%s);
+        """, (list(stages),))
+        return {row[0]: StageState(*row[1:]) for row in cur.fetchall()}
+
+def database_now() -> datetime:
+    """Server clock, comparable with created_at defaults"""
+    with session("pipeline_clock") as conn, conn.cursor() as cur:
+        cur.execute("SELECT LOCALTIMESTAMP")
+        return cur.fetchone()[0]
+
+def save_state(stage: str, fingerprint: Optional[str], started_at: datetime):
+    with session("save_pipeline_run") as conn, conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO pipeline_runs (stage, input_fingerprint, started_at, finished_at)
+            VALUES (%s, %s, %s, LOCALTIMESTAMP)
+            ON CONFLICT (stage) DO UPDATE SET
+                input_fingerprint = EXCLUDED.input_fingerprint,
+                started_at = EXCLUDED.started_at,
+                finished_at = EXCLUDED.finished_at;
+        """, (stage, fingerprint, started_at))
+
+class Pipeline:
+    """
+    Runs stages as a dependency graph.
+
+    A stage starts as soon as everything it runs after has finished or
+    been skipped, so independent stages run concurrently in worker
+    threads and wall time follows the critical path. A failed stage
+    blocks its dependents but not unrelated branches; failures are
+    raised together once nothing else can run.
+    """
+
+    def __init__(self, stages: List[Stage]):
+        self.stages: Dict[str, Stage] = {}
+        for stage in stages:
+            if stage.name in self.stages:
+                raise ValueError(f"Duplicate stage {stage.name}")
+            self.stages[stage.name] = stage
+        for stage in stages:
+            unknown = set(stage.after) - set(self.stages)
+            if unknown:
+                raise ValueError(f"Stage {stage.name} runs after unknown stages: {', '.join(sorted(unknown))}")
+        self.order = self._topological_order()
+        self.results: Dict[str, Any] = {}
+        self.statuses: Dict[str, str] = {}
+        self.state: Dict[str, StageState] = {}
+
+    def _topological_order(self) -> List[str]:
+        order: List[str] = []
+        visiting = set()
+
+        def visit(name: str):
+            if name in order:
+                return
+            if name in visiting:
+                raise ValueError(f"Stage dependency cycle through {name}")
+            visiting.add(name)
+            for dependency in self.stages[name].after:
+                visit(dependency)
+            visiting.discard(name)
+            order.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return order
+
+    def load(self, name: str):
+        """Import a lazily referenced stage's code without running it"""
+        run = self.stages[name].run
+        if isinstance(run, LazyCallable):
+            run.load()
+
+    def run(
+        self,
+        selected: Optional[Iterable[str]] = None,
+        force: bool = False,
+        max_workers: int = 4
+    ) -> Dict[str, str]:
+        """
+        Run `selected` stages (default: all), returning each one's status.
+
+        Dependencies outside the selection are assumed to be satisfied.
+        With `force`, fingerprints are ignored and every stage runs.
+        """
+        names = [name for name in self.order if selected is None or name in set(selected)]
+        unknown = set(selected or ()) - set(self.stages)
+        if unknown:
+            raise ValueError(f"Unknown stages: {', '.join(sorted(unknown))}")
+
+        create_state_table()
+        self.state = load_state(self.stages)
+        self.results, self.statuses = {}, {}
+        pending = list(names)
+        running: Dict[Future, str] = {}
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="stage") as executor:
+            while pending or running:
+                for name in list(pending):
+                    dependencies = [d for d in self.stages[name].after if d in names]
+                    if any(self.statuses.get(d) in (FAILED, BLOCKED) for d in dependencies):
+                        logger.warning(f"Not running {name}: an upstream stage failed")
+                        self.statuses[name] = BLOCKED
+                        pending.remove(name)
+                    elif all(self.statuses.get(d) in (DONE, SKIPPED) for d in dependencies):
+                        pending.remove(name)
+                        running[executor.submit(self._run_stage, name, force)] = name
+
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        self.statuses[name] = future.result()
+                    except Exception as e:
+                        logger.error(f"Stage {name} failed: {e}")
+                        self.statuses[name] = FAILED
+
+        failed = [name for name in names if self.statuses.get(name) == FAILED]
+        if failed:
+            raise PipelineError(failed)
+        return self.statuses
+
+    def _run_stage(self, name: str, force: bool) -> str:
+        stage = self.stages[name]
+        fingerprint = stage.fingerprint() if stage.fingerprint else None
+        previous = self.state.get(name)
+        if (
+            not force
+            and fingerprint is not None
+            and previous is not None
+            and previous.fingerprint == fingerprint
+        ):
+            logger.info(f"Skipping {name}: inputs unchanged since {previous.finished_at}")
+            metrics.increment("stages_skipped", stage=name)
+            return SKIPPED
+
+        started_at = database_now()
+        logger.info(f"Starting stage {name}")
+        with metrics.stage(name):
+            self.results[name] = stage.run()
+        if stage.fingerprint:
+            fingerprint = stage.fingerprint()
+        save_state(name, fingerprint, started_at)
+        return DONE
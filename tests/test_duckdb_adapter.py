@@ -0,0 +1,59 @@
+import pytest
+from db import DuckDBConnection, _has_returning, duckdb_sql
+
+def test_positional_placeholders_become_question_marks():
+    assert duckdb_sql("SELECT * FROM t WHERE a = %s AND b = %s") == "SELECT * FROM t WHERE a = ? AND b = ?"
+
+def test_named_placeholders_become_dollar_parameters():
+    assert duckdb_sql("UPDATE t SET a = %(value)s WHERE id = %(id)s") == "UPDATE t SET a = $value WHERE id = $id"
+
+def test_escaped_percent_is_unescaped():
+    assert duckdb_sql("SELECT 'a%%b' LIKE %s, 5 %% 3") == "SELECT 'a%b' LIKE ?, 5 % 3"
+    # %%s is a literal "%s", not a placeholder
+    assert duckdb_sql("SELECT '%%s', %s") == "SELECT '%s', ?"
+    assert duckdb_sql("SELECT '%%(name)s'") == "SELECT '%(name)s'"
+
+def test_returning_clause_is_found_in_any_case():
+    assert _has_returning("DELETE FROM t WHERE a < 0 RETURNING id")
+    assert _has_returning("insert into t values (1)\nreturning *;")
+
+@pytest.mark.parametrize("query", [
+    "UPDATE t SET note = 'RETURNING soon' WHERE id = 1",
+    "UPDATE t SET note = 'it''s RETURNING' WHERE id = 1",
+    'UPDATE t SET "returning" = 1',
+    "DELETE FROM t -- RETURNING id\nWHERE a < 0",
+    "DELETE FROM t /* RETURNING\n id */ WHERE a < 0",
+    "INSERT INTO returning_log VALUES (1)",
+    "UPDATE t SET returning_at = now()",
+])
+def test_returning_inside_literals_comments_or_names_is_ignored(query):
+    assert not _has_returning(query)
+
+def test_returning_after_a_literal_is_found():
+    assert _has_returning("UPDATE t SET note = 'x -- y' RETURNING id")
+
+@pytest.fixture
+def conn():
+    duckdb = pytest.importorskip("duckdb")
+    conn = DuckDBConnection(duckdb.connect(":memory:"))
+    with conn.cursor() as cur:
+        cur.execute("CREATE TABLE t (id INTEGER, note VARCHAR)")
+        cur.execute("INSERT INTO t VALUES (1, 'RETURNING'), (2, '50%'), (3, NULL)")
+    conn.commit()
+    yield conn
+    conn.close()
+
+def test_cursor_runs_psycopg2_style_queries(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT id FROM t WHERE note LIKE '%%0%%' OR id = %(id)s ORDER BY id", {"id": 3})
+        assert cur.fetchall() == [(2,), (3,)]
+        cur.execute("SELECT id FROM t WHERE id = %s", (1,))
+        assert cur.fetchone() == (1,)
+
+def test_cursor_rowcount_with_and_without_returning(conn):
+    with conn.cursor() as cur:
+        cur.execute("UPDATE t SET note = 'RETURNING x' WHERE id > %s", (1,))
+        assert cur.rowcount == 2
+        cur.execute("DELETE FROM t WHERE id >= %s RETURNING id", (2,))
+        assert cur.rowcount == 2
+        assert sorted(cur.fetchall()) == [(2,), (3,)]
@@ -0,0 +1,99 @@
+import asyncio
+from email.utils import formatdate
+import httpx
+import pytest
+import metrics
+from L0 import fetch_engine
+from L0.fetch_engine import FetchSession, FetchSettings
+
+URL = "https://api.example.test/v1/forecast"
+NOW = 1_800_000_000.0
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Backoff sleeps recorded instead of waited, with the jitter fixed at 1"""
+    sleeps = []
+
+    async def sleep(seconds: float):
+        sleeps.append(seconds)
+
+    monkeypatch.setattr(fetch_engine.asyncio, "sleep", sleep)
+    monkeypatch.setattr(fetch_engine.random, "uniform", lambda low, high: 1.0)
+    monkeypatch.setattr(fetch_engine.time, "time", lambda: NOW)
+    metrics.registry.reset()
+    return sleeps
+
+def fetch(responses, **settings):
+    """GET through a FetchSession whose server answers with `responses` in turn"""
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        response = responses[min(len(calls), len(responses)) - 1]
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            session = FetchSession(client, FetchSettings(backoff_base=0.5, backoff_max=30.0, **settings))
+            return await session.get(URL, params={"latitude": 48.1})
+
+    return asyncio.run(scenario()), calls
+
+def test_throttled_and_failing_responses_are_retried_with_backoff(sleeps):
+    response, calls = fetch([httpx.Response(429), httpx.Response(502), httpx.Response(200, json={})])
+
+    assert response.status_code == 200
+    assert len(calls) == 3
+    assert sleeps == [0.5, 1.0]
+    assert metrics.registry.counter_total("http_retries", reason="RetryableStatus") == 2
+
+def test_other_errors_are_returned_without_retry(sleeps):
+    response, calls = fetch([httpx.Response(404)])
+    assert response.status_code == 404
+    assert len(calls) == 1
+    assert sleeps == []
+
+def test_retry_after_seconds_replace_the_backoff(sleeps):
+    response, calls = fetch([httpx.Response(503, headers={"Retry-After": "7"}), httpx.Response(200)])
+    assert response.status_code == 200
+    assert sleeps == [7.0]
+
+def test_retry_after_http_date_is_a_delay_from_now(sleeps):
+    date = formatdate(NOW + 12, usegmt=True)
+    response, calls = fetch([httpx.Response(429, headers={"Retry-After": date}), httpx.Response(200)])
+    assert response.status_code == 200
+    assert sleeps == [12.0]
+
+def test_retry_after_is_capped_at_backoff_max(sleeps):
+    fetch([
+        httpx.Response(429, headers={"Retry-After": "3600"}),
+        httpx.Response(429, headers={"Retry-After": formatdate(NOW + 3600, usegmt=True)}),
+        httpx.Response(429, headers={"Retry-After": "soon"}),
+        httpx.Response(200),
+    ])
+    # An unparseable header falls back to the exponential backoff
+    assert sleeps == [30.0, 30.0, 2.0]
+
+def test_last_retryable_response_is_returned_after_max_attempts(sleeps):
+    response, calls = fetch([httpx.Response(500)], max_attempts=3)
+    assert response.status_code == 500
+    assert len(calls) == 3
+    # No sleep after the final attempt
+    assert sleeps == [0.5, 1.0]
+
+def test_transport_errors_are_raised_after_max_attempts(sleeps):
+    with pytest.raises(httpx.ConnectError):
+        fetch([httpx.ConnectError("refused")], max_attempts=2)
+    assert sleeps == [0.5]
+
+def test_single_attempt_never_retries(sleeps):
+    response, calls = fetch([httpx.Response(503), httpx.Response(200)], max_attempts=1)
+    assert response.status_code == 503
+    assert len(calls) == 1
+    assert sleeps == []
+
+def test_max_attempts_must_be_positive():
+    with pytest.raises(ValueError, match="FETCH_MAX_ATTEMPTS"):
+        FetchSettings(max_attempts=0)
@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+import numpy as np
+import pytest
+from L0.models import ForecastBatch, ForecastRecord, ForecastStore, WeatherForecast
+
+START = datetime(2026, 10, 17)
+
+def sample_rows():
+    return [
+        (city, START + timedelta(hours=hour), round(-5.5 + hour * 0.37, 2), round(hour * 0.13, 2), 12.34)
+        for city in ("Munich", "Brno", "Vienna")
+        for hour in range(30)
+    ]
+
+def store_of(rows) -> ForecastStore:
+    store = ForecastStore()
+    for row in rows:
+        store.append(*row)
+    return store
+
+def test_rows_round_trip_exactly():
+    rows = sample_rows()
+    store = store_of(rows)
+
+    assert len(store) == len(rows)
+    assert store.to_rows() == rows
+    assert list(store.iter_rows(chunk_size=7)) == rows
+    assert [record.astuple() for record in store] == rows
+    assert store.cities == ["Munich", "Brno", "Vienna"]
+
+def test_row_ranges_and_indexing():
+    rows = sample_rows()
+    store = store_of(rows)
+
+    assert store.to_rows(10, 25) == rows[10:25]
+    assert store.to_rows(85, 1000) == rows[85:]
+    assert store.to_rows(50, 50) == []
+    assert store[0] == ForecastRecord(*rows[0])
+    assert store[-1] == ForecastRecord(*rows[-1])
+    with pytest.raises(IndexError):
+        store[len(rows)]
+
+def test_columns_are_views_of_the_requested_rows():
+    store = store_of(sample_rows())
+
+    columns = store.columns(30, 60)
+    assert len(columns["time"]) == 30
+    assert columns["time"][0] == np.datetime64(START, "s")
+    assert set(columns["city"].tolist()) == {1}
+    # Zero-copy: the slice still points into the store's buffer
+    assert not columns["temperature"].flags.owndata
+    assert len(store.columns()["city"]) == len(store)
+
+def test_store_costs_24_bytes_per_row():
+    store = store_of(sample_rows())
+    assert store.nbytes == 24 * len(store)
+
+def test_batches_and_forecasts_give_the_same_rows():
+    rows = sample_rows()
+    store = ForecastStore()
+    for city in ("Munich", "Brno", "Vienna"):
+        city_rows = [row for row in rows if row[0] == city]
+        store.extend_batch(ForecastBatch.from_hourly(city, {
+            "time": [row[1].isoformat(timespec="minutes") for row in city_rows],
+            "temperature_2m": [row[2] for row in city_rows],
+            "precipitation": [row[3] for row in city_rows],
+            "windspeed_10m": [row[4] for row in city_rows],
+        }))
+
+    assert store.to_rows() == rows
+    assert ForecastStore.from_forecasts(WeatherForecast(*row) for row in rows).to_rows() == rows
+
+def test_append_applies_the_forecast_checks():
+    store = ForecastStore()
+    store.append("Munich", START, 1.234, 0.0, 5.0)
+    assert store[0].temperature == 1.23
+    with pytest.raises(ValueError):
+        store.append("Munich", START, 20.0, -1.0, 5.0)
+    with pytest.raises(ValueError):
+        store.append("Munich", START, 150.0, 0.0, 5.0)
+    assert len(store) == 1
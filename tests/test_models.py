@@ -0,0 +1,73 @@
+from datetime import datetime
+import numpy as np
+import pytest
+import metrics
+from L0.models import (
+    INVALID_TIMESTAMP, MISSING_VALUE, NEGATIVE_VALUE, OUT_OF_RANGE, ForecastBatch, parse_times
+)
+
+def hourly(rows):
+    time, temperature, precipitation, windspeed = zip(*rows)
+    return {
+        "time": list(time),
+        "temperature_2m": list(temperature),
+        "precipitation": list(precipitation),
+        "windspeed_10m": list(windspeed),
+    }
+
+def test_parse_times_turns_bad_values_into_nat():
+    times = parse_times(["2026-10-17T00:00", "not-a-time", None, "2026-10-17T02:00"])
+    assert list(np.isnat(times)) == [False, True, True, False]
+    assert times[3] == np.datetime64("2026-10-17T02:00")
+
+def test_validate_drops_invalid_rows_with_their_index_and_reason():
+    metrics.registry.reset()
+    batch = ForecastBatch.from_hourly("Munich", hourly([
+        ("2026-10-17T00:00", 10.123, 0.0, 5.0),
+        ("not-a-time", 10.0, 0.0, 5.0),
+        ("2026-10-17T02:00", None, 0.0, 5.0),
+        ("2026-10-17T03:00", 10.0, -0.5, 5.0),
+        ("2026-10-17T04:00", 10.0, 0.0, -1.0),
+        ("2026-10-17T05:00", 150.0, 0.0, 5.0),
+        # Missing wins over out of range, and a bad timestamp over both
+        ("2026-10-17T06:00", 200.0, 0.0, float("nan")),
+        (None, None, -1.0, 5.0),
+        # Rounds to -0.0, which is not negative
+        ("2026-10-17T08:00", -100.0, -0.004, 0.0),
+    ]))
+
+    assert batch.errors == {
+        1: INVALID_TIMESTAMP,
+        2: MISSING_VALUE,
+        3: NEGATIVE_VALUE,
+        4: NEGATIVE_VALUE,
+        5: OUT_OF_RANGE,
+        6: MISSING_VALUE,
+        7: INVALID_TIMESTAMP,
+    }
+    assert batch.to_rows() == [
+        ("Munich", datetime(2026, 10, 17, 0), 10.12, 0.0, 5.0),
+        ("Munich", datetime(2026, 10, 17, 8), -100.0, -0.0, 0.0),
+    ]
+    assert metrics.registry.counter_total("forecast_rows_validated") == 2
+    assert metrics.registry.counter_total("forecast_rows_rejected", reason=NEGATIVE_VALUE) == 2
+    assert metrics.registry.counter_total("forecast_rows_rejected") == 7
+
+def test_validate_keeps_a_clean_batch_whole():
+    batch = ForecastBatch.from_hourly("Brno", hourly([
+        ("2026-10-17T00:00", -100.0, 0.0, 0.0),
+        ("2026-10-17T01:00", 100.0, 12.5, 40.0),
+    ]))
+    assert batch.errors == {}
+    assert len(batch) == 2
+
+def test_validate_rejects_columns_of_different_lengths():
+    batch = ForecastBatch(
+        "Vienna",
+        time=parse_times(["2026-10-17T00:00", "2026-10-17T01:00"]),
+        temperature=np.array([1.0, 2.0]),
+        precipitation=np.array([0.0]),
+        windspeed=np.array([0.0, 0.0]),
+    )
+    with pytest.raises(ValueError, match="precipitation"):
+        batch.validate()
@@ -0,0 +1,102 @@
+import asyncio
+import pytest
+from L1 import rate_limiter
+from L1.rate_limiter import RateLimiter, TokenBucket
+
+class FakeClock:
+    """Stands in for time.monotonic; sleeping advances it instead of waiting"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(rate_limiter.asyncio, "sleep", clock.sleep)
+    return clock
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+def test_bucket_allows_a_minute_of_budget_at_once(clock):
+    async def scenario():
+        bucket = TokenBucket(per_minute=60)
+        for _ in range(60):
+            await bucket.acquire()
+        return bucket
+
+    bucket = run(scenario())
+    assert clock.sleeps == []
+    assert bucket.available == pytest.approx(0)
+
+def test_empty_bucket_waits_for_refill(clock):
+    async def scenario():
+        bucket = TokenBucket(per_minute=60)
+        await bucket.acquire(60)
+        await bucket.acquire(2)
+
+    run(scenario())
+    # One unit per second at 60 per minute
+    assert sum(clock.sleeps) == pytest.approx(2)
+
+def test_refill_is_capped_at_capacity(clock):
+    async def scenario():
+        bucket = TokenBucket(per_minute=30)
+        await bucket.acquire(30)
+        clock.now += 3600
+        bucket._refill()
+        return bucket
+
+    assert run(scenario()).available == pytest.approx(30)
+
+def test_oversized_request_passes_on_full_bucket(clock):
+    async def scenario():
+        bucket = TokenBucket(per_minute=10)
+        await bucket.acquire(1000)
+        return bucket
+
+    bucket = run(scenario())
+    assert clock.sleeps == []
+    assert bucket.available == pytest.approx(0)
+
+def test_limiter_applies_request_and_token_limits(clock):
+    async def scenario():
+        limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=1000)
+        await limiter.acquire(tokens=1000)
+        await limiter.acquire(tokens=500)
+
+    run(scenario())
+    # Requests are plentiful; the second call waits for 500 tokens at 1000 per minute
+    assert sum(clock.sleeps) == pytest.approx(30)
+
+def test_reconcile_refunds_unused_tokens(clock):
+    async def scenario():
+        limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=1000)
+        await limiter.acquire(tokens=800)
+        limiter.reconcile(reserved=800, used=300)
+        await limiter.acquire(tokens=700)
+        return limiter
+
+    limiter = run(scenario())
+    assert clock.sleeps == []
+    assert limiter.tokens.available == pytest.approx(0)
+
+def test_limiter_without_token_limit_ignores_tokens(clock):
+    async def scenario():
+        limiter = RateLimiter(requests_per_minute=60)
+        await limiter.acquire(tokens=10 ** 9)
+        limiter.reconcile(reserved=10 ** 9, used=0)
+        return limiter
+
+    limiter = run(scenario())
+    assert limiter.tokens is None
+    assert clock.sleeps == []
@@ -0,0 +1,63 @@
+import pytest
+from L2.read_api import ForecastReader, Payload, PayloadCache
+
+def payload(city: str, generation: int = 1) -> Payload:
+    return Payload(city, generation, f'{{"city": "{city}"}}'.encode(), f"etag-{city}-{generation}")
+
+def test_cache_evicts_least_recently_used():
+    cache = PayloadCache(max_entries=2)
+    cache.put("Munich", payload("Munich"))
+    cache.put("Brno", payload("Brno"))
+    # Reading Munich leaves Brno as the least recently used
+    assert cache.get("Munich") == payload("Munich")
+    cache.put("Vienna", payload("Vienna"))
+
+    assert len(cache) == 2
+    assert cache.get("Brno") is None
+    assert cache.get("Munich") is not None
+    assert cache.get("Vienna") is not None
+
+def test_cache_put_replaces_entry():
+    cache = PayloadCache(max_entries=2)
+    cache.put("Munich", payload("Munich", 1))
+    cache.put("Munich", payload("Munich", 2))
+    assert len(cache) == 1
+    assert cache.get("Munich").generation == 2
+
+@pytest.fixture
+def reader(monkeypatch):
+    """Reader serving generation 2 of three cities, with a two-entry cache and a fake database"""
+    reader = ForecastReader(max_entries=2, refresh_interval=3600)
+    reader.generation = 2
+    reader.cities = frozenset({"Munich", "Brno", "Vienna"})
+    reader.cache.put("Munich", payload("Munich", 2))
+    reader.loads = []
+
+    def load_one(city):
+        reader.loads.append(city)
+        return payload(city, 2) if city in reader.cities else None
+
+    monkeypatch.setattr(reader, "_load_one", load_one)
+    return reader
+
+def test_reader_serves_cached_cities_from_memory(reader):
+    assert reader.get("Munich") == payload("Munich", 2)
+    assert reader.loads == []
+
+def test_reader_loads_and_caches_known_cities(reader):
+    assert reader.get("Vienna") == payload("Vienna", 2)
+    assert reader.get("Vienna") == payload("Vienna", 2)
+    assert reader.loads == ["Vienna"]
+
+def test_unknown_cities_touch_neither_cache_nor_database(reader):
+    for i in range(10):
+        assert reader.get(f"Atlantis-{i}") is None
+
+    assert reader.loads == []
+    assert len(reader.cache) == 1
+    assert reader.cache.get("Munich") is not None
+
+def test_reader_does_not_cache_payloads_older_than_the_served_generation(reader, monkeypatch):
+    monkeypatch.setattr(reader, "_load_one", lambda city: payload(city, 1))
+    assert reader.get("Brno").generation == 1
+    assert reader.cache.get("Brno") is None
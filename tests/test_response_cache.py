@@ -0,0 +1,113 @@
+import random
+import sqlite3
+import pytest
+from L0 import response_cache
+from L0.response_cache import ResponseCache
+
+class FakeTime:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeTime:
+    clock = FakeTime()
+    monkeypatch.setattr(response_cache.time, "time", clock.time)
+    return clock
+
+@pytest.fixture
+def path(tmp_path) -> str:
+    return str(tmp_path / "responses.sqlite")
+
+def stored_keys(path: str):
+    conn = sqlite3.connect(path)
+    try:
+        return {row[0] for row in conn.execute("SELECT key FROM responses")}
+    finally:
+        conn.close()
+
+def body(seed: int) -> bytes:
+    # Random bytes barely compress, so every body stores about 2000 bytes
+    return random.Random(seed).randbytes(2000)
+
+def test_get_returns_fresh_then_stale_entries(path, clock):
+    cache = ResponseCache(path, ttl=60, max_bytes=10 ** 6)
+    cache.put("a", b'{"hourly": {}}', etag='"v1"', last_modified="Mon")
+    cached = cache.get("a")
+    assert cached.body == b'{"hourly": {}}'
+    assert cached.etag == '"v1"' and cached.last_modified == "Mon"
+    assert cached.fresh
+
+    clock.now += 61
+    assert not cache.get("a").fresh
+    cache.refresh("a")
+    assert cache.get("a").fresh
+    assert cache.get("missing") is None
+    cache.close()
+
+def test_writes_are_buffered_until_flush(path, clock):
+    cache = ResponseCache(path, ttl=60, max_bytes=10 ** 6)
+    cache.put("a", b"one")
+    assert stored_keys(path) == set()
+    cache.flush()
+    assert stored_keys(path) == {"a"}
+    cache.put("b", b"two")
+    cache.close()
+    assert stored_keys(path) == {"a", "b"}
+
+def test_entries_survive_reopening(path, clock):
+    cache = ResponseCache(path, ttl=60, max_bytes=10 ** 6)
+    cache.put("a", b"payload", etag='"v1"')
+    cache.close()
+
+    reopened = ResponseCache(path, ttl=60, max_bytes=10 ** 6)
+    cached = reopened.get("a")
+    assert cached.body == b"payload" and cached.etag == '"v1"'
+    assert reopened.total_bytes > 0
+    reopened.close()
+
+def test_eviction_removes_least_recently_used(path, clock):
+    cache = ResponseCache(path, ttl=60, max_bytes=10 ** 6)
+    for i, key in enumerate("abcd"):
+        clock.now += 1
+        cache.put(key, body(i))
+    cache.flush()
+    size = cache.total_bytes // 4
+
+    # Reading "a" makes "b" the least recently used entry
+    clock.now += 1
+    cache.get("a")
+    # Room for four entries, not five
+    cache.max_bytes = 4 * size + size // 2
+    clock.now += 1
+    cache.put("e", body(4))
+    cache.flush()
+
+    assert stored_keys(path) == {"a", "c", "d", "e"}
+    assert cache.total_bytes <= cache.max_bytes
+    cache.close()
+
+def test_running_total_tracks_replaced_entries(path, clock):
+    cache = ResponseCache(path, ttl=60, max_bytes=10 ** 6)
+    cache.put("a", body(1))
+    cache.flush()
+    first = cache.total_bytes
+    cache.put("a", body(1))
+    cache.put("a", body(1))
+    cache.flush()
+    assert cache.total_bytes == first
+
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT SUM(size) FROM responses").fetchone()[0] == first
+    conn.close()
+    cache.close()
+
+def test_flush_runs_once_pending_bytes_reach_the_threshold(path, clock):
+    cache = ResponseCache(path, ttl=60, max_bytes=10 ** 6, flush_bytes=3000)
+    cache.put("a", body(1))
+    assert stored_keys(path) == set()
+    cache.put("b", body(2))
+    assert stored_keys(path) == {"a", "b"}
+    cache.close()
@@ -0,0 +1,159 @@
+from datetime import datetime, timedelta
+import pytest
+import scheduler
+from scheduler import BLOCKED, DONE, FAILED, SKIPPED, Pipeline, PipelineError, Stage, StageState
+
+@pytest.fixture
+def state(monkeypatch):
+    """pipeline_runs kept in a dict instead of the database"""
+    runs = {}
+    clock = [datetime(2026, 10, 1)]
+
+    def now():
+        clock[0] += timedelta(seconds=1)
+        return clock[0]
+
+    def save_state(stage, fingerprint, started_at):
+        runs[stage] = StageState(fingerprint, started_at, now())
+
+    monkeypatch.setattr(scheduler, "create_state_table", lambda: None)
+    monkeypatch.setattr(
+        scheduler, "load_state", lambda stages: {k: v for k, v in runs.items() if k in set(stages)}
+    )
+    monkeypatch.setattr(scheduler, "save_state", save_state)
+    monkeypatch.setattr(scheduler, "database_now", now)
+    return runs
+
+def recorder(calls, name, result=None, error=None):
+    def run():
+        calls.append(name)
+        if error is not None:
+            raise error
+        return result
+    return run
+
+def test_stages_run_in_dependency_order(state):
+    calls = []
+    pipeline = Pipeline([
+        Stage("report", recorder(calls, "report"), after=("summaries", "rain")),
+        Stage("summaries", recorder(calls, "summaries"), after=("etl",)),
+        Stage("rain", recorder(calls, "rain", result=3), after=("etl",)),
+        Stage("etl", recorder(calls, "etl")),
+    ])
+
+    statuses = pipeline.run()
+
+    assert statuses == {"etl": DONE, "summaries": DONE, "rain": DONE, "report": DONE}
+    assert calls[0] == "etl" and calls[-1] == "report"
+    assert pipeline.results["rain"] == 3
+    assert set(state) == {"etl", "summaries", "rain", "report"}
+
+def test_unchanged_fingerprint_skips_stage(state):
+    calls = []
+    pipeline = Pipeline([Stage("cleaning", recorder(calls, "cleaning"), fingerprint=lambda: "v1")])
+
+    assert pipeline.run() == {"cleaning": DONE}
+    assert pipeline.run() == {"cleaning": SKIPPED}
+    assert calls == ["cleaning"]
+
+def test_changed_fingerprint_or_force_runs_stage(state):
+    calls = []
+    inputs = ["v1"]
+    pipeline = Pipeline([
+        Stage("cleaning", recorder(calls, "cleaning"), fingerprint=lambda: inputs[0])
+    ])
+
+    pipeline.run()
+    inputs[0] = "v2"
+    assert pipeline.run() == {"cleaning": DONE}
+    assert pipeline.run(force=True) == {"cleaning": DONE}
+    assert calls == ["cleaning"] * 3
+
+def test_stage_without_fingerprint_always_runs(state):
+    calls = []
+    pipeline = Pipeline([Stage("etl", recorder(calls, "etl"))])
+
+    pipeline.run()
+    pipeline.run()
+    assert calls == ["etl", "etl"]
+
+def test_fingerprint_is_stored_as_taken_after_the_run(state):
+    # A stage writing to its own inputs must not look changed next time
+    inputs = ["dirty"]
+
+    def clean():
+        inputs[0] = "clean"
+
+    pipeline = Pipeline([Stage("cleaning", clean, fingerprint=lambda: inputs[0])])
+
+    assert pipeline.run() == {"cleaning": DONE}
+    assert state["cleaning"].fingerprint == "clean"
+    assert pipeline.run() == {"cleaning": SKIPPED}
+
+def test_failed_stage_blocks_dependents_but_not_other_branches(state):
+    calls = []
+    pipeline = Pipeline([
+        Stage("etl", recorder(calls, "etl")),
+        Stage("summaries", recorder(calls, "summaries", error=RuntimeError("LLM down")), after=("etl",)),
+        Stage("rain", recorder(calls, "rain"), after=("etl",)),
+        Stage("report", recorder(calls, "report"), after=("summaries", "rain")),
+    ])
+
+    with pytest.raises(PipelineError) as raised:
+        pipeline.run()
+
+    assert raised.value.failed == ["summaries"]
+    assert pipeline.statuses == {"etl": DONE, "summaries": FAILED, "rain": DONE, "report": BLOCKED}
+    assert "report" not in calls
+    # A failed stage is not recorded, so it runs again next time
+    assert "summaries" not in state
+
+def test_failed_stage_reruns_despite_unchanged_fingerprint(state):
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("first attempt fails")
+
+    pipeline = Pipeline([Stage("summaries", flaky, fingerprint=lambda: "v1")])
+
+    with pytest.raises(PipelineError):
+        pipeline.run()
+    assert pipeline.run() == {"summaries": DONE}
+    assert pipeline.run() == {"summaries": SKIPPED}
+    assert len(attempts) == 2
+
+def test_selected_stages_assume_unselected_dependencies_done(state):
+    calls = []
+    pipeline = Pipeline([
+        Stage("etl", recorder(calls, "etl")),
+        Stage("cleaning", recorder(calls, "cleaning"), after=("etl",)),
+    ])
+
+    assert pipeline.run(["cleaning"]) == {"cleaning": DONE}
+    assert calls == ["cleaning"]
+    with pytest.raises(ValueError):
+        pipeline.run(["nonexistent"])
+
+def test_invalid_graphs_are_rejected():
+    noop = lambda: None
+    with pytest.raises(ValueError, match="cycle"):
+        Pipeline([Stage("a", noop, after=("b",)), Stage("b", noop, after=("a",))])
+    with pytest.raises(ValueError, match="unknown"):
+        Pipeline([Stage("a", noop, after=("missing",))])
+    with pytest.raises(ValueError, match="Duplicate"):
+        Pipeline([Stage("a", noop), Stage("a", noop)])
+
+def test_summaries_with_missing_cities_fail_the_stage(state):
+    from L1.weather_summary import check_failures
+
+    check_failures([], 8)
+    pipeline = Pipeline([
+        Stage("summaries", lambda: check_failures(["Munich", "Brno"], 8), fingerprint=lambda: "v1")
+    ])
+
+    with pytest.raises(PipelineError):
+        pipeline.run()
+    assert pipeline.statuses == {"summaries": FAILED}
+    assert "summaries" not in state
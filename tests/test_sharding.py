@@ -0,0 +1,144 @@
+"""
+Multi-process sharded ETL against a fake Open-Meteo server.
+
+Needs a scratch Postgres in DATABASE_URL; skipped otherwise. Workers are
+spawned processes, so lease settings are passed through the environment.
+"""
+import multiprocessing
+import os
+import signal
+import time
+import uuid
+import pytest
+
+pytestmark = pytest.mark.skipif(
+    not os.getenv("DATABASE_URL"), reason="needs a Postgres in DATABASE_URL"
+)
+
+SHARD_SIZE = 2
+
+@pytest.fixture
+def api(monkeypatch):
+    from benchmarks import fakes
+    from config import Config
+
+    # Slow enough that a worker can be killed while it holds a shard
+    with fakes.open_meteo(latency=1.0) as service:
+        url = f"{service.url}/v1/forecast"
+        monkeypatch.setenv("WEATHER_API_URL", url)
+        monkeypatch.setattr(Config, "WEATHER_API_URL", url)
+        monkeypatch.setenv("ETL_LEASE_SECONDS", "1")
+        monkeypatch.setenv("ETL_POLL_INTERVAL", "0.2")
+        monkeypatch.setenv("SHARDED_ETL", "false")
+        monkeypatch.setenv("FORECAST_HISTORY", "true")
+        yield service
+
+@pytest.fixture
+def run(api):
+    """A fresh run key with its shards created, removed again afterwards"""
+    from benchmarks.fakes import synthetic_cities
+    from db import close_pool, session
+    from L0 import sharding
+
+    run_key = f"test-{uuid.uuid4().hex[:12]}"
+    cities = synthetic_cities(6)
+    sharding.create_lease_table()
+    sharding.create_shards(run_key, cities, shard_size=SHARD_SIZE)
+    yield run_key, cities
+    with session("test_cleanup") as conn, conn.cursor() as cur:
+        cur.execute("DELETE FROM etl_shard_leases WHERE run_key = %s", (run_key,))
+    close_pool()
+
+def shards(run_key: str):
+    from db import session
+
+    with session("test_shards") as conn, conn.cursor() as cur:
+        cur.execute("""
+            SELECT shard, status, attempts, rows_written, completed_at, error
+            FROM etl_shard_leases WHERE run_key = %s ORDER BY shard;
+        """, (run_key,))
+        return cur.fetchall()
+
+def run_finished(run_key: str) -> bool:
+    from db import session
+
+    with session("test_runs") as conn, conn.cursor() as cur:
+        cur.execute("SELECT finished_at FROM forecast_runs WHERE run_key = %s", (run_key,))
+        return cur.fetchone()[0] is not None
+
+def kill_worker_holding_a_shard(run_key: str, cities) -> int:
+    """Start one worker, SIGKILL it once it has leased a shard; returns that shard"""
+    from L0 import sharding
+
+    context = multiprocessing.get_context("spawn")
+    victim = context.Process(target=sharding._worker_process, args=(run_key, cities))
+    victim.start()
+    try:
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            leased = [row[0] for row in shards(run_key) if row[1] == sharding.LEASED]
+            if leased:
+                os.kill(victim.pid, signal.SIGKILL)
+                return leased[0]
+            time.sleep(0.05)
+        pytest.fail("Worker never leased a shard")
+    finally:
+        victim.join()
+
+def test_every_shard_completes_exactly_once(run):
+    from L0 import sharding
+    import metrics
+
+    run_key, cities = run
+    metrics.registry.reset()
+    progress = sharding.run_sharded_etl(workers=3, run_key=run_key, cities=cities)
+
+    rows = shards(run_key)
+    assert progress == {sharding.DONE: len(cities) // SHARD_SIZE}
+    assert [row[1] for row in rows] == [sharding.DONE] * len(rows)
+    # One attempt each: no shard was processed or completed twice
+    assert [row[2] for row in rows] == [1] * len(rows)
+    assert all(row[4] is not None for row in rows)
+    assert sum(row[3] for row in rows) > 0
+    assert run_finished(run_key)
+    # Spawned workers' metrics are merged into this process's registry
+    assert metrics.registry.counter_total("forecast_rows_written") == sum(row[3] for row in rows)
+
+def test_expired_lease_is_reclaimed_after_worker_is_killed(run):
+    from L0 import sharding
+
+    run_key, cities = run
+    killed = kill_worker_holding_a_shard(run_key, cities)
+    progress = sharding.run_sharded_etl(workers=2, run_key=run_key, cities=cities)
+
+    rows = {row[0]: row for row in shards(run_key)}
+    assert progress == {sharding.DONE: len(rows)}
+    assert rows[killed][1] == sharding.DONE
+    assert rows[killed][2] == 2
+
+def test_shard_fails_after_max_attempts_and_stays_failed(run, monkeypatch):
+    from L0 import sharding
+
+    run_key, cities = run
+    monkeypatch.setenv("ETL_SHARD_MAX_ATTEMPTS", "1")
+    killed = kill_worker_holding_a_shard(run_key, cities)
+
+    with pytest.raises(RuntimeError, match="incomplete"):
+        sharding.run_sharded_etl(workers=2, run_key=run_key, cities=cities)
+    rows = {row[0]: row for row in shards(run_key)}
+    assert rows[killed][1] == sharding.FAILED
+    assert rows[killed][5] == "Lease expired on the last attempt"
+    assert all(row[1] == sharding.DONE for shard, row in rows.items() if shard != killed)
+
+    # Joining the run again must not undo the give-up
+    with pytest.raises(RuntimeError, match="incomplete"):
+        sharding.run_sharded_etl(workers=1, run_key=run_key, cities=cities)
+    assert shards(run_key)[killed][1] == sharding.FAILED
+    assert not run_finished(run_key)
+
+    # Only an explicit retry does
+    progress = sharding.run_sharded_etl(
+        workers=1, run_key=run_key, cities=cities, retry_failed=True
+    )
+    assert progress == {sharding.DONE: len(rows)}
+    assert run_finished(run_key)